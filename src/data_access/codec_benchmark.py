@@ -0,0 +1,88 @@
+"""对比各 codec 在捕鱼玩家 / 群数据上的序列化、反序列化耗时和存储体积。
+
+    python -m src.data_access.codec_benchmark
+
+不需要连接 Redis，数据按线上典型规模随机生成。+zlib / +zstd 为默认 codec 加上压缩。
+"""
+import random
+import time
+from src.data_access.redis import codecs, default_codec, make_serializer, Compression, zstandard
+
+
+def sample_player():
+    fish_log = {str(fish_id): random.randint(1, 120) for fish_id in random.sample(range(1, 200), 100)}
+    return {
+        "name": "渔者",
+        "level": 87,
+        "exp": 1234,
+        "gold": 56789,
+        "score": 4321,
+        "fish_log": fish_log,
+        "shiny_fish_log": sorted(int(fish_id) for fish_id in random.sample(list(fish_log), 40)),
+        "bag": {str(random.randint(1, 600)): random.randint(1, 99) for _ in range(150)},
+        "buff": [{"key": "power", "power": 5, "expire": time.time() + 3600} for _ in range(3)],
+        "equipment": {"rod": 101, "bait": 202, "accessory": 1000123},
+        "last_gift_time": time.time(),
+        "master_ball_crafts": 2,
+        "accessory_meta": {
+            str(1000000 + i): {"skills": [{"id": random.randint(1, 40), "level": random.randint(1, 5)} for _ in range(3)], "base_id": 301}
+            for i in range(30)
+        },
+        "talent_exp": {str(i): random.randint(0, 5000) for i in range(12)},
+        "skill29_power_state": {"value": 0, "expire_at": 0},
+        "updated_at": int(time.time()),
+    }
+
+
+def sample_group():
+    return {
+        "fish_log": {str(fish_id): random.randint(50, 300) for fish_id in range(1, 200)},
+        "buff": [],
+        "avgp_buff": [{"key": "glow_stick_normal", "expire": time.time() + 600}],
+        "day": 18,
+        "feed_time": 3,
+        "fever_expire": 0,
+        "fever_fishes": [random.randint(1, 200) for _ in range(20)],
+        "pot_consume_time": time.time(),
+        "big_pot": {"level": 3, "current": 420},
+        "fish_factory": {"level": 2},
+        "building_center": {"level": 4},
+        "fish_lab": {"level": 1},
+        "ice_hole": {"level": 1},
+        "mystic_shop": {"level": 1},
+        "seven_statue": {"level": 1},
+        "forge_shop": {"level": 2},
+        "port": {"level": 1},
+        "sign_in_record": {str(random.randint(10000, 99999999)): "2026-10-18" for _ in range(300)},
+        "updated_at": int(time.time()),
+    }
+
+
+def measure(func, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def main(rounds=200):
+    random.seed(0)
+    samples = {"player": sample_player(), "group": sample_group()}
+    print(f"{'data':<8}{'codec':<10}{'save ms':>10}{'load ms':>10}{'bytes':>10}")
+    for name, obj in samples.items():
+        for codec in codecs.values():
+            payload = codec.dumps(obj)
+            size = len(payload.encode() if isinstance(payload, str) else payload)
+            save = measure(lambda: codec.dumps(obj), rounds)
+            load = measure(lambda: codec.loads(payload), rounds)
+            print(f"{name:<8}{codec.name:<10}{save:>10.3f}{load:>10.3f}{size:>10}")
+        for algorithm in ['zlib'] + (['zstd'] if zstandard is not None else []):
+            dumps = make_serializer(default_codec, Compression(threshold=0, algorithm=algorithm))
+            payload = dumps(obj)
+            save = measure(lambda: dumps(obj), rounds)
+            load = measure(lambda: default_codec.loads(payload), rounds)
+            print(f"{name:<8}{'+' + algorithm:<10}{save:>10.3f}{load:>10.3f}{len(payload):>10}")
+
+
+if __name__ == '__main__':
+    main()
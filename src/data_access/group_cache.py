@@ -0,0 +1,92 @@
+import asyncio
+from nonebot import logger
+
+
+class GroupCache:
+    """bot 所在的群和群成员的进程内缓存。
+
+    第一次用到某个群时调用一次 API 加载，之后由群成员增减、管理员变动、群名片变动等通知事件增量更新；
+    reconcile 定期全量核对一次，修正断线期间错过的事件。
+    """
+    def __init__(self):
+        self.groups: set[int] | None = None
+        # group_id -> {user_id: 成员信息}；入群事件只知道 user_id，信息为 None，用到时再单独获取
+        self.members: dict[int, dict[int, dict | None]] = {}
+
+    async def group_ids(self, bot) -> set[int]:
+        if self.groups is None:
+            group_list = await bot.get_group_list()
+            self.groups = {int(group['group_id']) for group in group_list}
+        return self.groups
+
+    async def _load_members(self, bot, group_id: int) -> dict:
+        member_list = await bot.get_group_member_list(group_id=group_id)
+        members = {int(member['user_id']): member for member in member_list if member.get('user_id') is not None}
+        self.members[group_id] = members
+        return members
+
+    async def member_ids(self, bot, group_id: int) -> list[int]:
+        group_id = int(group_id)
+        members = self.members.get(group_id)
+        if members is None:
+            members = await self._load_members(bot, group_id)
+        return list(members)
+
+    async def member_info(self, bot, group_id: int, user_id: int) -> dict:
+        group_id, user_id = int(group_id), int(user_id)
+        members = self.members.get(group_id)
+        info = members.get(user_id) if members is not None else None
+        if info is None:
+            info = await bot.get_group_member_info(group_id=group_id, user_id=user_id)
+            # 只补全已加载的群，未加载的群等整体加载时再缓存
+            if members is not None:
+                members[user_id] = info
+        return info
+
+    def handle_notice(self, self_id: int, event):
+        """按 OneBot 通知事件更新缓存，不相关的事件直接忽略"""
+        notice_type = getattr(event, 'notice_type', None)
+        group_id = getattr(event, 'group_id', None)
+        user_id = getattr(event, 'user_id', None)
+        if group_id is None or user_id is None:
+            return
+        group_id, user_id = int(group_id), int(user_id)
+        if notice_type == 'group_increase':
+            if user_id == self_id:
+                if self.groups is not None:
+                    self.groups.add(group_id)
+            elif group_id in self.members:
+                self.members[group_id].setdefault(user_id, None)
+        elif notice_type == 'group_decrease':
+            if user_id == self_id:
+                if self.groups is not None:
+                    self.groups.discard(group_id)
+                self.members.pop(group_id, None)
+            elif group_id in self.members:
+                self.members[group_id].pop(user_id, None)
+        elif notice_type == 'group_admin':
+            info = self.members.get(group_id, {}).get(user_id)
+            if info is not None:
+                info['role'] = 'admin' if getattr(event, 'sub_type', None) == 'set' else 'member'
+        elif notice_type == 'group_card':
+            info = self.members.get(group_id, {}).get(user_id)
+            if info is not None:
+                info['card'] = getattr(event, 'card_new', '') or ''
+
+    async def reconcile(self, bot):
+        """重新加载群列表和已缓存的群成员"""
+        group_list = await bot.get_group_list()
+        self.groups = {int(group['group_id']) for group in group_list}
+        for group_id in list(self.members):
+            if group_id not in self.groups:
+                self.members.pop(group_id, None)
+                continue
+            try:
+                await self._load_members(bot, group_id)
+            except Exception as exc:
+                logger.warning("Failed to reload member list for group %s: %s", group_id, exc)
+            # 逐个群慢慢刷新，不集中占用 API
+            await asyncio.sleep(1)
+
+
+group_cache = GroupCache()
@@ -0,0 +1,49 @@
+import asyncio
+import uuid
+from src.data_access.redis import redis_global, register_script
+
+
+def _release_local(client, keys, args):
+    if client.get(keys[0]) != args[0]:
+        return 0
+    return client.delete(keys[0])
+
+
+# 只删除自己持有的租约，过期后被别人拿到的不受影响
+_release_script = register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+""", _release_local)
+
+
+class Lease:
+    """基于 Redis 的租约：SET NX PX 获取，到期自动释放，持有者崩溃也不会一直占着。
+
+    用于让多个进程轮流处理同一个对象；同一进程内的多个协程之间同样互斥，不可重入。
+    """
+    def __init__(self, name: str, ttl_ms: int = 30000):
+        self.key = f'lease:{name}'
+        self.ttl_ms = ttl_ms
+        self.token = uuid.uuid4().hex
+        self.held = False
+
+    def acquire(self) -> bool:
+        self.held = bool(redis_global.set(self.key, self.token, px=self.ttl_ms, nx=True))
+        return self.held
+
+    async def acquire_wait(self, timeout: float, interval: float = 0.05) -> bool:
+        """在 timeout 秒内反复尝试获取"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not self.acquire():
+            if loop.time() >= deadline:
+                return False
+            await asyncio.sleep(interval)
+        return True
+
+    def release(self):
+        if self.held:
+            _release_script(keys=[self.key], args=[self.token])
+            self.held = False
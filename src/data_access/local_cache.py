@@ -0,0 +1,88 @@
+import asyncio
+from nonebot import logger
+from src.data_access.redis import redis_global, redis_async
+
+
+class LocalCache:
+    """进程内缓存：按 Redis key 缓存加载好的对象，写入方通过 pub/sub 频道通知所有进程失效。
+
+    只有订阅连接正常时才会缓存，订阅断开期间每次都直接读取 Redis，避免错过失效通知读到旧值。
+    缓存的对象是共享的，读取方不要修改，修改后需要保存并调用 invalidate。
+    """
+    channel = 'chiyuki_cache_invalidate'
+
+    def __init__(self):
+        self.values = {}
+        self.active = False
+        # 每次失效都加一，加载期间发生过失效的结果不写入缓存
+        self.generation = 0
+        self.task = None
+
+    def get(self, key, factory):
+        if key in self.values:
+            return self.values[key]
+        generation = self.generation
+        value = factory()
+        if self.active and generation == self.generation:
+            self.values[key] = value
+        return value
+
+    async def get_async(self, key, factory):
+        if key in self.values:
+            return self.values[key]
+        generation = self.generation
+        value = await factory()
+        if self.active and generation == self.generation:
+            self.values[key] = value
+        return value
+
+    def drop(self, key):
+        self.generation += 1
+        self.values.pop(key, None)
+
+    def clear(self):
+        self.generation += 1
+        self.values.clear()
+
+    def invalidate(self, key):
+        """写入 key 之后调用，通知包括自己在内的所有进程"""
+        self.drop(key)
+        redis_global.publish(self.channel, key)
+
+    async def listen(self):
+        while True:
+            pubsub = redis_async.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    if message['type'] == 'subscribe':
+                        # 订阅前的通知都收不到了，从空缓存开始
+                        self.clear()
+                        self.active = True
+                    elif message['type'] == 'message':
+                        self.drop(message['data'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"缓存失效订阅断开：{e}")
+            finally:
+                self.active = False
+                self.clear()
+                await pubsub.reset()
+            await asyncio.sleep(1)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.listen())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+local_cache = LocalCache()
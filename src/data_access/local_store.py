@@ -0,0 +1,512 @@
+"""内嵌存储：用 SQLite（WAL 模式）模拟本项目用到的那部分 redis-py 客户端接口。
+
+单机部署不需要 Redis 服务，压测和基准测试也可以在本地独立运行。支持：
+
+- string：get / set（ex、px、nx、xx）/ setex / mget / delete / exists / type
+- hash：hget / hgetall / hmget / hset / hdel
+- set：sadd / srem / smembers
+- sorted set：zadd / zrem / zscore / zrangebyscore / zremrangebyscore
+- scan_iter（match、count、_type）、pipeline、进程内 publish / pubsub
+- register_script：无法执行 Lua，需要同时提供等价的 Python 实现，在一个事务里执行
+
+类型不匹配时和 Redis 一样抛出 redis.ResponseError（WRONGTYPE）。
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import redis
+
+WRONGTYPE = 'WRONGTYPE Operation against a key holding the wrong kind of value'
+
+
+def _encode(value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode()
+    if isinstance(value, float):
+        return repr(value).encode()
+    return str(value).encode()
+
+
+def _key(name) -> str:
+    return name.decode() if isinstance(name, bytes) else str(name)
+
+
+def _glob(pattern: str) -> str:
+    """Redis 的 glob 转成 SQLite GLOB，主要是把反斜杠转义改成字符类"""
+    result = []
+    escaped = False
+    for c in pattern:
+        if escaped:
+            result.append(f'[{c}]')
+            escaped = False
+        elif c == '\\':
+            escaped = True
+        else:
+            result.append(c)
+    return ''.join(result)
+
+
+class LocalStore:
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, type TEXT NOT NULL, value BLOB, expire_at INTEGER);
+            CREATE TABLE IF NOT EXISTS hash_fields (key TEXT, field TEXT, value BLOB, PRIMARY KEY (key, field));
+            CREATE TABLE IF NOT EXISTS set_members (key TEXT, member BLOB, PRIMARY KEY (key, member));
+            CREATE TABLE IF NOT EXISTS zset_members (key TEXT, member BLOB, score REAL, PRIMARY KEY (key, member));
+            CREATE INDEX IF NOT EXISTS zset_score ON zset_members (key, score);
+        """)
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.subscribers = defaultdict(set)
+
+    @contextmanager
+    def transaction(self):
+        """可重入：只有最外层提交，pipeline 和脚本里的所有命令在同一个事务中"""
+        with self.lock:
+            if self.depth == 0:
+                self.conn.execute('BEGIN IMMEDIATE')
+            self.depth += 1
+            try:
+                yield self.conn
+            except BaseException:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.conn.execute('ROLLBACK')
+                raise
+            self.depth -= 1
+            if self.depth == 0:
+                self.conn.execute('COMMIT')
+
+    def client(self, decode_responses=False):
+        return LocalClient(self, decode_responses)
+
+    def async_client(self, decode_responses=True):
+        return AsyncLocalClient(self.client(decode_responses))
+
+    def publish(self, channel, message):
+        channel = _key(channel)
+        for pubsub in list(self.subscribers[channel]):
+            pubsub.deliver({'type': 'message', 'pattern': None, 'channel': channel, 'data': message})
+        return len(self.subscribers[channel])
+
+
+class LocalClient:
+    embedded = True
+
+    def __init__(self, store: LocalStore, decode_responses=False):
+        self.store = store
+        self.decode_responses = decode_responses
+
+    def _out(self, value):
+        if self.decode_responses and isinstance(value, bytes):
+            return value.decode()
+        return value
+
+    def _out_key(self, key: str):
+        return key if self.decode_responses else key.encode()
+
+    def _type(self, conn, key):
+        row = conn.execute('SELECT type, expire_at FROM kv WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] <= time.time() * 1000:
+            self._drop(conn, key)
+            return None
+        return row[0]
+
+    def _check(self, conn, key, expected):
+        t = self._type(conn, key)
+        if t is not None and t != expected:
+            raise redis.ResponseError(WRONGTYPE)
+        return t
+
+    def _drop(self, conn, key):
+        conn.execute('DELETE FROM kv WHERE key = ?', (key,))
+        conn.execute('DELETE FROM hash_fields WHERE key = ?', (key,))
+        conn.execute('DELETE FROM set_members WHERE key = ?', (key,))
+        conn.execute('DELETE FROM zset_members WHERE key = ?', (key,))
+
+    def _create(self, conn, key, t):
+        conn.execute('INSERT INTO kv (key, type) VALUES (?, ?)', (key, t))
+
+    # ---------------- keys ----------------
+    def type(self, name):
+        with self.store.transaction() as conn:
+            return self._out_key(self._type(conn, _key(name)) or 'none')
+
+    def exists(self, *names):
+        with self.store.transaction() as conn:
+            return sum(1 for name in names if self._type(conn, _key(name)) is not None)
+
+    def delete(self, *names):
+        with self.store.transaction() as conn:
+            count = 0
+            for name in names:
+                key = _key(name)
+                if self._type(conn, key) is not None:
+                    self._drop(conn, key)
+                    count += 1
+            return count
+
+    def pexpire(self, name, milliseconds):
+        with self.store.transaction() as conn:
+            key = _key(name)
+            if self._type(conn, key) is None:
+                return False
+            conn.execute('UPDATE kv SET expire_at = ? WHERE key = ?', (int(time.time() * 1000 + int(milliseconds)), key))
+            return True
+
+    def expire(self, name, seconds):
+        return self.pexpire(name, int(seconds) * 1000)
+
+    def scan_iter(self, match=None, count=None, _type=None):
+        pattern = _glob(match) if match else '*'
+        page = count or 100
+        last = ''
+        while True:
+            with self.store.transaction() as conn:
+                sql = 'SELECT key, type, expire_at FROM kv WHERE key > ? AND key GLOB ?'
+                params = [last, pattern]
+                if _type is not None:
+                    sql += ' AND type = ?'
+                    params.append(_key(_type))
+                rows = conn.execute(sql + ' ORDER BY key LIMIT ?', (*params, page)).fetchall()
+            if not rows:
+                return
+            now = time.time() * 1000
+            for key, t, expire_at in rows:
+                if expire_at is None or expire_at > now:
+                    yield self._out_key(key)
+            last = rows[-1][0]
+
+    # ---------------- string ----------------
+    def get(self, name):
+        with self.store.transaction() as conn:
+            key = _key(name)
+            if self._check(conn, key, 'string') is None:
+                return None
+            return self._out(conn.execute('SELECT value FROM kv WHERE key = ?', (key,)).fetchone()[0])
+
+    def mget(self, keys, *args):
+        keys = list(keys) + list(args) if not isinstance(keys, (str, bytes)) else [keys, *args]
+        with self.store.transaction() as conn:
+            result = []
+            for name in keys:
+                key = _key(name)
+                if self._type(conn, key) != 'string':
+                    result.append(None)
+                    continue
+                result.append(self._out(conn.execute('SELECT value FROM kv WHERE key = ?', (key,)).fetchone()[0]))
+            return result
+
+    def set(self, name, value, ex=None, px=None, nx=False, xx=False):
+        with self.store.transaction() as conn:
+            key = _key(name)
+            exists = self._type(conn, key) is not None
+            if (nx and exists) or (xx and not exists):
+                return None
+            expire_at = None
+            if ex is not None:
+                expire_at = int(time.time() * 1000 + int(ex) * 1000)
+            elif px is not None:
+                expire_at = int(time.time() * 1000 + int(px))
+            self._drop(conn, key)
+            conn.execute('INSERT INTO kv (key, type, value, expire_at) VALUES (?, ?, ?, ?)',
+                         (key, 'string', _encode(value), expire_at))
+            return True
+
+    def setex(self, name, seconds, value):
+        return self.set(name, value, ex=seconds)
+
+    # ---------------- hash ----------------
+    def hget(self, name, key):
+        with self.store.transaction() as conn:
+            row = None
+            if self._check(conn, _key(name), 'hash') is not None:
+                row = conn.execute('SELECT value FROM hash_fields WHERE key = ? AND field = ?',
+                                   (_key(name), _key(key))).fetchone()
+            return self._out(row[0]) if row else None
+
+    def hgetall(self, name):
+        with self.store.transaction() as conn:
+            key = _key(name)
+            if self._check(conn, key, 'hash') is None:
+                return {}
+            rows = conn.execute('SELECT field, value FROM hash_fields WHERE key = ?', (key,)).fetchall()
+            return {self._out_key(field): self._out(value) for field, value in rows}
+
+    def hmget(self, name, keys, *args):
+        fields = [keys, *args] if isinstance(keys, (str, bytes)) else list(keys) + list(args)
+        with self.store.transaction() as conn:
+            key = _key(name)
+            if self._check(conn, key, 'hash') is None:
+                return [None] * len(fields)
+            result = []
+            for field in fields:
+                row = conn.execute('SELECT value FROM hash_fields WHERE key = ? AND field = ?',
+                                   (key, _key(field))).fetchone()
+                result.append(self._out(row[0]) if row else None)
+            return result
+
+    def hset(self, name, key=None, value=None, mapping=None, items=None):
+        pairs = []
+        if key is not None:
+            pairs.append((key, value))
+        if mapping:
+            pairs.extend(mapping.items())
+        if items:
+            pairs.extend(zip(items[::2], items[1::2]))
+        with self.store.transaction() as conn:
+            k = _key(name)
+            if self._check(conn, k, 'hash') is None:
+                self._create(conn, k, 'hash')
+            added = 0
+            for field, v in pairs:
+                field = _key(field)
+                if conn.execute('SELECT 1 FROM hash_fields WHERE key = ? AND field = ?', (k, field)).fetchone() is None:
+                    added += 1
+                conn.execute('INSERT OR REPLACE INTO hash_fields (key, field, value) VALUES (?, ?, ?)',
+                             (k, field, _encode(v)))
+            return added
+
+    def hdel(self, name, *keys):
+        with self.store.transaction() as conn:
+            k = _key(name)
+            if self._check(conn, k, 'hash') is None:
+                return 0
+            count = 0
+            for field in keys:
+                count += conn.execute('DELETE FROM hash_fields WHERE key = ? AND field = ?', (k, _key(field))).rowcount
+            if conn.execute('SELECT 1 FROM hash_fields WHERE key = ? LIMIT 1', (k,)).fetchone() is None:
+                self._drop(conn, k)
+            return count
+
+    # ---------------- set ----------------
+    def sadd(self, name, *values):
+        with self.store.transaction() as conn:
+            k = _key(name)
+            if self._check(conn, k, 'set') is None:
+                self._create(conn, k, 'set')
+            return sum(conn.execute('INSERT OR IGNORE INTO set_members (key, member) VALUES (?, ?)',
+                                    (k, _encode(v))).rowcount for v in values)
+
+    def srem(self, name, *values):
+        with self.store.transaction() as conn:
+            k = _key(name)
+            if self._check(conn, k, 'set') is None:
+                return 0
+            count = sum(conn.execute('DELETE FROM set_members WHERE key = ? AND member = ?',
+                                     (k, _encode(v))).rowcount for v in values)
+            if conn.execute('SELECT 1 FROM set_members WHERE key = ? LIMIT 1', (k,)).fetchone() is None:
+                self._drop(conn, k)
+            return count
+
+    def smembers(self, name):
+        with self.store.transaction() as conn:
+            k = _key(name)
+            if self._check(conn, k, 'set') is None:
+                return set()
+            return {self._out(row[0]) for row in conn.execute('SELECT member FROM set_members WHERE key = ?', (k,))}
+
+    # ---------------- sorted set ----------------
+    @staticmethod
+    def _score_range(min, max):
+        """只支持闭区间和 -inf / +inf"""
+        def parse(value):
+            return float(value.decode() if isinstance(value, bytes) else value)
+        return parse(min), parse(max)
+
+    def zadd(self, name, mapping):
+        with self.store.transaction() as conn:
+            k = _key(name)
+            if self._check(conn, k, 'zset') is None:
+                self._create(conn, k, 'zset')
+            added = 0
+            for member, score in mapping.items():
+                member = _encode(member)
+                if conn.execute('SELECT 1 FROM zset_members WHERE key = ? AND member = ?', (k, member)).fetchone() is None:
+                    added += 1
+                conn.execute('INSERT OR REPLACE INTO zset_members (key, member, score) VALUES (?, ?, ?)',
+                             (k, member, float(score)))
+            return added
+
+    def zrem(self, name, *values):
+        with self.store.transaction() as conn:
+            k = _key(name)
+            if self._check(conn, k, 'zset') is None:
+                return 0
+            count = sum(conn.execute('DELETE FROM zset_members WHERE key = ? AND member = ?',
+                                     (k, _encode(v))).rowcount for v in values)
+            if conn.execute('SELECT 1 FROM zset_members WHERE key = ? LIMIT 1', (k,)).fetchone() is None:
+                self._drop(conn, k)
+            return count
+
+    def zscore(self, name, value):
+        with self.store.transaction() as conn:
+            k = _key(name)
+            if self._check(conn, k, 'zset') is None:
+                return None
+            row = conn.execute('SELECT score FROM zset_members WHERE key = ? AND member = ?', (k, _encode(value))).fetchone()
+            return row[0] if row else None
+
+    def zmscore(self, name, members):
+        with self.store.transaction() as conn:
+            k = _key(name)
+            if self._check(conn, k, 'zset') is None:
+                return [None] * len(members)
+            result = []
+            for member in members:
+                row = conn.execute('SELECT score FROM zset_members WHERE key = ? AND member = ?',
+                                   (k, _encode(member))).fetchone()
+                result.append(row[0] if row else None)
+            return result
+
+    def zrangebyscore(self, name, min, max):
+        with self.store.transaction() as conn:
+            k = _key(name)
+            if self._check(conn, k, 'zset') is None:
+                return []
+            low, high = self._score_range(min, max)
+            rows = conn.execute('SELECT member FROM zset_members WHERE key = ? AND score >= ? AND score <= ? '
+                                'ORDER BY score, member', (k, low, high))
+            return [self._out(row[0]) for row in rows]
+
+    def zremrangebyscore(self, name, min, max):
+        with self.store.transaction() as conn:
+            k = _key(name)
+            if self._check(conn, k, 'zset') is None:
+                return 0
+            low, high = self._score_range(min, max)
+            count = conn.execute('DELETE FROM zset_members WHERE key = ? AND score >= ? AND score <= ?',
+                                 (k, low, high)).rowcount
+            if conn.execute('SELECT 1 FROM zset_members WHERE key = ? LIMIT 1', (k,)).fetchone() is None:
+                self._drop(conn, k)
+            return count
+
+    # ---------------- misc ----------------
+    def publish(self, channel, message):
+        return self.store.publish(channel, self._out(_encode(message)))
+
+    def pipeline(self, transaction=True):
+        return LocalPipeline(self)
+
+    def register_script(self, script, local=None):
+        return LocalScript(self, local)
+
+
+class LocalPipeline:
+    """命令先排队，execute 时在一个 SQLite 事务里依次执行"""
+    def __init__(self, client: LocalClient):
+        self.client = client
+        self.commands = []
+
+    def __len__(self):
+        return len(self.commands)
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        def queue(*args, **kwargs):
+            self.commands.append((method, args, kwargs))
+            return self
+        return queue
+
+    def execute(self, raise_on_error=True):
+        commands, self.commands = self.commands, []
+        results = []
+        with self.client.store.transaction():
+            for method, args, kwargs in commands:
+                try:
+                    results.append(method(*args, **kwargs))
+                except redis.ResponseError as e:
+                    results.append(e)
+        if raise_on_error:
+            for result in results:
+                if isinstance(result, redis.ResponseError):
+                    raise result
+        return results
+
+
+class LocalScript:
+    """register_script 的替代：local(client, keys, args) 是和 Lua 脚本等价的 Python 实现。
+
+    和 Redis 一样，脚本收到的参数都是字节串，返回值按客户端的 decode_responses 解码。
+    """
+    def __init__(self, client: LocalClient, local):
+        self.client = client
+        self.local = local
+
+    def __call__(self, keys=[], args=[], client=None):
+        if isinstance(client, LocalPipeline):
+            client.commands.append((self.run, (keys, args), {}))
+            return client
+        return self.run(keys, args)
+
+    def run(self, keys, args):
+        if self.local is None:
+            raise NotImplementedError("embedded storage cannot run Lua scripts without a local implementation")
+        raw = self.client.store.client(decode_responses=False)
+        with self.client.store.transaction():
+            return self._decode(self.local(raw, [_key(k) for k in keys], [_encode(a) for a in args]))
+
+    def _decode(self, value):
+        if isinstance(value, list):
+            return [self._decode(v) for v in value]
+        return self.client._out(value)
+
+
+class LocalPubSub:
+    def __init__(self, store: LocalStore):
+        self.store = store
+        self.channels = set()
+        self.queue = asyncio.Queue()
+        self.loop = None
+
+    def deliver(self, message):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, message)
+
+    async def subscribe(self, *channels):
+        self.loop = asyncio.get_running_loop()
+        for channel in channels:
+            channel = _key(channel)
+            self.channels.add(channel)
+            self.store.subscribers[channel].add(self)
+            self.queue.put_nowait({'type': 'subscribe', 'pattern': None, 'channel': channel, 'data': len(self.channels)})
+
+    async def listen(self):
+        while self.channels:
+            yield await self.queue.get()
+
+    async def reset(self):
+        for channel in self.channels:
+            self.store.subscribers[channel].discard(self)
+        self.channels.clear()
+
+
+class AsyncLocalClient:
+    """协程版接口：SQLite 本地读写很快，直接在事件循环里同步执行"""
+    def __init__(self, client: LocalClient):
+        self.client = client
+        self.connection_pool = self
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+    def pubsub(self):
+        return LocalPubSub(self.client.store)
+
+    async def disconnect(self):
+        pass
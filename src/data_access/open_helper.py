@@ -7,7 +7,8 @@ from nonebot.params import Depends
 from nonebot.adapters.qq import GroupAtMessageCreateEvent as QQGroupEvent
 from nonebot.adapters.onebot.v11 import GroupMessageEvent as OneBotGroupEvent
 
-from src.data_access.redis import DictRedisData
+from src.data_access.redis import AsyncDictRedisData
+from src.data_access.local_cache import local_cache
 
 # --- 1. 定义一个数据模型，用来给 Handler 传参 ---
 @dataclass
@@ -19,11 +20,17 @@ class RealContext:
 
 # --- 2. 模拟你的本地映射表 (实际使用时换成数据库查询) ---
 
-def db_get_real_group(openid: str) -> Optional[int]:
-    return DictRedisData("open_helper_group_map").data.get(openid)
+async def load_map(key: str) -> dict:
+    # 整张映射表缓存在进程内，绑定命令写入后会通知失效
+    async def load():
+        return (await AsyncDictRedisData(key).load()).data
+    return await local_cache.get_async(key, load)
 
-def db_get_real_user(openid: str) -> Optional[int]:
-    return DictRedisData("open_helper_user_map").data.get(openid)
+async def db_get_real_group(openid: str) -> Optional[int]:
+    return (await load_map("open_helper_group_map")).get(openid)
+
+async def db_get_real_user(openid: str) -> Optional[int]:
+    return (await load_map("open_helper_user_map")).get(openid)
 
 async def get_real_context(bot: Bot, event: Event, matcher: Matcher) -> RealContext:
     """
@@ -57,10 +64,10 @@ async def get_real_context(bot: Bot, event: Event, matcher: Matcher) -> RealCont
             logger.error("【严重】检测到来自官方Bot的事件没有 group_openid，忽略处理。")
             await matcher.finish() # 直接结束
             
-        real_group_id = db_get_real_group(group_openid)
+        real_group_id = await db_get_real_group(group_openid)
 
         # --- 逻辑 2: 检查用户映射 ---
-        real_user_id = db_get_real_user(user_openid)
+        real_user_id = await db_get_real_user(user_openid)
         
         if not real_user_id:
             # 【需求实现】如果是用户的表没找到，则 finish 一条指令给用户
@@ -0,0 +1,184 @@
+import asyncio
+import time
+from typing import Awaitable, Callable
+from nonebot import logger
+from src.data_access.redis import ListRedisData
+
+
+class TokenBucket:
+    """令牌桶：最多积攒 capacity 个令牌，每秒补充 rate 个"""
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """还需要等多久才有令牌，0 表示现在就有"""
+        self._refill()
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+
+class Outbox:
+    """群消息发送队列：每个群一条通道，调用方入队后立即返回，由后台协程发送。
+
+    - 同一个群在 merge_window 秒内入队的文本合并成一条发送
+    - 每个群和全局各有一个令牌桶限速，一个群被限速或发送缓慢不影响其他群
+    - 发送失败时按 1、2、4… 秒退避重试，超过 max_retries 次后丢弃并记录日志
+    - 退出时 close 在限定时间内发完剩余消息，发不完的保存到 pending_key，下次启动后由 restore 重新入队
+    """
+    # 单群每 3 秒一条、最多连发 3 条；全局每秒 2 条、最多连发 10 条
+    group_rate, group_burst = 1 / 3, 3
+    global_rate, global_burst = 2, 10
+    merge_window = 1.0
+    max_length = 3000
+    max_retries = 3
+    idle_timeout = 60
+    # 保存的消息超过这个时间（秒）后不再补发，内容多半已经过时
+    pending_ttl = 600
+
+    def __init__(self, sender: Callable[[int, str], Awaitable], pending_key: str = None):
+        self.sender = sender
+        self.pending_key = pending_key
+        self.lanes: dict[int, asyncio.Queue] = {}
+        self.tasks: dict[int, asyncio.Task] = {}
+        # 已经从队列取出、还没有发出的文本
+        self.inflight: dict[int, list[str]] = {}
+        self.buckets: dict[int, TokenBucket] = {}
+        self.global_bucket = TokenBucket(self.global_rate, self.global_burst)
+        self.closing = False
+
+    def send(self, group_id: int, text: str):
+        """入队后立即返回，需要在事件循环中调用"""
+        group_id = int(group_id)
+        if self.closing:
+            # 正在退出，不再启动新的发送，直接保存
+            self._save_pending([(group_id, text)])
+            return
+        lane = self.lanes.get(group_id)
+        if lane is None:
+            lane = asyncio.Queue()
+            self.lanes[group_id] = lane
+            self.tasks[group_id] = asyncio.get_running_loop().create_task(self._run(group_id, lane))
+        lane.put_nowait(text)
+
+    async def _collect(self, lane: asyncio.Queue, first: str) -> list[str]:
+        """等待 merge_window 秒，把期间入队的文本合并，单条不超过 max_length；退出时不等待"""
+        messages = [first]
+        deadline = asyncio.get_running_loop().time() + (0 if self.closing else self.merge_window)
+        while True:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining > 0:
+                try:
+                    text = await asyncio.wait_for(lane.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            elif not lane.empty():
+                text = lane.get_nowait()
+            else:
+                break
+            if text is None:
+                # close 放进来的结束标记，留给 _run 处理
+                lane.put_nowait(None)
+                break
+            if len(messages[-1]) + len(text) + 2 <= self.max_length:
+                messages[-1] += '\n\n' + text
+            else:
+                messages.append(text)
+        return messages
+
+    async def _throttle(self, group_id: int):
+        bucket = self.buckets.setdefault(group_id, TokenBucket(self.group_rate, self.group_burst))
+        while True:
+            wait = max(bucket.wait_time(), self.global_bucket.wait_time())
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        bucket.take()
+        self.global_bucket.take()
+
+    async def _deliver(self, group_id: int, text: str):
+        for attempt in range(self.max_retries + 1):
+            await self._throttle(group_id)
+            try:
+                await self.sender(group_id, text)
+                return
+            except Exception as exc:
+                if attempt == self.max_retries:
+                    logger.warning("Dropped message to group %s after %s attempts: %s", group_id, attempt + 1, exc)
+                    return
+                logger.warning("Failed to send message to group %s, retrying: %s", group_id, exc)
+                await asyncio.sleep(2 ** attempt)
+
+    async def _run(self, group_id: int, lane: asyncio.Queue):
+        while True:
+            try:
+                first = await asyncio.wait_for(lane.get(), self.idle_timeout)
+            except asyncio.TimeoutError:
+                # 检查和移除之间没有 await，send 不会投给已经退出的通道
+                if lane.empty():
+                    self.lanes.pop(group_id, None)
+                    self.tasks.pop(group_id, None)
+                    return
+                continue
+            if first is None:
+                # close 放入的结束标记，之前的消息都已经发出
+                return
+            messages = await self._collect(lane, first)
+            self.inflight[group_id] = messages
+            while messages:
+                await self._deliver(group_id, messages[0])
+                messages.pop(0)
+            self.inflight.pop(group_id, None)
+
+    async def close(self, timeout: float = 5.0):
+        """停止接收新消息，在 timeout 秒内按限速发完剩余消息，发不完的保存起来"""
+        self.closing = True
+        for lane in self.lanes.values():
+            lane.put_nowait(None)
+        tasks = list(self.tasks.values())
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+        leftover = []
+        for group_id, task in self.tasks.items():
+            task.cancel()
+            leftover += [(group_id, text) for text in self.inflight.get(group_id, [])]
+            lane = self.lanes[group_id]
+            while not lane.empty():
+                text = lane.get_nowait()
+                if text is not None:
+                    leftover.append((group_id, text))
+        if leftover:
+            logger.warning("Outbox closed with %s unsent messages", len(leftover))
+            self._save_pending(leftover)
+
+    def _save_pending(self, items: list[tuple[int, str]]):
+        if self.pending_key is None:
+            return
+        store = ListRedisData(self.pending_key)
+        now = int(time.time())
+        store.data.extend([group_id, text, now] for group_id, text in items)
+        store.save()
+
+    def restore(self):
+        """把上次退出时没发出的消息重新入队，需要在事件循环中调用"""
+        if self.pending_key is None:
+            return
+        store = ListRedisData(self.pending_key)
+        if not store.data:
+            return
+        items = store.data
+        store.delete()
+        deadline = time.time() - self.pending_ttl
+        for group_id, text, queued_at in items:
+            if queued_at >= deadline:
+                self.send(group_id, text)
@@ -1,4 +1,5 @@
-from src.data_access.redis import redis_global
+from src.data_access.redis import redis_global, redis_async
+from src.data_access.local_cache import local_cache
 from hashlib import sha256
 import json
 
@@ -10,40 +11,128 @@ def get_string_hash(s):
 class PluginManager:
     def __init__(self) -> None:
         self.metadata = {}
+        self.enable_listeners = {}
 
     def register_plugin(self, metadata) -> None:
         self.metadata[metadata["name"]] = metadata
 
+    def on_enable(self, plugin_name, callback) -> None:
+        """群启用插件之后调用 callback(group_id)"""
+        self.enable_listeners.setdefault(plugin_name, []).append(callback)
+
     def __get_group_key(self, group_id) -> str:
         return get_string_hash("chiyuki" + str(group_id))
 
     def get_all(self, group_id):
-        status = {}
-        for key, meta in self.metadata.items():
-            status[key] = meta["enable"]
-        redis_data = redis_global.get(self.__get_group_key(group_id))
+        key = self.__get_group_key(group_id)
+        obj = local_cache.get(key, lambda: self.__parse(redis_global.get(key)))
+        return self.__merge_status(obj)
+
+    async def get_all_async(self, group_id):
+        key = self.__get_group_key(group_id)
+
+        async def load():
+            return self.__parse(await redis_async.get(key))
+
+        obj = await local_cache.get_async(key, load)
+        return self.__merge_status(obj)
+
+    def __parse(self, redis_data):
         try:
             obj = json.loads(redis_data)
-            for k, v in obj.items():
-                status[k] = v
+            if isinstance(obj, dict):
+                return obj
         except Exception:
             pass
+        return {}
+
+    def __merge_status(self, obj):
+        status = {}
+        for key, meta in self.metadata.items():
+            status[key] = meta["enable"]
+        for k, v in obj.items():
+            status[k] = v
         return status
 
     def get_enable(self, group_id, plugin_name) -> bool:
         return self.get_all(group_id)[plugin_name]
 
+    async def get_enable_async(self, group_id, plugin_name) -> bool:
+        return (await self.get_all_async(group_id))[plugin_name]
+
+    def __get_enabled_key(self, plugin_name) -> str:
+        return f"chiyuki_plugin_groups_{plugin_name}"
+
+    def __get_disabled_key(self, plugin_name) -> str:
+        return f"chiyuki_plugin_disabled_groups_{plugin_name}"
+
+    def __stage_index(self, pipe, group_id, status) -> None:
+        """按保存的状态把群放进启用或禁用的索引，没有保存过的插件不记录，查询时按默认值处理"""
+        for name, value in status.items():
+            add, remove = (self.__get_enabled_key(name), self.__get_disabled_key(name)) if value \
+                else (self.__get_disabled_key(name), self.__get_enabled_key(name))
+            pipe.sadd(add, str(group_id))
+            pipe.srem(remove, str(group_id))
+
     def set_enable(self, group_id, plugin_name, enable) -> None:
         status = self.get_all(group_id)
         status[plugin_name] = enable
-        redis_global.set(self.__get_group_key(group_id), json.dumps(status))
-
-    def get_groups(self, plugin_name):
-        groups = []
-        for group_id in redis_global.keys("chiyuki*"):
-            status = self.get_all(group_id)
-            if status[plugin_name]:
-                groups.append(group_id)
+        key = self.__get_group_key(group_id)
+        pipe = redis_global.pipeline()
+        pipe.set(key, json.dumps(status))
+        self.__stage_index(pipe, group_id, status)
+        pipe.execute()
+        local_cache.invalidate(key)
+        if enable:
+            for callback in self.enable_listeners.get(plugin_name, []):
+                callback(group_id)
+
+    def __index_key(self, plugin_name) -> str:
+        # 默认关闭的插件查启用的群，默认启用的插件查禁用的群
+        if self.metadata[plugin_name]["enable"]:
+            return self.__get_disabled_key(plugin_name)
+        return self.__get_enabled_key(plugin_name)
+
+    def __filter_groups(self, plugin_name, members, candidates) -> list[int]:
+        if self.metadata[plugin_name]["enable"]:
+            # 默认启用的插件无法列出从未保存过状态的群，只能从候选群中排除禁用的
+            if candidates is None:
+                raise ValueError(f"{plugin_name} is enabled by default, candidates are required")
+            return [int(group_id) for group_id in candidates if str(group_id) not in members]
+        groups = [int(group_id) for group_id in members]
+        if candidates is not None:
+            candidates = {int(group_id) for group_id in candidates}
+            groups = [group_id for group_id in groups if group_id in candidates]
         return groups
 
+    def get_groups(self, plugin_name, candidates=None) -> list[int]:
+        """启用了该插件的群，需要先用 backfill_groups 建立过索引。
+
+        默认关闭的插件直接读取索引，传入 candidates 时只保留其中的群；
+        默认启用的插件必须传入候选群号 candidates，从中排除禁用了该插件的群。
+        """
+        return self.__filter_groups(plugin_name, redis_global.smembers(self.__index_key(plugin_name)), candidates)
+
+    async def get_groups_async(self, plugin_name, candidates=None) -> list[int]:
+        return self.__filter_groups(plugin_name, await redis_async.smembers(self.__index_key(plugin_name)), candidates)
+
+    def backfill_groups(self, group_ids, batch_size=500) -> int:
+        """用候选群号重建 get_groups 的索引，返回保存过状态的群数量。
+
+        群状态的 key 是哈希，无法从 key 反推群号，所以需要调用方提供候选群号。
+        """
+        group_ids = list(dict.fromkeys(str(group_id) for group_id in group_ids))
+        found = 0
+        for i in range(0, len(group_ids), batch_size):
+            batch = group_ids[i:i + batch_size]
+            values = redis_global.mget([self.__get_group_key(group_id) for group_id in batch])
+            pipe = redis_global.pipeline(transaction=False)
+            for group_id, value in zip(batch, values):
+                if value is None:
+                    continue
+                found += 1
+                self.__stage_index(pipe, group_id, self.__parse(value))
+            pipe.execute()
+        return found
+
 plugin_manager = PluginManager()
\ No newline at end of file
@@ -1,25 +1,498 @@
+import os
 import time
+import asyncio
+import threading
 import redis
+import redis.asyncio
 import json
+import zlib
+from nonebot import logger
+from collections.abc import MutableMapping
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 存储后端：默认连接本机 Redis；设为 sqlite:///path/to/file.db（或 sqlite:///:memory:）时使用内嵌存储
+STORAGE_URL = os.environ.get('CHIYUKI_STORAGE', 'redis://localhost:6379/0')
+
+if STORAGE_URL.startswith('sqlite://'):
+    from src.data_access.local_store import LocalStore
+    local_store = LocalStore(STORAGE_URL[len('sqlite://'):].removeprefix('/') or ':memory:')
+    redis_global = local_store.client(decode_responses=True)
+    redis_binary = local_store.client(decode_responses=False)
+    redis_async = local_store.async_client()
+    redis_async_binary = local_store.async_client(decode_responses=False)
+else:
+    local_store = None
+    redis_global = redis.Redis.from_url(STORAGE_URL, decode_responses=True)
+    # 不解码的客户端，用于读取 msgpack 这类二进制值
+    redis_binary = redis.Redis.from_url(STORAGE_URL, decode_responses=False)
+
+    # 协程版客户端：在事件循环里使用，不会阻塞其他群的消息处理
+    # 使用阻塞式连接池，连接数达到上限时排队等待而不是直接报错
+    redis_async = redis.asyncio.Redis(connection_pool=redis.asyncio.BlockingConnectionPool.from_url(
+        STORAGE_URL, decode_responses=True, max_connections=64, timeout=10
+    ))
+    redis_async_binary = redis.asyncio.Redis(connection_pool=redis.asyncio.BlockingConnectionPool.from_url(
+        STORAGE_URL, decode_responses=False, max_connections=16, timeout=10
+    ))
+
+
+def register_script(script, local):
+    """注册 Lua 脚本。内嵌存储不能执行 Lua，改为在事务里调用等价的 Python 实现 local(client, keys, args)"""
+    if local_store is not None:
+        return redis_global.register_script(script, local)
+    return redis_global.register_script(script)
+
+
+async def close_redis_async():
+    await redis_async.connection_pool.disconnect()
+    await redis_async_binary.connection_pool.disconnect()
+
+
+class WriteBehindBuffer:
+    """合并写缓冲：窗口期内对同一个 key 的多次 save 只在窗口结束时写一次。
+
+    仅在有运行中的事件循环时生效，否则立即写入。进程退出前需调用 flush()。
+    定时写入时序列化在事件循环里完成，pipeline 放到线程里执行，Redis 变慢不会卡住其他消息的处理。
+    写入失败时数据放回缓冲区，retry_delay 秒后重试。
+    """
+    retry_delay = 5
+
+    def __init__(self):
+        self.pending: dict[str, 'DictRedisData'] = {}
+        self.handle = None
+        # 正在线程里写入的 key，写完时 set；读取、删除这些 key 之前先等它写完
+        self.inflight: dict[str, threading.Event] = {}
+        # 同一时间只执行一个 pipeline，同一个 key 后提交的写入不会被先提交的覆盖
+        self.io_lock = threading.Lock()
+
+    def _arm(self, delay) -> bool:
+        """安排 delay 秒后 flush，没有运行中的事件循环时返回 False"""
+        if self.handle is not None:
+            return True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        self.handle = loop.call_later(delay, self._flush_later)
+        return True
+
+    def _flush_later(self):
+        self.handle = None
+        asyncio.get_running_loop().create_task(self._flush_in_background())
+
+    async def _flush_in_background(self):
+        try:
+            await self.flush_async()
+        except Exception:
+            logger.exception("Write-behind flush failed, %s keys kept for retry", len(self.pending))
+
+    def schedule(self, obj: 'DictRedisData'):
+        self.pending[obj.key] = obj
+        if not self._arm(obj.write_behind_window):
+            self.flush()
+
+    def wait_inflight(self, key):
+        event = self.inflight.get(key)
+        if event is not None:
+            event.wait()
+
+    def discard(self, key):
+        self.pending.pop(key, None)
+        self.wait_inflight(key)
+
+    def flush_key(self, key):
+        self.wait_inflight(key)
+        obj = self.pending.pop(key, None)
+        if obj is None:
+            return
+        try:
+            obj.write_through()
+        except Exception:
+            self.pending.setdefault(key, obj)
+            self._arm(self.retry_delay)
+            raise
+
+    def execute(self, pipe):
+        with self.io_lock:
+            return pipe.execute()
+
+    def _take(self):
+        """取出所有待写对象放进一个 pipeline，返回 (取出的对象, pipeline, [(对象, 标记, 结果下标)])"""
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        pending, self.pending = self.pending, {}
+        written = []
+        try:
+            pipe = redis_global.pipeline(transaction=False)
+            for obj in pending.values():
+                index = len(pipe)
+                token = obj.stage(pipe)
+                if token is not None:
+                    written.append((obj, token, index))
+        except Exception:
+            self._requeue(pending)
+            raise
+        return pending, pipe, written
+
+    def _requeue(self, pending):
+        # 失败前又 save 过的 key 以新的对象为准
+        for obj in pending.values():
+            self.pending.setdefault(obj.key, obj)
+        self._arm(self.retry_delay)
+
+    def flush(self):
+        for event in list(self.inflight.values()):
+            event.wait()
+        if not self.pending:
+            return
+        pending, pipe, written = self._take()
+        if not written:
+            return
+        try:
+            results = self.execute(pipe)
+        except Exception:
+            self._requeue(pending)
+            raise
+        for obj, token, index in written:
+            obj.finish(token, results[index])
+
+    async def flush_async(self):
+        if not self.pending:
+            return
+        pending, pipe, written = self._take()
+        if not written:
+            return
+        event = threading.Event()
+        for key in pending:
+            self.inflight[key] = event
+
+        def run():
+            try:
+                return self.execute(pipe)
+            finally:
+                event.set()
+
+        try:
+            results = await asyncio.to_thread(run)
+        except Exception:
+            self._requeue(pending)
+            raise
+        finally:
+            for key in pending:
+                if self.inflight.get(key) is event:
+                    del self.inflight[key]
+        for obj, token, index in written:
+            obj.finish(token, results[index])
+
+
+write_behind = WriteBehindBuffer()
+
+
+def flush_write_behind():
+    write_behind.flush()
+
+
+# msgpack 从不使用 0xc1，它也不可能是 UTF-8 JSON 的首字节，用来区分二进制值和旧的 JSON 值
+MSGPACK_HEADER = b'\xc1'
+# 压缩值的首字节，同样不可能出现在 UTF-8 文本开头；解压后的内容再按首字节识别
+ZLIB_HEADER = b'\xc0'
+ZSTD_HEADER = b'\xf5'
+
+
+class CompressionStats:
+    """进程内累计的压缩收益和耗时"""
+    def __init__(self):
+        self.compressed = 0
+        self.skipped = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self.compress_seconds = 0.0
+        self.decompressed = 0
+        self.decompress_seconds = 0.0
+
+    @property
+    def bytes_saved(self):
+        return self.raw_bytes - self.stored_bytes
+
+    def summary(self):
+        ratio = self.stored_bytes / self.raw_bytes if self.raw_bytes else 1
+        return (f'压缩 {self.compressed} 次（{self.skipped} 次无收益未压缩），节省 {self.bytes_saved} 字节，'
+                f'压缩率 {ratio:.2%}，压缩耗时 {self.compress_seconds * 1000:.1f} ms；'
+                f'解压 {self.decompressed} 次，耗时 {self.decompress_seconds * 1000:.1f} ms')
+
+
+compression_stats = CompressionStats()
+
+
+class Compression:
+    """超过阈值的值压缩后写入，其他值原样写入，两种值可以共存。
+
+    输出统一为字节串，使用它的类需要用 redis_binary 读取。algorithm 为 zstd 或 zlib，默认有 zstandard 时用 zstd。
+    """
+    def __init__(self, threshold=4096, algorithm=None, level=None):
+        if algorithm is None:
+            algorithm = 'zstd' if zstandard is not None else 'zlib'
+        self.threshold = threshold
+        self.algorithm = algorithm
+        if algorithm == 'zstd':
+            self.header = ZSTD_HEADER
+            self._compress = zstandard.ZstdCompressor(level=level or 3).compress
+        else:
+            self.header = ZLIB_HEADER
+            self._compress = lambda data: zlib.compress(data, level or 1)
+
+    def pack(self, payload):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        if len(payload) < self.threshold:
+            return payload
+        start = time.perf_counter()
+        packed = self.header + self._compress(payload)
+        compression_stats.compress_seconds += time.perf_counter() - start
+        if len(packed) >= len(payload):
+            compression_stats.skipped += 1
+            return payload
+        compression_stats.compressed += 1
+        compression_stats.raw_bytes += len(payload)
+        compression_stats.stored_bytes += len(packed)
+        return packed
+
+
+def _decompress(payload):
+    start = time.perf_counter()
+    if payload[:1] == ZSTD_HEADER:
+        # 写入时用的是一次性 compress，帧头里带有原始长度
+        result = zstandard.ZstdDecompressor().decompress(payload[1:])
+    else:
+        result = zlib.decompress(payload[1:])
+    compression_stats.decompressed += 1
+    compression_stats.decompress_seconds += time.perf_counter() - start
+    return result
+
+
+def decode_payload(payload):
+    """按首字节识别格式：0xc0 / 0xf5 开头为压缩值，0xc1 开头为 msgpack，其他按 JSON 解析"""
+    if isinstance(payload, bytes) and payload[:1] in (ZLIB_HEADER, ZSTD_HEADER):
+        payload = _decompress(payload)
+    if isinstance(payload, bytes) and payload[:1] == MSGPACK_HEADER:
+        return msgpack.unpackb(payload[1:], strict_map_key=False)
+    if orjson is not None:
+        try:
+            return orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            # orjson 不接受 NaN 和超过 64 位的整数，交给标准库
+            pass
+    return json.loads(payload)
+
+
+class JsonCodec:
+    name = 'json'
+    # 为 True 时需要用 redis_binary 读取
+    binary = False
+
+    def dumps(self, obj):
+        return json.dumps(obj)
+
+    def loads(self, payload):
+        return decode_payload(payload)
+
+
+class OrjsonCodec(JsonCodec):
+    """输出仍是 JSON，和旧数据、Lua 脚本里的 cjson 互通"""
+    name = 'orjson'
+
+    def dumps(self, obj):
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+        except TypeError:
+            # 超过 64 位的整数等 orjson 不支持的值
+            return json.dumps(obj)
+
+
+class MsgpackCodec(JsonCodec):
+    """体积最小，但 Redis 端脚本无法读取；整数 key 会保留为整数，不会像 JSON 一样变成字符串"""
+    name = 'msgpack'
+    binary = True
+
+    def dumps(self, obj):
+        return MSGPACK_HEADER + msgpack.packb(obj)
+
+
+codecs = {'json': JsonCodec()}
+if orjson is not None:
+    codecs['orjson'] = OrjsonCodec()
+if msgpack is not None:
+    codecs['msgpack'] = MsgpackCodec()
+# 所有 codec 都能读旧的 JSON 值，换 codec 后各 key 在下一次保存时自然迁移
+default_codec = codecs.get('orjson', codecs['json'])
+
+
+def make_serializer(codec, compression=None):
+    if compression is None:
+        return codec.dumps
+    return lambda obj: compression.pack(codec.dumps(obj))
+
+
+class HashFields(MutableMapping):
+    """hash 存储模式下的 data：每个顶层字段是一个 hash field。
+
+    字段在第一次访问时才反序列化，保存时只写回序列化结果发生变化的字段。
+    有 pack（压缩）时先比较压缩前的序列化结果，没有变化的字段不再压缩。
+    """
+    def __init__(self, raw: dict, loader, dumps, pack=None):
+        self._raw = raw
+        self._values = {}
+        self._deleted = set()
+        self._loader = loader
+        self._dumps = dumps
+        self._pack = pack
+        # 有 pack 时记录每个字段上次读取或写入时压缩前的序列化结果
+        self._plain = {}
+        self._staged_plain = {}
+
+    def _serializer(self, value, field):
+        plain = self._dumps(value)
+        if self._pack is None:
+            return plain
+        return self._pack(plain, field)
+
+    def __getitem__(self, field):
+        if field in self._values:
+            return self._values[field]
+        if field in self._deleted or field not in self._raw:
+            raise KeyError(field)
+        value = self._loader(self._raw[field])
+        self._values[field] = value
+        if self._pack is not None:
+            self._plain[field] = self._dumps(value)
+        return value
+
+    def __setitem__(self, field, value):
+        self._values[field] = value
+        self._deleted.discard(field)
+
+    def __delitem__(self, field):
+        if field not in self:
+            raise KeyError(field)
+        self._values.pop(field, None)
+        self._deleted.add(field)
+
+    def __contains__(self, field):
+        return field in self._values or (field in self._raw and field not in self._deleted)
+
+    def __iter__(self):
+        for field in self._raw:
+            if field not in self._deleted:
+                yield field
+        for field in self._values:
+            if field not in self._raw:
+                yield field
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def changes(self):
+        changed = {}
+        self._staged_plain = {}
+        for field, value in self._values.items():
+            plain = self._dumps(value)
+            if self._pack is None:
+                if self._raw.get(field) != plain:
+                    changed[field] = plain
+                continue
+            if field in self._raw and self._plain.get(field) == plain:
+                continue
+            payload = self._pack(plain, field)
+            if self._raw.get(field) != payload:
+                changed[field] = payload
+                self._staged_plain[field] = plain
+            else:
+                self._plain[field] = plain
+        deleted = [field for field in self._deleted if field in self._raw]
+        return changed, deleted
+
+    def mark_clean(self, changed, deleted):
+        self._raw.update(changed)
+        for field in changed:
+            if field in self._staged_plain:
+                self._plain[field] = self._staged_plain[field]
+            else:
+                self._plain.pop(field, None)
+        self._staged_plain = {}
+        for field in deleted:
+            self._raw.pop(field, None)
+            self._plain.pop(field, None)
+        self._deleted.clear()
+
+    def reset(self, field, payload):
+        """用服务端脚本写入后的值覆盖本地字段并视为未修改，本地对该字段的改动会丢弃。
+
+        dict / list 原地更新，已经持有引用的对象（如 Backpack）继续有效。
+        """
+        value = self._loader(payload)
+        old = self._values.get(field)
+        if type(old) == type(value) and isinstance(value, (dict, list)):
+            old.clear()
+            if isinstance(value, dict):
+                old.update(value)
+            else:
+                old.extend(value)
+            value = old
+        self._values[field] = value
+        self._deleted.discard(field)
+        plain = self._dumps(value)
+        if self._pack is None:
+            self._raw[field] = plain
+        else:
+            self._plain[field] = plain
+            self._raw[field] = self._pack(plain, field)
+
+
+# 构造时 prefetched 参数的缺省值，表示需要自己从 Redis 读取
+NOT_FETCHED = object()
 
-redis_global = redis.Redis(host='localhost', port=6379, decode_responses=True)
 
 class RedisData:
-    def __init__(self, key, type_loader=str, type_serializer=str, default=''):
+    client = redis_global
+    # 设置为 Compression 时，超过阈值的值压缩后写入
+    compression = None
+
+    def __init__(self, key, type_loader=str, type_serializer=str, default='', prefetched=NOT_FETCHED):
         self.key = key
-        value = redis_global.get(self.key)
-        if value == None:
-            self.submit_data = default
-        else:
-            self.submit_data = type_loader(value)
         self.loader = type_loader
         self.serializer = type_serializer
+        # 先落盘同 key 尚未写入的合并写，保证读到自己的写入
+        write_behind.flush_key(key)
+        self.submit_data = self._load(default, prefetched)
         self.data = self.submit_data
+
+    def _load(self, default, prefetched=NOT_FETCHED):
+        value = self.client.get(self.key) if prefetched is NOT_FETCHED else prefetched
+        self._clean_payload = value
+        if value == None:
+            return default
+        return self.loader(value)
             
     def set(self, data):
         self.data = data
 
     def delete(self):
+        write_behind.discard(self.key)
         redis_global.delete(self.key)
         self.data = None
         self.submit_data = None
@@ -37,23 +510,622 @@ class NumberRedisData(RedisData):
 
 
 class ListRedisData(RedisData):
+    codec = default_codec
+
     def __init__(self, key):
-        super().__init__(key, lambda s : json.loads(s), lambda lst : json.dumps(lst), default=[])
+        if self.codec.binary or self.compression is not None:
+            self.client = redis_binary
+        super().__init__(key, self.codec.loads, make_serializer(self.codec, self.compression), default=[])
         if type(self.data) != type([]):
             raise Exception(f"{self.__dict__} is not a list")
 
 
 class DictRedisData(RedisData):
+    # 大于 0 时启用合并写（秒），窗口内的多次 save 合并为一次 SET
+    write_behind_window = 0
+    # 为 True 时按顶层字段存成 Redis hash，旧的 string 值读取时自动兼容，保存时转换
+    hash_storage = False
+    # 序列化方式，hash_storage 时作用于每个字段
+    codec = default_codec
+    # hash_storage 时由 Redis 端脚本读写的字段，始终按纯 JSON 存储，不压缩
+    script_fields = ()
+    # hash_storage 时可设置：归档的 key 以原 key 为字段压缩存放在这个 hash 里，读取时自动恢复
+    archive_key = None
+    # compression 不为空时压缩前的序列化结果：已写入的 / 本次暂存待写入的
+    _clean_plain = None
+    _staged_plain = None
+
+    def __init__(self, key, default=None, prefetched=NOT_FETCHED):
+        """prefetched 为 fetch_raw 取回的原始值，传入时构造过程不访问 Redis"""
+        if default is None:
+            default = {}
+        if self.binary():
+            self.client = redis_binary
+        super().__init__(key, self.codec.loads, make_serializer(self.codec, self.compression),
+                         default=default, prefetched=prefetched)
+        if type(self.data) != type({}) and not self.hash_storage:
+            raise Exception(f"{self.__dict__} is not a dict")
+
+    @classmethod
+    def binary(cls):
+        """值可能不是 UTF-8 文本，需要用 redis_binary 读取"""
+        return cls.codec.binary or cls.compression is not None
+
+    @classmethod
+    def _serialize_field(cls, value, field):
+        payload = cls.codec.dumps(value)
+        if cls.compression is None:
+            return payload
+        return cls._pack_field(payload, field)
+
+    @classmethod
+    def _pack_field(cls, payload, field):
+        if field in cls.script_fields:
+            return payload.encode() if isinstance(payload, str) else payload
+        return cls.compression.pack(payload)
+
+    def _hash_fields(self, raw):
+        pack = self._pack_field if self.compression is not None else None
+        return HashFields(raw, self.loader, self.codec.dumps, pack)
+
+    @classmethod
+    def fetch_raw(cls, keys) -> list:
+        """用一次 pipeline 取回多个 key 的原始值，不存在的 key 为 None。
+
+        结果按顺序作为 prefetched 传给构造函数。
+        """
+        keys = list(keys)
+        for key in keys:
+            write_behind.flush_key(key)
+        client = redis_binary if cls.binary() else redis_global
+        if not cls.hash_storage:
+            return client.mget(keys) if keys else []
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            pipe.hgetall(key)
+        values = pipe.execute(raise_on_error=False)
+        # 还没迁移的 string 值
+        legacy = [i for i, value in enumerate(values) if isinstance(value, redis.ResponseError)]
+        if legacy:
+            for i, value in zip(legacy, client.mget([keys[i] for i in legacy])):
+                values[i] = value
+        values = [value if value else None for value in values]
+        if cls.archive_key is not None and None in values:
+            restored = cls.restore([key for key, value in zip(keys, values) if value is None])
+            values = [restored.get(key) if value is None else value for key, value in zip(keys, values)]
+        return values
+
+    @classmethod
+    def exists(cls, key) -> bool:
+        """key 存在，或者在归档里（此时会顺便恢复）"""
+        return bool(redis_global.exists(key)) or bool(cls.restore([key]))
+
+    @classmethod
+    def archive_idle(cls, match, max_idle, batch_size=500) -> int:
+        """把 updated_at 早于 max_idle 秒之前的 key 压缩后移入 archive_key，返回归档的个数。
+
+        没有 updated_at 的 key 和还没迁移成 hash 的 key 不处理；归档前 updated_at 又变化的 key 会跳过。
+        """
+        deadline = time.time() - max_idle
+        count = 0
+        for keys in scan_batches(match, batch_size):
+            rows = cls._fetch_fields(keys, ['updated_at'])
+            idle = [key for key, row in zip(keys, rows) if row and row['updated_at'] < deadline]
+            if not idle:
+                continue
+            pipe = redis_global.pipeline(transaction=False)
+            queued = False
+            for key, raw in zip(idle, cls.fetch_raw(idle)):
+                if not isinstance(raw, dict):
+                    continue
+                raw = {field.decode() if isinstance(field, bytes) else field: value for field, value in raw.items()}
+                if 'updated_at' not in raw:
+                    continue
+                obj = {field: cls.codec.loads(value) for field, value in raw.items()}
+                blob = archive_compression.pack(cls.codec.dumps(obj))
+                _archive_script(keys=[key, cls.archive_key], args=[raw['updated_at'], blob], client=pipe)
+                queued = True
+            if queued:
+                count += sum(1 for r in pipe.execute(raise_on_error=False) if r == 1)
+        return count
+
+    @classmethod
+    def restore(cls, keys) -> dict:
+        """把归档里的 key 恢复成 hash，返回 {key: 原始值}，可以作为 prefetched 构造对象"""
+        if cls.archive_key is None or not keys:
+            return {}
+        keys = list(keys)
+        pending = []
+        pipe = redis_global.pipeline(transaction=False)
+        for key, blob in zip(keys, redis_binary.hmget(cls.archive_key, keys)):
+            if blob is None:
+                continue
+            raw = {field: cls._serialize_field(value, field) for field, value in decode_payload(blob).items()}
+            args = [blob]
+            for field, payload in raw.items():
+                args += [field, payload]
+            _restore_script(keys=[key, cls.archive_key], args=args, client=pipe)
+            pending.append((key, raw))
+        if not pending:
+            return {}
+        client = redis_binary if cls.binary() else redis_global
+        restored = {}
+        for (key, raw), result in zip(pending, pipe.execute(raise_on_error=False)):
+            if result == 1:
+                restored[key] = raw
+            else:
+                # 被其他进程抢先恢复了，直接读取
+                restored[key] = client.hgetall(key) or None
+        return {key: raw for key, raw in restored.items() if raw}
+
+    @classmethod
+    def iter_raw(cls, match, batch_size=500, fields=None):
+        """按批 SCAN 匹配的 key，每批一次 pipeline 取值，逐个产出 (key, value)，内存占用只和批大小有关。
+
+        fields 为 None 时 value 是 fetch_raw 的原始值，可以作为 prefetched 构造对象；
+        否则 value 是只包含这些字段的 dict（已反序列化，不存在的字段不出现）。
+        """
+        for keys in scan_batches(match, batch_size):
+            if fields is None:
+                values = cls.fetch_raw(keys)
+            else:
+                values = cls._fetch_fields(keys, fields)
+            for key, value in zip(keys, values):
+                if value is not None:
+                    yield key, value
+
+    @classmethod
+    def _fetch_fields(cls, keys, fields):
+        for key in keys:
+            write_behind.flush_key(key)
+        client = redis_binary if cls.binary() else redis_global
+        if cls.hash_storage:
+            pipe = client.pipeline(transaction=False)
+            for key in keys:
+                pipe.hmget(key, fields)
+            rows = pipe.execute(raise_on_error=False)
+        else:
+            rows = [redis.ResponseError()] * len(keys)
+        # string 存储或还没迁移的 key 只能整体读取后再挑字段
+        whole = [i for i, row in enumerate(rows) if isinstance(row, redis.ResponseError)]
+        if whole:
+            for i, value in zip(whole, client.mget([keys[i] for i in whole])):
+                if value is None:
+                    rows[i] = None
+                    continue
+                obj = cls.codec.loads(value)
+                # 和 hash 一样，一个请求的字段都没有时视为不存在
+                rows[i] = {field: obj[field] for field in fields if field in obj} or None
+        result = []
+        for row in rows:
+            if isinstance(row, list):
+                if all(value is None for value in row):
+                    row = None
+                else:
+                    row = {field: cls.codec.loads(value) for field, value in zip(fields, row) if value is not None}
+            result.append(row)
+        return result
+
+    def _load(self, default, prefetched=NOT_FETCHED):
+        if not self.hash_storage:
+            value = super()._load(default, prefetched)
+            # 记下压缩前的序列化结果，保存时先和它比较
+            self._clean_plain = None
+            if self.compression is not None and self._clean_payload is not None:
+                self._clean_plain = self.codec.dumps(value)
+            return value
+        self._legacy = False
+        raw = prefetched
+        if raw is NOT_FETCHED:
+            try:
+                raw = self.client.hgetall(self.key)
+            except redis.ResponseError:
+                raw = self.client.get(self.key)
+        if not raw and self.archive_key is not None:
+            raw = self.restore([self.key]).get(self.key)
+        if raw is None:
+            raw = {}
+        if not isinstance(raw, dict):
+            # 还没有迁移的 string 值
+            value = super()._load(default, raw)
+            if type(value) != type({}):
+                raise Exception(f"{self.key} is not a dict")
+            self._legacy = True
+            fields = self._hash_fields({})
+            fields.update(value)
+            return fields
+        if self.binary():
+            # 刚从归档恢复的值字段名已经是 str
+            raw = {field.decode() if isinstance(field, bytes) else field: value for field, value in raw.items()}
+        fields = self._hash_fields(raw)
+        if not raw:
+            fields.update(default)
+        return fields
+
+    def dirty_payload(self):
+        """数据有变化时盖上 updated_at 并返回序列化结果，没有变化时返回 None"""
+        if self.compression is not None:
+            # 先比较压缩前的结果，没有变化时不用压缩
+            if self._clean_plain is not None and self.codec.dumps(self.data) == self._clean_plain:
+                return None
+            self.data['updated_at'] = int(time.time())
+            self._staged_plain = self.codec.dumps(self.data)
+            return self.compression.pack(self._staged_plain)
+        if self._clean_payload is not None and self.serializer(self.data) == self._clean_payload:
+            return None
+        self.data['updated_at'] = int(time.time())
+        return self.serializer(self.data)
+
+    def stage(self, pipe):
+        """把需要写入的命令放进 pipeline，没有变化时返回 None，否则返回交给 commit 的标记"""
+        if not self.hash_storage:
+            payload = self.dirty_payload()
+            if payload is None:
+                return None
+            pipe.set(self.key, payload)
+            return payload
+        changed, deleted = self.data.changes()
+        if not changed and not deleted:
+            return None
+        self.data['updated_at'] = int(time.time())
+        changed['updated_at'] = self._serialize_field(self.data['updated_at'], 'updated_at')
+        if self._legacy:
+            deleted = []
+        self.stage_hash_write(pipe, changed, deleted)
+        return changed, deleted
+
+    def stage_hash_write(self, pipe, changed, deleted):
+        """hash_storage 时把字段的写入放进 pipeline，第一条命令的结果会交给 finish"""
+        if self.archive_key is not None:
+            # 对象加载之后 key 可能被归档，只写改动字段会留下残缺的 hash，由脚本检查后再写
+            _hash_write_script(keys=[self.key, self.archive_key],
+                               args=hash_write_args(self._legacy, changed, deleted), client=pipe)
+            return
+        if self._legacy:
+            pipe.delete(self.key)
+        pipe.hset(self.key, mapping=changed)
+        if deleted:
+            pipe.hdel(self.key, *deleted)
+
+    def commit(self, token):
+        self.submit_data = self.data
+        if self.hash_storage:
+            self.data.mark_clean(*token)
+            self._legacy = False
+        else:
+            self._clean_payload = token
+            if self.compression is not None:
+                self._clean_plain = self._staged_plain
+
+    def finish(self, token, result):
+        """pipeline 执行之后调用，result 为 stage 放进的第一条命令的结果"""
+        if self.archive_key is not None and result == ARCHIVED and self.restore([self.key]):
+            # 保存前已经被归档，恢复完整数据后重新写入本次的改动
+            self.write_through()
+            return
+        self.commit(token)
+
+    def write_through(self):
+        pipe = redis_global.pipeline()
+        token = self.stage(pipe)
+        if token is None:
+            return False
+        self.finish(token, write_behind.execute(pipe)[0])
+        return True
+
+    def save(self, *args, ex=None, px=None, nx=False, xx=False):
+        """hash_storage 时支持 ex / px（在同一个 pipeline 里设置过期时间），不支持 nx / xx"""
+        if len(args) != 0:
+            self.set(args[0])
+        if ex is not None or px is not None or nx or xx:
+            # 立即写入，之前排队的合并写不再执行，否则会覆盖掉这次的过期时间
+            write_behind.discard(self.key)
+            if self.hash_storage:
+                if nx or xx:
+                    raise ValueError("hash storage does not support nx/xx")
+                self._write_with_expire(ex, px)
+                return
+            # 带过期时间或条件的写入需要每次都真正执行
+            self.data['updated_at'] = int(time.time())
+            super().save(ex=ex, px=px, nx=nx, xx=xx)
+            self._clean_payload = None
+            self._clean_plain = None
+            return
+        if self.write_behind_window > 0:
+            write_behind.schedule(self)
+            return
+        self.write_through()
+
+    def _write_with_expire(self, ex, px):
+        pipe = redis_global.pipeline()
+        token = self.stage(pipe)
+        # 数据没有变化时只刷新过期时间
+        if ex is not None:
+            pipe.expire(self.key, ex)
+        else:
+            pipe.pexpire(self.key, px)
+        results = write_behind.execute(pipe)
+        if token is not None:
+            self.finish(token, results[0])
+
+    @property
+    def updated_at(self):
+        return self.data.get('updated_at', 0)
+
+
+def _migrate_to_hash_local(client, keys, args):
+    if client.get(keys[0]) != args[0]:
+        return 0
+    client.delete(keys[0])
+    client.hset(keys[0], mapping=dict(zip(args[1::2], args[2::2])))
+    return 1
+
+
+_migrate_to_hash_script = register_script("""
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+for i = 2, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return 1
+""", _migrate_to_hash_local)
+
+
+# 归档数据整体压缩，不论大小
+archive_compression = Compression(threshold=0)
+
+
+def _archive_local(client, keys, args):
+    if client.type(keys[0]) != b'hash' or client.hget(keys[0], 'updated_at') != args[0]:
+        return 0
+    client.hset(keys[1], keys[0], args[1])
+    client.delete(keys[0])
+    return 1
+
+
+# KEYS: 原 key、归档 hash；ARGV: 读取时的 updated_at、压缩后的整体数据
+_archive_script = register_script("""
+if redis.call('TYPE', KEYS[1]).ok ~= 'hash' or redis.call('HGET', KEYS[1], 'updated_at') ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[2], KEYS[1], ARGV[2])
+redis.call('DEL', KEYS[1])
+return 1
+""", _archive_local)
+
+
+def _restore_local(client, keys, args):
+    if client.exists(keys[0]) or client.hget(keys[1], keys[0]) != args[0]:
+        return 0
+    client.hset(keys[0], mapping=dict(zip(args[1::2], args[2::2])))
+    client.hdel(keys[1], keys[0])
+    return 1
+
+
+# KEYS: 原 key、归档 hash；ARGV: 归档数据（用于确认没有被改动），之后为 field、value 交替
+_restore_script = register_script("""
+if redis.call('EXISTS', KEYS[1]) == 1 or redis.call('HGET', KEYS[2], KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+for i = 2, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('HDEL', KEYS[2], KEYS[1])
+return 1
+""", _restore_local)
+
+
+# _hash_write_script 的返回值：key 不存在且在归档里，没有写入
+ARCHIVED = 0
+
+
+def hash_write_args(legacy, changed, deleted) -> list:
+    """字段写入脚本的参数：是否先删除旧 string 值、删除的字段数、删除的字段，之后为 field、value 交替"""
+    args = [int(legacy), len(deleted), *deleted]
+    for field, payload in changed.items():
+        args += [field, payload]
+    return args
+
+
+def apply_hash_write_local(client, key, args):
+    """按 hash_write_args 的参数写入字段，供脚本的 Python 实现使用"""
+    if args[0] == b'1':
+        client.delete(key)
+    count = int(args[1])
+    deleted = args[2:2 + count]
+    client.hset(key, mapping=dict(zip(args[2 + count::2], args[3 + count::2])))
+    if deleted:
+        client.hdel(key, *deleted)
+
+
+# 按 hash_write_args 的参数写入 KEYS[1]，ARGV 从 offset + 1 开始；嵌在其他脚本里使用
+HASH_WRITE_LUA = """
+local function hash_write(key, offset)
+    if ARGV[offset + 1] == '1' then
+        redis.call('DEL', key)
+    end
+    local count = tonumber(ARGV[offset + 2])
+    for i = offset + 3 + count, #ARGV, 2 do
+        redis.call('HSET', key, ARGV[i], ARGV[i + 1])
+    end
+    if count > 0 then
+        redis.call('HDEL', key, unpack(ARGV, offset + 3, offset + 2 + count))
+    end
+end
+"""
+
+
+def _hash_write_local(client, keys, args):
+    if not client.exists(keys[0]) and client.hget(keys[1], keys[0]) is not None:
+        return ARCHIVED
+    apply_hash_write_local(client, keys[0], args)
+    return 1
+
+
+# KEYS: 原 key、归档 hash；ARGV: hash_write_args 的参数
+_hash_write_script = register_script(HASH_WRITE_LUA + """
+if redis.call('EXISTS', KEYS[1]) == 0 and redis.call('HEXISTS', KEYS[2], KEYS[1]) == 1 then
+    return 0
+end
+hash_write(KEYS[1], 0)
+return 1
+""", _hash_write_local)
+
+
+def scan_batches(match, batch_size=500, _type=None):
+    """SCAN 匹配的 key，每凑满 batch_size 个产出一次列表"""
+    batch = []
+    for key in redis_global.scan_iter(match=match, count=batch_size, _type=_type):
+        batch.append(key)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def migrate_to_hash(match, batch_size=500):
+    """把匹配 match 的 JSON string 值转换为 hash_storage 使用的 hash 结构，返回转换的 key 数量。
+
+    每个 key 的转换是一次比较后交换，期间值被改写过的 key 会被跳过，可以重复执行。
+    """
+    migrated = 0
+    for batch in scan_batches(match, batch_size, _type='string'):
+        migrated += migrate_keys_to_hash(batch)
+    return migrated
+
+
+def migrate_keys_to_hash(keys):
+    # 按原始字节读取，msgpack 值也能转换；字段统一写成 JSON，各 codec 都能读
+    values = redis_binary.mget(keys)
+    pipe = redis_global.pipeline(transaction=False)
+    for key, value in zip(keys, values):
+        if value is None:
+            continue
+        try:
+            obj = decode_payload(value)
+        except Exception:
+            continue
+        if type(obj) != type({}) or not obj:
+            continue
+        args = [value]
+        for field, field_value in obj.items():
+            args += [field, json.dumps(field_value)]
+        _migrate_to_hash_script(keys=[key], args=args, client=pipe)
+    results = pipe.execute(raise_on_error=False)
+    return sum(1 for r in results if r == 1)
+
+
+class AsyncRedisData:
+    """RedisData 的协程版本，构造时不访问 Redis，需要 `await obj.load()` 后再使用：
+
+        store = await AsyncDictRedisData('some_key').load()
+        store.data['x'] = 1
+        await store.save()
+    """
+    client = redis_async
+    compression = None
+
+    def __init__(self, key, type_loader=str, type_serializer=str, default=''):
+        self.key = key
+        self.loader = type_loader
+        self.serializer = type_serializer
+        self.submit_data = default
+        self.data = default
+        self._clean_payload = None
+
+    async def load(self):
+        value = await self.client.get(self.key)
+        self._clean_payload = value
+        if value is not None:
+            self.submit_data = self.loader(value)
+            self.data = self.submit_data
+        self.check()
+        return self
+
+    def check(self):
+        pass
+
+    def set(self, data):
+        self.data = data
+
+    async def delete(self):
+        await self.client.delete(self.key)
+        self.data = None
+        self.submit_data = None
+
+    async def save(self, *args, ex=None, px=None, nx=False, xx=False):
+        if len(args) != 0:
+            self.set(args[0])
+        self.submit_data = self.data
+        await self.client.set(self.key, self.serializer(self.submit_data), ex, px, nx, xx)
+
+
+class AsyncNumberRedisData(AsyncRedisData):
+    def __init__(self, key):
+        super().__init__(key, int, str, default=0)
+
+
+class AsyncListRedisData(AsyncRedisData):
+    def __init__(self, key):
+        if self.compression is not None:
+            self.client = redis_async_binary
+        super().__init__(key, default_codec.loads, make_serializer(default_codec, self.compression), default=[])
+
+    def check(self):
+        if type(self.data) != type([]):
+            raise Exception(f"{self.__dict__} is not a list")
+
+
+class AsyncDictRedisData(AsyncRedisData):
     def __init__(self, key, default=None):
         if default is None:
             default = {}
-        super().__init__(key, lambda s : json.loads(s), lambda dct : json.dumps(dct), default=default)
+        if self.compression is not None:
+            self.client = redis_async_binary
+        super().__init__(key, default_codec.loads, make_serializer(default_codec, self.compression), default=default)
+
+    _clean_plain = None
+
+    def check(self):
         if type(self.data) != type({}):
             raise Exception(f"{self.__dict__} is not a dict")
-        
-    def save(self, *args, ex=None, px=None, nx=False, xx=False):
-        self.data['updated_at'] = int(time.time())
-        super().save(*args, ex=ex, px=px, nx=nx, xx=xx)
+
+    async def load(self):
+        await super().load()
+        # 和同步版本一样，压缩时先比较压缩前的序列化结果
+        self._clean_plain = None
+        if self.compression is not None and self._clean_payload is not None:
+            self._clean_plain = default_codec.dumps(self.data)
+        return self
+
+    async def save(self, *args, ex=None, px=None, nx=False, xx=False):
+        if len(args) != 0:
+            self.set(args[0])
+        if ex is not None or px is not None or nx or xx:
+            self.data['updated_at'] = int(time.time())
+            await super().save(ex=ex, px=px, nx=nx, xx=xx)
+            self._clean_payload = None
+            self._clean_plain = None
+            return
+        if self.compression is not None:
+            if self._clean_plain is not None and default_codec.dumps(self.data) == self._clean_plain:
+                return
+            self.data['updated_at'] = int(time.time())
+            plain = default_codec.dumps(self.data)
+            payload = self.compression.pack(plain)
+        else:
+            if self._clean_payload is not None and self.serializer(self.data) == self._clean_payload:
+                return
+            self.data['updated_at'] = int(time.time())
+            payload = self.serializer(self.data)
+            plain = None
+        await self.client.set(self.key, payload)
+        self.submit_data = self.data
+        self._clean_payload = payload
+        self._clean_plain = plain
 
     @property
     def updated_at(self):
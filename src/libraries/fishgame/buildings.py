@@ -168,6 +168,15 @@ class BigPot(BuildingBase):
     
     def consume(self):
         self.current = max(0, self.current - self.consume_speed)
+
+    def consume_many(self, times: int):
+        """等价于调用 times 次 consume。存量不超过 100 时每次固定消耗 10，直接算出结果，
+        超过 100 的部分最多逐次算 capacity / 10 次"""
+        while times > 0 and self.current > 100:
+            self.consume()
+            times -= 1
+        if times > 0:
+            self.current = max(0, self.current - 10 * times)
     
     def get_level_materials(self, level: int) -> list[ItemRequest]:
         materials = {
@@ -0,0 +1,69 @@
+from collections import defaultdict
+from src.libraries.fishgame.data import Fish, FishItem, fish_data, fish_item, fish_data_poke_ver
+
+
+class Catalog:
+    """鱼、物品的只读索引，数据加载完成后构建一次，之后不再变化。
+
+    列表均为 tuple，按 id 顺序排列，和直接遍历 fish_data / fish_item 的顺序一致。
+    """
+    def __init__(self):
+        # fish_data_poke_ver.json 中的鱼为常驻鱼，之后的是各主题的群鱼
+        self.common_last_fish_id = len(fish_data_poke_ver)
+
+        self.fish_by_name: dict[str, Fish] = {}
+        self.fish_by_stats: dict[tuple, Fish] = {}
+        for fish in fish_data.values():
+            # 与线性查找一致，同名时取第一条
+            self.fish_by_name.setdefault(fish.name, fish)
+            self.fish_by_stats.setdefault((fish.exp, fish.std_power), fish)
+
+        self.common_fish = tuple(fish for fish in fish_data.values() if fish.id <= self.common_last_fish_id)
+        # 非 fever 时的基础鱼池
+        self.spawn_pool = tuple(fish for fish in self.common_fish if fish.base_probability > 0)
+        common_by_rarity = defaultdict(list)
+        for fish in self.common_fish:
+            common_by_rarity[fish.rarity].append(fish.id)
+        self.common_ids_by_rarity = {rarity: tuple(ids) for rarity, ids in common_by_rarity.items()}
+        # (rarity, topic) -> 鱼 id，包括 common 在内的所有 spawn_at
+        by_rarity_topic = defaultdict(list)
+        by_topic = defaultdict(list)
+        for fish in fish_data.values():
+            for topic in fish.spawn_at:
+                by_rarity_topic[(fish.rarity, topic)].append(fish.id)
+                by_topic[topic].append(fish)
+        self.fish_ids_by_rarity_topic = {key: tuple(ids) for key, ids in by_rarity_topic.items()}
+        self.fish_by_topic = {topic: tuple(fishes) for topic, fishes in by_topic.items()}
+        self.boss_candidates = tuple(fish for fish in fish_data.values() if fish.std_power == 333)
+
+        self.item_by_name: dict[str, FishItem] = {}
+        for item in fish_item.values():
+            self.item_by_name.setdefault(item.name, item)
+        self.buyable_items = tuple(item for item in fish_item.values() if item.buyable)
+        self.craftable_items = tuple(item for item in fish_item.values() if item.craftable)
+        # 不同的建筑需求组合，判断条件时每种组合只需检查一次
+        self.requirements = {self.requirement_key(item) for item in self.buyable_items + self.craftable_items}
+
+    @staticmethod
+    def requirement_key(item: FishItem) -> tuple:
+        return tuple(sorted(item.require.items()))
+
+    def fish_by_dict(self, obj: dict):
+        """按名字或 (exp, std_power) 匹配，结果与按 id 顺序线性查找相同"""
+        candidates = [
+            self.fish_by_name.get(obj.get('name')),
+            self.fish_by_stats.get((obj.get('exp'), obj.get('std_power'))),
+        ]
+        candidates = [fish for fish in candidates if fish is not None]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda fish: fish.id)
+
+    def common_ids(self, rarity) -> tuple:
+        return self.common_ids_by_rarity.get(rarity, ())
+
+    def topic_ids(self, rarity, topic) -> tuple:
+        return self.fish_ids_by_rarity_topic.get((rarity, topic), ())
+
+
+catalog = Catalog()
@@ -85,10 +85,8 @@ class Fish:
         if isinstance(obj, int):
             return fish_data.get(obj)
         elif isinstance(obj, dict):
-            for fish in fish_data.values():
-                if fish.name == obj.get('name') or (fish.exp == obj.get('exp') and fish.std_power == obj.get('std_power')):
-                    return fish
-            return None
+            from src.libraries.fishgame.catalog import catalog
+            return catalog.fish_by_dict(obj)
         else:
             return None
         
@@ -170,10 +168,8 @@ class FishItem:
             return fish_item.get(id)
         except ValueError:
             if isinstance(obj, str):
-                for item in fish_item.values():
-                    if item.name == obj:
-                        return item
-                return None
+                from src.libraries.fishgame.catalog import catalog
+                return catalog.item_by_name.get(obj)
         return None
         
     @property
@@ -314,6 +310,8 @@ class Equipment:
         slot = item.type
         if slot not in ['rod', 'tool', 'accessory']:
             return False
+        if self._player is not None:
+            self._player.invalidate_profile()
         if item.id == self.__data.get(slot, 0):
             # 再次装备则卸下
             self.__data[slot] = 0
@@ -462,26 +460,59 @@ class Backpack:
 
 # 记录以及图鉴功能
 class FishLog:
-    def __init__(self, data, shiny_data=None):
-        self.__data: list[int] = data
+    """图鉴记录：{fish_id(str): 捕获次数}，按第一次捕获的顺序排列，大小只和鱼的种类数有关。
+
+    旧数据是每次捕获追加一条的 id 列表，由 compact 转换。
+    """
+    def __init__(self, data: dict, shiny_data=None):
+        self.__data: dict[str, int] = data
         self.__shiny_data: list[int] = shiny_data if shiny_data is not None else []
+        self.__total = sum(data.values())
+
+    @staticmethod
+    def compact(data) -> dict:
+        """旧格式的列表转换为计数表，已经是计数表时原样返回"""
+        if isinstance(data, dict):
+            return data
+        counts = {}
+        for fish_id in data:
+            counts[str(fish_id)] = counts.get(str(fish_id), 0) + 1
+        return counts
 
     def add_log(self, fish_id: int, is_shiny: bool = False):
-        self.__data.append(fish_id)
+        key = str(fish_id)
+        self.__data[key] = self.__data.get(key, 0) + 1
+        self.__total += 1
         if is_shiny and fish_id not in self.__shiny_data:
             self.__shiny_data.append(fish_id)
 
+    def add_logs(self, fish_ids):
+        for fish_id in fish_ids:
+            self.add_log(fish_id)
+
     def __len__(self):
-        return len(self.__data)
+        return self.__total
     
     def __iter__(self):
-        return iter(self.__data)
+        # 同一种鱼连续产出，不再保留逐条捕获的先后顺序
+        for key, count in self.__data.items():
+            for _ in range(count):
+                yield int(key)
     
     def __getitem__(self, index):
-        return Fish.get(self.__data[index])
+        if index < 0:
+            index += self.__total
+        for key, count in self.__data.items():
+            if index < count:
+                return Fish.get(int(key))
+            index -= count
+        raise IndexError(index)
     
+    def count(self, fish_id: int) -> int:
+        return self.__data.get(str(fish_id), 0)
+
     def caught(self, fish_id: int):
-        return fish_id in self.__data
+        return str(fish_id) in self.__data
     
     def is_shiny(self, fish_id: int):
         """检查是否捕获过该鱼的异色版本"""
@@ -489,7 +520,7 @@ class FishLog:
     
     @property
     def caught_set(self):
-        return set(self.__data)
+        return {int(key) for key in self.__data}
 
     @property
     def shiny_set(self):
@@ -501,7 +532,7 @@ class FishLog:
 
     @property
     def items(self) -> list[Fish]:
-        return [Fish.get(fish_id) for fish_id in self.__data]
+        return [Fish.get(fish_id) for fish_id in self]
 
     
 
@@ -0,0 +1,199 @@
+import json
+import time
+from typing import Union
+
+import redis
+
+from src.data_access.redis import DictRedisData, register_script, write_behind, migrate_keys_to_hash, redis_global
+from src.libraries.fishgame.data import md5
+from src.libraries.fishgame.player import FishPlayer
+
+# 经济操作：在 Redis 端用一个脚本完成余额检查和修改，一次往返、原子执行。
+# 不需要先加载完整的玩家数据；传入已加载的 FishPlayer 时会同步它的本地字段。
+
+OK = 1
+INSUFFICIENT = 0
+MISSING = -1
+
+# KEYS: 参与的玩家
+# ARGV[1]: 时间戳；之后每个 key 依次三个参数：
+#   计数字段增量 {field: delta}、背包增量 {item_id: delta}、直接写入的字段 {field: json}
+# 任一计数字段或物品被扣到负数时整体不生效
+_apply_lua = """
+local pending = {}
+for i, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 0 then
+        return {-1, i}
+    end
+    local base = 1 + (i - 1) * 3
+    local incr = cjson.decode(ARGV[base + 1])
+    local items = cjson.decode(ARGV[base + 2])
+    local fields = cjson.decode(ARGV[base + 3])
+    local out = {}
+    for field, delta in pairs(incr) do
+        local value = tonumber(redis.call('HGET', key, field) or '0') + delta
+        if delta < 0 and value < 0 then
+            return {0, i}
+        end
+        out[field] = tostring(value)
+    end
+    if next(items) ~= nil then
+        local raw = redis.call('HGET', key, 'bag')
+        local bag = {}
+        if raw then
+            bag = cjson.decode(raw)
+        end
+        for item_id, delta in pairs(items) do
+            local count = (bag[item_id] or 0) + delta
+            if count < 0 then
+                return {0, i}
+            end
+            if count == 0 then
+                bag[item_id] = nil
+            else
+                bag[item_id] = count
+            end
+        end
+        if next(bag) == nil then
+            out['bag'] = '{}'
+        else
+            out['bag'] = cjson.encode(bag)
+        end
+    end
+    for field, payload in pairs(fields) do
+        out[field] = payload
+    end
+    out['updated_at'] = ARGV[1]
+    pending[i] = out
+end
+local reply = {1}
+for i, key in ipairs(KEYS) do
+    local flat = {}
+    for field, payload in pairs(pending[i]) do
+        flat[#flat + 1] = field
+        flat[#flat + 1] = payload
+    end
+    redis.call('HSET', key, unpack(flat))
+    reply[#reply + 1] = flat
+end
+return reply
+"""
+
+
+def _apply_local(client, keys, args):
+    """内嵌存储使用的等价实现，由存储层保证在一个事务里执行"""
+    pending = []
+    for i, key in enumerate(keys):
+        if not client.exists(key):
+            return [MISSING, i + 1]
+        incr, items, fields = (json.loads(arg) for arg in args[1 + i * 3:4 + i * 3])
+        out = {}
+        for field, delta in incr.items():
+            value = json.loads(client.hget(key, field) or '0') + delta
+            if delta < 0 and value < 0:
+                return [INSUFFICIENT, i + 1]
+            out[field] = json.dumps(value)
+        if items:
+            bag = json.loads(client.hget(key, 'bag') or '{}')
+            for item_id, delta in items.items():
+                count = bag.get(item_id, 0) + delta
+                if count < 0:
+                    return [INSUFFICIENT, i + 1]
+                if count == 0:
+                    bag.pop(item_id, None)
+                else:
+                    bag[item_id] = count
+            out['bag'] = json.dumps(bag, separators=(',', ':'))
+        out.update(fields)
+        out['updated_at'] = args[0]
+        pending.append(out)
+    reply = [OK]
+    for key, out in zip(keys, pending):
+        client.hset(key, mapping=out)
+        reply.append([v for pair in out.items() for v in pair])
+    return reply
+
+
+_apply_script = register_script(_apply_lua, _apply_local)
+
+Target = Union[DictRedisData, str, int]
+
+
+def _key(target: Target):
+    if isinstance(target, DictRedisData):
+        return target.key
+    return f'fishgame_user_data_{md5(str(target))}'
+
+
+def _call(keys, args):
+    try:
+        return _apply_script(keys=keys, args=args)
+    except redis.ResponseError as e:
+        if 'WRONGTYPE' not in str(e):
+            raise
+        # 还没迁移的 string 值，先转换成 hash 再执行
+        migrate_keys_to_hash(keys)
+        return _apply_script(keys=keys, args=args)
+
+
+def _run(targets: list[Target], changes: list[tuple]):
+    keys = [_key(target) for target in targets]
+    for key in keys:
+        write_behind.flush_key(key)
+    args = [int(time.time())]
+    for incr, items, fields in changes:
+        args.append(json.dumps(incr or {}))
+        args.append(json.dumps({str(k): v for k, v in (items or {}).items()}))
+        args.append(json.dumps({k: json.dumps(v) for k, v in (fields or {}).items()}))
+    res = _call(keys, args)
+    # 已归档的玩家先恢复再执行
+    while res[0] == MISSING and FishPlayer.restore([keys[res[1] - 1]]):
+        res = _call(keys, args)
+    if res[0] != OK:
+        return res[0]
+    # 经济操作也算活跃，渔力没有变化，活跃玩家索引只更新时间
+    redis_global.zadd(FishPlayer.active_index_key, {key: args[0] for key in keys})
+    for target, flat in zip(targets, res[1:]):
+        if isinstance(target, DictRedisData):
+            # 此时 key 一定已经是 hash，不能再按旧 string 值整体重写
+            target._legacy = False
+            for field, payload in zip(flat[::2], flat[1::2]):
+                target.data.reset(field, payload)
+    return OK
+
+
+def apply(target: Target, incr: dict = None, items: dict = None, fields: dict = None) -> int:
+    """原子修改一个玩家：incr 为计数字段增量（如 gold、score），items 为背包增量，fields 为直接写入的字段。
+
+    返回 OK / INSUFFICIENT（有字段或物品不足）/ MISSING（玩家不存在）
+    """
+    return _run([target], [(incr, items, fields)])
+
+
+def add_gold(target: Target, amount: int) -> bool:
+    return apply(target, incr={'gold': amount}) == OK
+
+
+def spend_gold(target: Target, amount: int) -> bool:
+    """余额不足时不扣除并返回 False"""
+    return apply(target, incr={'gold': -amount}) == OK
+
+
+def add_items(target: Target, items: dict) -> bool:
+    return apply(target, items=items) == OK
+
+
+def pop_items(target: Target, items: dict) -> bool:
+    """任一物品数量不足时都不扣除并返回 False"""
+    return apply(target, items={k: -v for k, v in items.items()}) == OK
+
+
+def transfer(giver: Target, receiver: Target, items: dict = None, gold: int = 0, giver_fields: dict = None) -> int:
+    """从 giver 转移物品和金币给 receiver，两边同时生效或都不生效，返回值同 apply。"""
+    items = items or {}
+    giver_incr = {'gold': -gold} if gold else None
+    receiver_incr = {'gold': gold} if gold else None
+    return _run([giver, receiver], [
+        (giver_incr, {k: -v for k, v in items.items()}, giver_fields),
+        (receiver_incr, items, None),
+    ])
@@ -1,24 +1,71 @@
+from bisect import bisect_right
 from collections import defaultdict
+from functools import cached_property
+from itertools import accumulate
 from typing import Optional
-from src.data_access.redis import DictRedisData, redis_global
+from src.data_access.redis import (DictRedisData, redis_global, write_behind, register_script,
+                                   HASH_WRITE_LUA, hash_write_args, apply_hash_write_local)
 from src.libraries.fishgame.data import *
 from src.libraries.fishgame.buildings import *
 from src.libraries.fishgame.player import FishPlayer
+from src.libraries.fishgame import economy
+from src.libraries.fishgame.sampling import AliasTable
+from src.libraries.fishgame.catalog import catalog
+from src.libraries.fishgame.timeline import Timeline, next_midnight, next_buff_expire
+from src.libraries.fishgame.timers import game_timers
+from src.libraries.fishgame.game_state import GameState, CONFLICT, revision_key, revision_prefix, new_revision, written_by_other
+import math
 import random
 import time
 
 
+# 抽卡奖池在加载时建好别名表
+gacha_table = AliasTable(gacha_data)
+mystery_gacha_table = AliasTable(mystery_gacha_data)
+
+def _game_write_local(client, keys, args):
+    current = client.get(keys[1])
+    if current is not None and current != args[0] and not current.startswith(args[1]):
+        return CONFLICT
+    apply_hash_write_local(client, keys[0], args[3:])
+    client.set(keys[1], args[2])
+    return 1
+
+
+# 群数据以读取时的修订号为条件写入，和 FishGame.stale 的判断一致：修订号被其他进程改过时不写入
+# KEYS: 群数据、修订号；ARGV: 读取时的修订号（没有时为空串）、本进程修订号的前缀、新修订号，之后为 hash_write_args 的参数
+_game_write_script = register_script(HASH_WRITE_LUA + """
+local current = redis.call('GET', KEYS[2])
+if current and current ~= ARGV[1] and string.sub(current, 1, #ARGV[2]) ~= ARGV[2] then
+    return 0
+end
+hash_write(KEYS[1], 3)
+redis.call('SET', KEYS[2], ARGV[3])
+return 1
+""", _game_write_local)
+
+
 class FishGame(DictRedisData):
+    # 刷鱼 tick、捕鱼、面板都会调用 save，合并 2 秒内的写入
+    write_behind_window = 2
+    hash_storage = True
+
     def __init__(self, group_id=0):
         self.group_id = group_id
         token = f'fishgame_group_data_{group_id}'
+        # 先读修订号再读数据，之后其他进程的写入都能被发现
+        write_behind.flush_key(token)
+        self.revision = redis_global.get(revision_key(group_id))
+        self._next_revision = None
+        # 写入时发现数据已被其他进程改过，本次改动已丢弃，需要重新加载
+        self.conflicted = False
         super().__init__(token, default=FishGame.default_group_data())
-        self.fish_log = FishLog(self.data["fish_log"])
         self.__average_power = 0
-        self.current_fish: Fish = None
-        self.current_fish_is_shiny: bool = False  # 当前鱼是否为异色
-        self.try_list = []
-        self.leave_time = 0
+        # 当前的鱼等临时状态，所有进程共享
+        self.state = GameState(group_id).load()
+        # 刷鱼概率表缓存 {power_scale: (输入, 鱼池, 概率, 累积概率)}
+        self._spawn_cache = {}
+        self._timeline = Timeline()
         self.init_buildings()
         
         # Load Oversea Battle if exists
@@ -28,6 +75,58 @@ class FishGame(DictRedisData):
         else:
             self.oversea_battle = None
 
+    def stage_hash_write(self, pipe, changed, deleted):
+        # 读取之后被其他进程写过时不覆盖对方的改动
+        self._next_revision = new_revision()
+        args = [self.revision or '', revision_prefix(), self._next_revision]
+        _game_write_script(keys=[self.key, revision_key(self.group_id)],
+                           args=args + hash_write_args(self._legacy, changed, deleted), client=pipe)
+
+    def finish(self, token, result):
+        if result == CONFLICT:
+            # 不提交，本地数据保持为未保存；ensure_game 看到 conflicted 后重新加载
+            self.conflicted = True
+            return
+        self.revision = self._next_revision
+        super().finish(token, result)
+
+    def write_conflicted(self) -> bool:
+        """群数据或港口战斗写入时发现已被其他进程改过，改动没有保存"""
+        return self.conflicted or (self.oversea_battle is not None and self.oversea_battle.conflicted)
+
+    def stale(self, revision) -> bool:
+        """群数据是否被其他进程改过，需要重新加载"""
+        return self.write_conflicted() or (revision != self.revision and written_by_other(revision))
+
+    @property
+    def current_fish(self) -> Optional[Fish]:
+        if self.state.fish_id is None:
+            return None
+        return Fish.get(self.state.fish_id)
+
+    @property
+    def current_fish_is_shiny(self) -> bool:
+        return self.state.shiny
+
+    @property
+    def try_list(self) -> list:
+        return self.state.try_list
+
+    @property
+    def leave_at(self) -> float:
+        return self.state.leave_at
+
+    def _set_current_fish(self, fish: Fish, shiny: bool, minutes):
+        self.state.fish_id = fish.id
+        self.state.shiny = shiny
+        self.state.try_list = []
+        self.state.leave_at = time.time() + minutes * 60
+        self.state.save()
+        game_timers.schedule(self.group_id, game_timers.LEAVE, self.state.leave_at)
+
+    def clear_current_fish(self):
+        self.state.clear()
+
     def init_buildings(self):
         # Buildings
         if 'big_pot' not in self.data:
@@ -66,6 +165,13 @@ class FishGame(DictRedisData):
             self.data['port'] = {}
         self.port = Port(self.data['port'])
 
+    @cached_property
+    def fish_log(self) -> FishLog:
+        if not isinstance(self.data['fish_log'], dict):
+            # 旧的逐条记录列表，用到时转换为计数表，下次保存时写回
+            self.data['fish_log'] = FishLog.compact(self.data['fish_log'])
+        return FishLog(self.data["fish_log"])
+
     @property
     def is_fever(self):
         return time.time() < self.data.get('fever_expire', 0)
@@ -73,7 +179,7 @@ class FishGame(DictRedisData):
     @staticmethod
     def default_group_data():
         return {
-            "fish_log": [],
+            "fish_log": {},
             "buff": [],
             "day": 0,
             "feed_time": 0,
@@ -87,47 +193,67 @@ class FishGame(DictRedisData):
         if self.is_fever:
             return list(map(Fish.get, self.data['fever_fishes']))
         else:
-            # 返回基础鱼池（来自fish_data_poke_ver.json的鱼，ID为1到len(fish_data_poke_ver)）
-            ret = []
-            for i in range(1, len(fish_data_poke_ver) + 1):
-                fish = Fish.get(i)
-                if fish is not None and fish.base_probability > 0:
-                    ret.append(fish)
-            return ret
+            # 基础鱼池（来自fish_data_poke_ver.json的鱼，ID为1到len(fish_data_poke_ver)）
+            return list(catalog.spawn_pool)
+
+    def _timeline_signature(self):
+        buff, avgp_buff = self.data.get('buff', []), self.data.get('avgp_buff', [])
+        return buff, len(buff), avgp_buff, len(avgp_buff), self.big_pot.level
 
     def refresh_buff(self):
-        for buff_key in ['buff', 'avgp_buff']:
-            self.data[buff_key] = list(filter(buff_available, self.data.get(buff_key, [])))
-        if self.data.get('day', 0) != time.localtime().tm_mday:
-            self.data['day'] = time.localtime().tm_mday
-            self.data['feed_time'] = 0
-        if self.big_pot.level > 0:
-            current_time = time.time()
+        """按时间戳结算 buff 到期、每日重置和大锅消耗；最早的到期时间之前、数据也没变时直接返回"""
+        current_time = time.time()
+        due = self._timeline.due(self._timeline_signature(), current_time)
+        if due is not None and not due:
+            return
+        changed = False
+        if due is None or 'buff' in due:
+            for buff_key in ['buff', 'avgp_buff']:
+                buffs = self.data.get(buff_key, [])
+                available = list(filter(buff_available, buffs))
+                if len(available) != len(buffs) or buff_key not in self.data:
+                    self.data[buff_key] = available
+                    changed = True
+            expire = min(filter(None, [next_buff_expire(self.data['buff']), next_buff_expire(self.data['avgp_buff'])]), default=0)
+            if expire:
+                self._timeline.schedule('buff', expire)
+        if due is None or 'day' in due:
+            if self.data.get('day', 0) != time.localtime(current_time).tm_mday:
+                self.data['day'] = time.localtime(current_time).tm_mday
+                self.data['feed_time'] = 0
+                changed = True
+            self._timeline.schedule('day', next_midnight(current_time))
+        if self.big_pot.level > 0 and (due is None or 'pot' in due):
             pot_consume_time = self.data.get('pot_consume_time', 0)
             if pot_consume_time == 0:
                 pot_consume_time = current_time + 600
-            while pot_consume_time < current_time:
-                pot_consume_time += 600
-                self.big_pot.consume()
-            self.data['pot_consume_time'] = pot_consume_time
+            if pot_consume_time < current_time:
+                # 每 600 秒消耗一次，直接算出错过的次数
+                times = math.ceil((current_time - pot_consume_time) / 600)
+                pot_consume_time += times * 600
+                self.big_pot.consume_many(times)
+            if pot_consume_time != self.data.get('pot_consume_time', 0):
+                self.data['pot_consume_time'] = pot_consume_time
+                changed = True
+            self._timeline.schedule('pot', pot_consume_time)
+        self._timeline.commit(self._timeline_signature())
+        if changed and self.big_pot.level > 0:
             self.save()
 
 
     def unlock_all(self):
-        self.data['fish_log'] += list(fish_data.keys())
+        self.fish_log.add_logs(fish_data.keys())
         self.save()
     
     def trigger_fever(self):
         minutes = random.randint(60, 120)
         self.data['fever_expire'] = time.time() + minutes * 60
-        common_last_fish_id = len(fish_data_poke_ver)
         current_topic: str = weekday_topic[time.localtime().tm_wday]
-        all_range = range(1, len(fish_data) + 1)
-        r_common = [i for i in all_range if i <= common_last_fish_id and Fish.get(i).rarity == 'R']
-        sr_common = [i for i in all_range if i <= common_last_fish_id and Fish.get(i).rarity == 'SR']
-        ssr_common = [i for i in all_range if i <= common_last_fish_id and Fish.get(i).rarity == 'SSR']
-        sr_fever = [i for i in all_range if Fish.get(i).rarity == 'SR' and current_topic in Fish.get(i).spawn_at]
-        ssr_fever = [i for i in all_range if Fish.get(i).rarity == 'SSR' and current_topic in Fish.get(i).spawn_at]
+        r_common = list(catalog.common_ids('R'))
+        sr_common = list(catalog.common_ids('SR'))
+        ssr_common = list(catalog.common_ids('SSR'))
+        sr_fever = list(catalog.topic_ids('SR', current_topic))
+        ssr_fever = list(catalog.topic_ids('SSR', current_topic))
         r_samples = random.sample(r_common, len(r_common) // 2)
         sr_samples = random.sample(sr_common, len(sr_common) // 2) + random.sample(sr_fever, len(sr_fever) // 2) 
         ssr_samples = random.sample(ssr_common, len(ssr_common) // 2) + random.sample(ssr_fever, len(ssr_fever) // 2) 
@@ -155,15 +281,12 @@ class FishGame(DictRedisData):
     def update_average_power(self, qq_list):
         p = 0
         count = 0
-        for qq in qq_list:
-            player = FishPlayer.try_get(qq)
-            if player is None or time.time() - player.updated_at > 86400:
-                continue
+        for power, fever_power in FishPlayer.active_powers(qq_list):
             # fever期间使用fever_power，否则使用普通power
             if self.is_fever:
-                p += player.fever_power
+                p += fever_power
             else:
-                p += player.power
+                p += power
             count += 1
         if count == 0:
             self.__average_power = self.big_pot.power_boost
@@ -178,40 +301,54 @@ class FishGame(DictRedisData):
         power += self.big_pot.average_power_boost
         return power
 
-    def count_down(self):
+    def check_leave(self, now=None):
+        """当前的鱼到了离开时间时清除，返回是否离开"""
         if self.current_fish is None:
             return False
-        self.leave_time -= 1
-        if self.leave_time == 0:
-            self.current_fish = None
-            self.current_fish_is_shiny = False
-            self.try_list = []
+        if (now or time.time()) >= self.leave_at:
+            self.clear_current_fish()
             return True
         return False
 
-    def simulate_spawn_fish(self):
-        self.refresh_buff()
-        # calculate base probability
-        fish_data_local = self.current_fish_pool
-        prob_dist = []
-        for fish in fish_data_local:
-            prob = fish.base_probability * (1 + self.get_buff_for_rarity(fish.rarity))
-            if self.is_fever:
+    def spawn_distribution(self, power_scale=15):
+        """返回 (鱼池, 每条鱼的出现概率, 累积概率)，概率总和可以小于 1，余下的部分为不出鱼。
+
+        结果只取决于 fever 状态、鱼料 buff、冰洞等级和平均 power，这些都没变时直接复用上次的结果。
+        """
+        fever = self.is_fever
+        average_power = self.average_power
+        key = (
+            fever,
+            average_power,
+            tuple(self.get_buff_for_rarity(rarity) for rarity in ('R', 'SR', 'SSR')),
+            (tuple(self.data['fever_fishes']), self.ice_hole.common_rate_down, self.ice_hole.special_rate_up) if fever else None,
+        )
+        cached = self._spawn_cache.get(power_scale)
+        if cached is not None and cached[0] == key:
+            return cached[1:]
+        pool = self.current_fish_pool
+        rarity_rate = dict(zip(('R', 'SR', 'SSR'), (1 + bonus for bonus in key[2])))
+        probs = []
+        for fish in pool:
+            prob = fish.base_probability * rarity_rate[fish.rarity]
+            if fever:
                 if 'common' in fish.spawn_at:
                     prob *= (1 - self.ice_hole.common_rate_down)
                 else:
                     prob *= (1 + self.ice_hole.special_rate_up)
-            prob_dist.append(prob)
-
-        all_prob = sum(prob_dist)
-        for i in range(len(prob_dist)):
-            power = fish_data_local[i].std_power
-            # 平均 power 每低于 std_power 5 点，概率乘 0.9
-            prob_dist[i] *= 0.9 ** max(0, (power - self.average_power) / 5)
-            # print(prob_dist[i])
-        # normalize
-        all_prob2 = sum(prob_dist)
-        prob_dist = list(map(lambda x: x * all_prob / all_prob2, prob_dist))
+            probs.append(prob)
+        all_prob = sum(probs)
+        # 平均 power 每低于 std_power power_scale 点，概率乘 0.9，之后保持总概率不变
+        weighted = [prob * 0.9 ** max(0, (fish.std_power - average_power) / power_scale) for fish, prob in zip(pool, probs)]
+        all_prob2 = sum(weighted)
+        probs = [x * all_prob / all_prob2 for x in weighted] if all_prob2 > 0 else weighted
+        cumulative = list(accumulate(probs))
+        self._spawn_cache[power_scale] = (key, pool, probs, cumulative)
+        return pool, probs, cumulative
+
+    def simulate_spawn_fish(self):
+        self.refresh_buff()
+        fish_data_local, prob_dist, _ = self.spawn_distribution(power_scale=5)
         s = ''
         for i in range(len(fish_data_local)):
             fish: Fish = fish_data_local[i]
@@ -223,44 +360,20 @@ class FishGame(DictRedisData):
         return s
 
     def spawn_fish(self):
-        fish_data_local = self.current_fish_pool
         self.refresh_buff()
         if self.current_fish is not None:
             return self.current_fish
-        # calculate base probability
-        prob_dist = []
-        for fish in fish_data_local:
-            prob = fish.base_probability * (1 + self.get_buff_for_rarity(fish.rarity))
-            if self.is_fever:
-                if 'common' in fish.spawn_at:
-                    prob *= (1 - self.ice_hole.common_rate_down)
-                else:
-                    prob *= (1 + self.ice_hole.special_rate_up)
-            prob_dist.append(prob)
-
-        all_prob = sum(prob_dist)
-        for i in range(len(prob_dist)):
-            power = fish_data_local[i].std_power
-            # 平均 power 每低于 std_power 5 点，概率乘 0.9
-            prob_dist[i] *= 0.9 ** max(0, (power - self.average_power) / 15)
-        # normalize
-        all_prob2 = sum(prob_dist)
-        prob_dist = list(map(lambda x: x * all_prob / all_prob2, prob_dist))
-        # random 0 - 1
-        r = random.random()
-        # print(f'random: {r}, target: {all_prob}')
-        for i in range(len(prob_dist)):
-            if r < prob_dist[i]:
-                self.current_fish = fish_data_local[i]
-                # 异色判定：根据七天神像等级
-                shiny_rate = self.seven_statue.shiny_rate
-                self.current_fish_is_shiny = random.random() < shiny_rate
-                self.fish_log.add_log(self.current_fish.id)
-                self.save()
-                self.leave_time = 2 if self.is_fever else 5
-                return self.current_fish
-            r -= prob_dist[i]
-        return None
+        fish_data_local, _, cumulative = self.spawn_distribution()
+        # 第一个累积概率大于 r 的鱼；r 超过总概率时不出鱼
+        i = bisect_right(cumulative, random.random())
+        if i == len(fish_data_local):
+            return None
+        # 异色判定：根据七天神像等级
+        shiny_rate = self.seven_statue.shiny_rate
+        self._set_current_fish(fish_data_local[i], random.random() < shiny_rate, 2 if self.is_fever else 5)
+        self.fish_log.add_log(self.current_fish.id)
+        self.save()
+        return self.current_fish
     
     def force_spawn_fish(self, fish_id_or_name: str):
         # 尝试通过ID获取鱼
@@ -269,18 +382,13 @@ class FishGame(DictRedisData):
             fish = Fish.get(fish_id)
         except ValueError:
             # 如果不是数字，则通过名字查找
-            fish = None
-            for fish1 in fish_data.values():
-                if fish1.name == fish_id_or_name:
-                    fish = fish1
+            fish = catalog.fish_by_name.get(fish_id_or_name)
         if fish is None:
             return None
-        self.current_fish = fish
-        self.current_fish_is_shiny = False  # 强制刷鱼默认非异色
-        self.try_list = []
+        # 强制刷鱼默认非异色
+        self._set_current_fish(fish, False, 5)
         self.fish_log.add_log(self.current_fish.id)
         self.save()
-        self.leave_time = 5
         return self.current_fish
 
     def catch_fish(self, player: FishPlayer, master_ball=False):
@@ -312,6 +420,7 @@ class FishGame(DictRedisData):
             }
 
         self.try_list.append(player.qq)
+        self.state.save()
         success_rate = 60
         skill_ctx = player.get_skill_context()
         # 主题渔力加成
@@ -348,6 +457,8 @@ class FishGame(DictRedisData):
         for i, buff in enumerate(player.data['buff']):
             if buff.get('time', 0) > 0:
                 player.data['buff'][i]['time'] -= 1
+        # 次数用完的 buff 立即移除，不等到期检查
+        player.data['buff'] = list(filter(lambda buff: buff.get('time', 999) > 0, player.data['buff']))
 
         if random.random() < success_rate / 100:
             # 异色判定：如果刷出来就是异色，直接使用；否则再次判定
@@ -440,9 +551,7 @@ class FishGame(DictRedisData):
                     keep_current_fish = True
                     msg += f"\n由于【再生力】的效果，{fish.name} 留了下来！"
                 if not keep_current_fish:
-                    self.current_fish = None
-                    self.current_fish_is_shiny = False
-                    self.try_list = []
+                    self.clear_current_fish()
             
             return {
                 "code": 0,
@@ -488,6 +597,7 @@ class FishGame(DictRedisData):
             
             if can_retry:
                 self.try_list.remove(player.qq)
+                self.state.save()
                 msg += f"\n由于【不屈】的效果，你可以再次尝试捕获！"
 
             # fever期间失败不会逃跑，只有非fever期间才会逃跑
@@ -499,9 +609,7 @@ class FishGame(DictRedisData):
                     'UR': 0
                 }
                 if random.random() < flee_rate[fish.rarity] + len(self.try_list) * 0.1:
-                    self.current_fish = None
-                    self.current_fish_is_shiny = False
-                    self.try_list = []
+                    self.clear_current_fish()
                     msg += f"\n{fish.name}【{fish.rarity}】逃走了..."
             
             return {
@@ -528,73 +636,75 @@ class FishGame(DictRedisData):
                 "code": -1,
                 "message": "金币不足"
             }
-        player.data['gold'] -= need_gold
-        result = []
-        
+        # 抽取结果先在本地汇总，最后和扣费一起原子写入
         # 如果是百连，使用堆叠显示
-        if hundred_time or thousand_time:
-            # 用于堆叠显示的字典
-            item_counts = {}  # {item_id: count}
-            score_total = 0
-            
-            for i in range(draw_count):
-                res = self.gacha_pick()
+        result, score_gain, item_gain = self.draw_gacha(gacha_table, draw_count, hundred_time or thousand_time)
+        
+        if economy.apply(player, incr={'gold': -need_gold, 'score': score_gain}, items=item_gain) != economy.OK:
+            return {
+                "code": -1,
+                "message": "金币不足"
+            }
+        return {
+            "code": 0,
+            "message": result
+        }
+    
+    def gacha_pick(self):
+        return gacha_table.pick()
+
+    @staticmethod
+    def draw_gacha(table: AliasTable, draw_count, stacked):
+        """抽取 draw_count 次，返回 (展示用的结果, 积分增量, 物品增量)。
+
+        stacked 时一次性抽出各奖励的次数并堆叠显示，否则逐条抽取、逐条显示。
+        """
+        result = []
+        score_gain = 0
+        item_gain = defaultdict(int)
+        if stacked:
+            item_counts = {}
+            for res, count in table.counts(draw_count):
                 if res['type'] == 'score':
-                    player.data['score'] += res['value']
-                    score_total += res['value']
-                elif res['type'] == 'item':
-                    item_id = res['value']
-                    player.bag.add_item(item_id)
-                    item_counts[item_id] = item_counts.get(item_id, 0) + 1
-            
+                    score_gain += res['value'] * count
+                else:
+                    item_counts[res['value']] = item_counts.get(res['value'], 0) + count
             # 添加积分到结果（如果有）
-            if score_total > 0:
+            if score_gain > 0:
                 result.append({
-                    "name": f"{score_total} 积分", 
+                    "name": f"{score_gain} 积分",
                     "description": "可以使用积分在积分商城兑换奖励",
                     "count": 1,
                     "is_score": True
                 })
-            
             # 添加物品到结果（堆叠显示）
-            for item_id, count in sorted(list(item_counts.items()), key=lambda x: x[0]):
+            for item_id, count in sorted(item_counts.items(), key=lambda x: x[0]):
+                item_gain[item_id] += count
                 item_data = FishItem.get(str(item_id)).data
                 item_data["count"] = count
                 item_data["is_score"] = False
                 result.append(item_data)
-        else:
-            # 普通单抽/十连，不堆叠显示
-            for i in range(draw_count):
-                res = self.gacha_pick()
-                if res['type'] == 'score':
-                    player.data['score'] += res['value']
-                    result.append({
-                        "name": f"{res['value']} 积分", 
-                        "description": "可以使用积分在积分商城兑换奖励",
-                        "count": 1,
-                        "is_score": True
-                    })
-                elif res['type'] == 'item':
-                    player.bag.add_item(FishItem.get(res['value']).id)
-                    item_data = FishItem.get(res['value']).data
-                    item_data["count"] = 1
-                    item_data["is_score"] = False
-                    result.append(item_data)
-        
-        player.save()
-        return {
-            "code": 0,
-            "message": result
-        }
-    
-    def gacha_pick(self):
-        all_weight = sum(map(lambda x: x['weight'], gacha_data))
-        r = random.random() * all_weight
-        for item in gacha_data:
-            if r < item['weight']:
-                return item
-            r -= item['weight']
-        return None
+            return result, score_gain, item_gain
+        # 普通单抽/十连，不堆叠显示
+        for _ in range(draw_count):
+            res = table.pick()
+            if res is None:
+                break
+            if res['type'] == 'score':
+                score_gain += res['value']
+                result.append({
+                    "name": f"{res['value']} 积分",
+                    "description": "可以使用积分在积分商城兑换奖励",
+                    "count": 1,
+                    "is_score": True
+                })
+            else:
+                item_gain[res['value']] += 1
+                item_data = FishItem.get(str(res['value'])).data
+                item_data["count"] = 1
+                item_data["is_score"] = False
+                result.append(item_data)
+        return result, score_gain, item_gain
 
     # ---------------- Mystery Gacha ----------------
     def mystery_gacha(self, player: FishPlayer, ten_time=False, hundred_time=False, thousand_time=False):
@@ -622,75 +732,33 @@ class FishGame(DictRedisData):
 
         if player.gold < need_gold:
             return {"code": -1, "message": "金币不足"}
-        player.data['gold'] -= need_gold
 
-        result = []
-        if hundred_time or thousand_time:
-            item_counts = {}
-            score_total = 0
-            for _ in range(draw_count):
-                res = self.mystery_gacha_pick()
-                if res['type'] == 'score':
-                    player.data['score'] += res['value']
-                    score_total += res['value']
-                else:  # item
-                    iid = res['value']
-                    player.bag.add_item(iid)
-                    item_counts[iid] = item_counts.get(iid, 0) + 1
-            if score_total > 0:
-                result.append({
-                    "name": f"{score_total} 积分",
-                    "description": "可以使用积分在积分商城兑换奖励",
-                    "count": 1,
-                    "is_score": True
-                })
-            for iid, cnt in sorted(item_counts.items(), key=lambda x: x[0]):
-                data = FishItem.get(str(iid)).data
-                data['count'] = cnt
-                data['is_score'] = False
-                result.append(data)
-        else:
-            for _ in range(draw_count):
-                res = self.mystery_gacha_pick()
-                if res['type'] == 'score':
-                    player.data['score'] += res['value']
-                    result.append({
-                        "name": f"{res['value']} 积分",
-                        "description": "可以使用积分在积分商城兑换奖励",
-                        "count": 1,
-                        "is_score": True
-                    })
-                else:
-                    iid = res['value']
-                    player.bag.add_item(iid)
-                    data = FishItem.get(str(iid)).data
-                    data['count'] = 1
-                    data['is_score'] = False
-                    result.append(data)
-        player.save()
+        result, score_gain, item_gain = self.draw_gacha(mystery_gacha_table, draw_count, hundred_time or thousand_time)
+        if economy.apply(player, incr={'gold': -need_gold, 'score': score_gain}, items=item_gain) != economy.OK:
+            return {"code": -1, "message": "金币不足"}
         return {"code": 0, "message": result}
 
     def mystery_gacha_pick(self):
-        all_weight = sum(map(lambda x: x['weight'], mystery_gacha_data))
-        if all_weight <= 0:
-            return None
-        r = random.random() * all_weight
-        for item in mystery_gacha_data:
-            if r < item['weight']:
-                return item
-            r -= item['weight']
-        return None
+        return mystery_gacha_table.pick()
 
     def get_shop(self):
-        return list(filter(lambda x: x.buyable and self.can_buy(x.id)['code'] == 0, fish_item.values()))
+        return self._filter_by_requirements(catalog.buyable_items)
     
+    def _filter_by_requirements(self, items):
+        # 同样的建筑需求只检查一次
+        passed = {key: self._check_require(dict(key))[0] for key in catalog.requirements}
+        return [item for item in items if passed[catalog.requirement_key(item)]]
+
     def check_requirements(self, item: FishItem):
-        for building_name in item.require:
+        return self._check_require(item.require)
+
+    def _check_require(self, require: dict):
+        for building_name in require:
             building: BuildingBase = getattr(self, building_name, None)
             if building is None or not isinstance(building, BuildingBase):
                 continue
-            if building.level < item.require[building_name]:
-                return False, f"{building.name} 等级不足，无法购买或合成该物品（需要 {building.name} {item.require[building_name]} 级）"
+            if building.level < require[building_name]:
+                return False, f"{building.name} 等级不足，无法购买或合成该物品（需要 {building.name} {require[building_name]} 级）"
         return True, ""
 
     def can_buy(self, id):
@@ -731,9 +799,11 @@ class FishGame(DictRedisData):
         can_buy = self.can_buy(id)
         if can_buy['code'] != 0:
             return can_buy
-        player.data['gold'] -= good.price
-        player.bag.add_item(good.id, 1)
-        player.save()
+        if economy.apply(player, incr={'gold': -good.price}, items={good.id: 1}) != economy.OK:
+            return {
+                "code": -1,
+                "message": "金币不足"
+            }
         return {
             "code": 0,
             "message": f"购买 {good.name} 成功"
@@ -780,21 +850,18 @@ class FishGame(DictRedisData):
                 "message": "您没有该物品"
             }
         
-        # 检查接收者是否存在
-        receiver = FishPlayer.from_id(receiver_qq)
-        if receiver is None:
+        # 扣除、发放和冷却时间在一个脚本里完成，接收者不需要加载
+        ret = economy.transfer(giver, receiver_qq, items={item_id: 1}, giver_fields={'last_gift_time': current_time})
+        if ret == economy.MISSING:
             return {
                 "code": -5,
                 "message": "接收者未找到，请确保对方已开始游戏"
             }
-        
-        # 执行赠送
-        giver.bag.consume_items({item_id: 1})
-        receiver.bag.add_item(item_id, 1)
-        giver.data['last_gift_time'] = current_time
-        
-        giver.save()
-        receiver.save()
+        if ret == economy.INSUFFICIENT:
+            return {
+                "code": -4,
+                "message": "您没有该物品"
+            }
         
         return {
             "code": 0,
@@ -804,7 +871,7 @@ class FishGame(DictRedisData):
     
     def get_status(self):
         self.refresh_buff()
-        s = f'当前池子平均渔力 {self.average_power:.1f}，已经来过 {len(self.data['fish_log'])} 条鱼了'
+        s = f'当前池子平均渔力 {self.average_power:.1f}，已经来过 {len(self.fish_log)} 条鱼了'
 
         for buff in self.data['avgp_buff']:
             remaining_time = buff['expire'] - time.time()
@@ -1133,6 +1200,7 @@ class FishGame(DictRedisData):
             player.bag.pop_item(25)
             player.bag.pop_item(accessory_id)
             del player.data['accessory_meta'][str(accessory_id)]
+            player.invalidate_profile()
             player.renew_accessory += 1
 
             r = random.random()
@@ -1288,7 +1356,7 @@ class FishGame(DictRedisData):
     
     def get_craftable_items(self):
         """获取所有可合成的物品"""
-        return [item for item in fish_item.values() if item.craftable and self.check_requirements(item)[0]]
+        return self._filter_by_requirements(catalog.craftable_items)
     
     def craft_item(self, player: FishPlayer, item_id: int):
         """合成物品"""
@@ -1404,6 +1472,7 @@ class FishGame(DictRedisData):
                 if remaining_sp <= 0:
                     break
             meta_store[str(allocated_id)] = {'base_id': item_id, 'skills': skills_list}
+            player.invalidate_profile()
             player.bag.add_item(str(allocated_id), 1)
         else:
             player.bag.add_item(item_id, 1)
@@ -1520,6 +1589,9 @@ class FishGame(DictRedisData):
         # 执行升级
         if building.upgrade():
             self.save()
+            if building is self.port:
+                # 港口等级决定能否出现港口怪物，不用等到下一个整点
+                game_timers.schedule(self.group_id, game_timers.OVERSEA_SPAWN, time.time())
             return {
                 "code": 0,
                 "message": f"{building.name} 已升级至 Lv.{building.level}"
@@ -1557,8 +1629,11 @@ class FishGame(DictRedisData):
                 "code": "-1",
                 "message": f"你没有道具 {item.name}"
             }
-        player.bag.pop_item(item.id, new_item_consume)
-        player.save()
+        if not economy.pop_items(player, {item.id: new_item_consume}):
+            return {
+                "code": "-1",
+                "message": f"你没有道具 {item.name}"
+            }
         vol = new_item_consume * item_volume
         pot.current = min(pot.current + vol, pot.capacity)
         self.save()
@@ -1740,8 +1815,9 @@ class FishGame(DictRedisData):
             monster_drops = fish_data[monster_id].drops
         player_damage_map = battle.data.get('player_damage', {})
         
+        loaded = FishPlayer.load_many(battle.data['players'])
         for qq in battle.data['players']:
-            player = FishPlayer(qq)
+            player = loaded.get(qq) or FishPlayer(qq)
             player_name = battle.data.get('player_names', {}).get(str(qq), player.name)
             player_skill_ctx = player.get_skill_context()
             
@@ -1862,7 +1938,12 @@ class FishGame(DictRedisData):
             res['logs'].extend(self._settle_oversea_rewards(True))
         elif res['status'] == 'fail':
             res['logs'].extend(self._settle_oversea_rewards(False))
-            
+
+        if res['status'] == 'fighting':
+            game_timers.schedule(self.group_id, game_timers.OVERSEA_ROUND, time.time() + 180)
+        else:
+            # 战斗结束后本小时内仍可能出现新的怪物
+            game_timers.schedule(self.group_id, game_timers.OVERSEA_SPAWN, time.time())
         return res
 
     def join_oversea(self, player: FishPlayer, nickname: str = None):
@@ -1961,11 +2042,14 @@ class FishGame(DictRedisData):
             
         # 扣除次数
         players_obj = []
+        loaded = FishPlayer.load_many(self.oversea_battle.data['players'])
         for qq in self.oversea_battle.data['players']:
-            p = FishPlayer(qq)
+            p = loaded.get(qq) or FishPlayer(qq)
             p.data['raid_count'] = p.data.get('raid_count', 0) + 1
             p.save()
             players_obj.append(p)
             
         self.oversea_battle.start_battle(players_obj, self.oversea_battle.data['loadouts'])
+        # 每 3 分钟推进一轮
+        game_timers.schedule(self.group_id, game_timers.OVERSEA_ROUND, time.time() + 180)
         return {"code": 0, "message": "战斗开始！"}
\ No newline at end of file
@@ -1,5 +1,6 @@
 from PIL import Image, ImageDraw, ImageFont
 from src.libraries.fishgame.data import FishItem, Fish, Backpack, get_skill, fish_skills
+from src.libraries.fishgame.catalog import catalog
 from src.libraries.fishgame.fishgame import FishPlayer, FishGame, talent_data
 from src.libraries.fishgame.buildings import *
 import math
@@ -317,13 +318,7 @@ def create_pokedex_content(draw, player: FishPlayer, game: FishGame, font_dict,
         draw.text((60, group_y_start), f"今日鱼群主题: {today_topic}", fill=(189, 147, 249), font=header_font)
         
         # 获取今日主题的鱼
-        today_theme_fish = []
-        for fish_id, fish in fish_data.items():
-            if fish_id > base_fish_count and today_topic in fish.spawn_at:
-                today_theme_fish.append(fish)
-        
-        # 按ID排序
-        today_theme_fish.sort(key=lambda f: f.id)
+        today_theme_fish = [fish for fish in catalog.fish_by_topic.get(today_topic, ()) if fish.id > base_fish_count]
         
         # 显示今日主题鱼 (每排4个)
         for i, fish in enumerate(today_theme_fish):
@@ -1300,6 +1295,8 @@ def create_oversea_panel(game: FishGame):
     else:
         # 分列显示
         col_width = width // 2
+        from src.libraries.fishgame.fishgame import FishPlayer, FishItem
+        loaded = FishPlayer.load_many(players)
         for i, qq in enumerate(players):
             col = i % 2
             row = i // 2
@@ -1307,8 +1304,7 @@ def create_oversea_panel(game: FishGame):
             y = y_offset + row * 30
             
             # 获取玩家名字和装备
-            from src.libraries.fishgame.fishgame import FishPlayer, FishItem
-            p = FishPlayer(qq)
+            p = loaded.get(qq) or FishPlayer(qq)
             
             # Use nickname if available
             player_name = battle.data.get('player_names', {}).get(str(qq), p.name)
@@ -0,0 +1,99 @@
+import itertools
+import json
+import os
+import socket
+import time
+import uuid
+from src.data_access.redis import redis_global, register_script
+
+# 每个进程的标识，写入群数据时记在修订号里，用来判断缓存的 FishGame 是否被其他进程改过
+PROCESS_ID = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+_revision_counter = itertools.count(1)
+
+
+def revision_key(group_id) -> str:
+    return f'fishgame_group_rev_{group_id}'
+
+
+def revision_prefix() -> str:
+    """本进程写入的修订号都以它开头"""
+    return f'{PROCESS_ID}:'
+
+
+def new_revision() -> str:
+    return f'{revision_prefix()}{next(_revision_counter)}'
+
+
+def written_by_other(revision) -> bool:
+    return revision is not None and not revision.startswith(revision_prefix())
+
+
+# 以修订号为条件写入的脚本的返回值：修订号已被其他进程改过，没有写入
+CONFLICT = 0
+
+
+def _guarded_set_local(client, keys, args):
+    current = client.get(keys[1])
+    if current is not None and current != args[0] and not current.startswith(args[1]):
+        return CONFLICT
+    client.set(keys[0], args[3])
+    client.set(keys[1], args[2])
+    return 1
+
+
+# 挂在群上的 string 数据（港口战斗）和群数据使用同样的修订号检查
+# KEYS: 数据、修订号；ARGV: 读取时的修订号（没有时为空串）、本进程修订号的前缀、新修订号、值
+guarded_set_script = register_script("""
+local current = redis.call('GET', KEYS[2])
+if current and current ~= ARGV[1] and string.sub(current, 1, #ARGV[2]) ~= ARGV[2] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[4])
+redis.call('SET', KEYS[2], ARGV[3])
+return 1
+""", _guarded_set_local)
+
+
+class GameState:
+    """当前的鱼、是否异色、尝试过的玩家和离开时间。
+
+    这些状态只存在内存里时多个进程看到的鱼各不相同，因此保存在 Redis 中，鱼离开后自动过期。
+    """
+    def __init__(self, group_id):
+        self.key = f'fishgame_group_state_{group_id}'
+        self.fish_id = None
+        self.shiny = False
+        self.try_list: list = []
+        self.leave_at = 0
+
+    def load(self, raw=None, fetched=False):
+        """raw 为已经取回的值；fetched 为 False 时从 Redis 读取"""
+        if not fetched:
+            raw = redis_global.get(self.key)
+        data = json.loads(raw) if raw else {}
+        self.fish_id = data.get('fish')
+        self.shiny = data.get('shiny', False)
+        self.try_list = data.get('try_list', [])
+        self.leave_at = data.get('leave_at', 0)
+        return self
+
+    def save(self):
+        if self.fish_id is None:
+            redis_global.delete(self.key)
+            return
+        payload = json.dumps({
+            'fish': self.fish_id,
+            'shiny': self.shiny,
+            'try_list': self.try_list,
+            'leave_at': self.leave_at,
+        })
+        # 离开时间之后再留一分钟，等离开事件处理完
+        ttl = max(1, int(self.leave_at - time.time()) + 60)
+        redis_global.set(self.key, payload, ex=ttl)
+
+    def clear(self):
+        self.fish_id = None
+        self.shiny = False
+        self.try_list = []
+        self.leave_at = 0
+        self.save()
@@ -9,18 +9,27 @@
 # 3 级怪物 50% 概率只有 1 个 Buff，20% 概率有 2 个 Buff，10% 概率有 3 个 Buff
 
 from typing import List, Dict, TYPE_CHECKING, Optional
-from src.data_access.redis import DictRedisData
+from src.data_access.redis import DictRedisData, Compression, redis_global
 import random
-from src.libraries.fishgame.data import Fish, fish_data, FishItem
+from src.libraries.fishgame.data import Fish, FishItem
+from src.libraries.fishgame.catalog import catalog
+from src.libraries.fishgame.game_state import CONFLICT, guarded_set_script, revision_key, revision_prefix, new_revision
 
 if TYPE_CHECKING:
     from src.libraries.fishgame.fishgame import FishPlayer
 
 class OverseaBattle(DictRedisData):
+    # 战斗日志会越积越长
+    compression = Compression()
+
     def __init__(self, group_id: int, battle_id: int, difficulty: int = 1, port_level: int = 1):
         self.group_id = group_id
         self.battle_id = battle_id
         token = f'fishgame_oversea_battle_{group_id}_{battle_id}'
+        # 和 FishGame 一样先读群的修订号，写入时以它为条件
+        self.revision = redis_global.get(revision_key(group_id))
+        self._next_revision = None
+        self.conflicted = False
         default = {
             "status": "idle",  # idle, fighting, success, fail
             "players": [],     # List[str] (qq)
@@ -51,12 +60,27 @@ class OverseaBattle(DictRedisData):
         if self.data['monster_id'] == 0:
             self._init_monster()
 
+    def stage(self, pipe):
+        # 战斗数据挂在群上，和群数据一样以修订号为条件写入，并更新修订号让其他进程重新加载
+        payload = self.dirty_payload()
+        if payload is None:
+            return None
+        self._next_revision = new_revision()
+        guarded_set_script(keys=[self.key, revision_key(self.group_id)],
+                           args=[self.revision or '', revision_prefix(), self._next_revision, payload], client=pipe)
+        return payload
+
+    def finish(self, token, result):
+        if result == CONFLICT:
+            # 不提交，FishGame.write_conflicted 为真，ensure_game 会重新加载群和战斗
+            self.conflicted = True
+            return
+        self.revision = self._next_revision
+        super().finish(token, result)
+
     def _init_monster(self):
         # 随机选择怪物
-        boss_candidates = []
-        for id, fish in fish_data.items():
-            if fish.std_power == 333:
-                boss_candidates.append(fish)
+        boss_candidates = catalog.boss_candidates
         
         if not boss_candidates:
             return
@@ -241,16 +265,18 @@ class OverseaBattle(DictRedisData):
         
         # 计算队长全队增伤 (Skill 15)
         team_damage_bonus = 0.0
+        # 一次取回全部队员
+        loaded = FishPlayer.load_many(self.data['players'])
         if self.data['players']:
             captain_qq = self.data['players'][0]
-            captain = FishPlayer(captain_qq)
+            captain = loaded.get(captain_qq) or FishPlayer(captain_qq)
             captain_ctx = captain.get_skill_context()
             team_damage_bonus = captain_ctx.get('oversea_1st_damage_boost', 0) / 100.0
             
         monster_fish = Fish.get(self.data['monster_id'])
 
         for i, qq in enumerate(self.data['players']):
-            player = FishPlayer(qq)
+            player = loaded.get(qq) or FishPlayer(qq)
             player_name = player_names.get(str(qq), player.name)
             item_id = self.data['loadouts'].get(str(qq)) or self.data['loadouts'].get(int(qq))
             qq_key = str(qq)
@@ -1,40 +1,230 @@
+import json
 import time
 from collections import defaultdict
+from functools import cached_property
 from typing import Optional
-from src.data_access.redis import DictRedisData, redis_global
+from src.data_access.redis import DictRedisData, Compression, NOT_FETCHED, redis_global
 from src.libraries.fishgame.data import *
 from src.libraries.fishgame.buildings import *
+from src.libraries.fishgame.timeline import Timeline, next_buff_expire
+
+class PlayerView:
+    """FishPlayer.iter_players 按字段投影的结果，只读"""
+    __slots__ = ('hash', 'data')
+
+    def __init__(self, hash, data):
+        self.hash = hash
+        self.data = data
+
+    def get(self, field, default=None):
+        return self.data.get(field, default)
+
+
+class CombatProfile:
+    """由等级、装备、配件技能和天赋编译出的战斗数据，不含会随时间变化的 buff。
+
+    version 对应生成时玩家的 profile 版本，版本变化后需要重新生成。
+    """
+    __slots__ = ('version', 'base_power', 'fever_base_power', 'ground_bonus', 'skill_ctx', 'equipped_skills', 'talent_levels')
+
+    def __init__(self, player: 'FishPlayer', version: int):
+        self.version = version
+        self.equipped_skills = player.get_equipped_skill_dict()
+        self.skill_ctx = player.build_skill_context(self.equipped_skills)
+        self.talent_levels = {talent_id: player.get_talent_level(talent_id) for talent_id in range(1, len(talent_data) + 1)}
+        items = [item for item in player.equipment.items if item]
+        self.base_power = player.level
+        for item in items:
+            self.base_power += item.power
+        self.fever_base_power = player.level // 5
+        for item in items:
+            if item.type == 'rod' and not item.ignore_fever:
+                self.fever_base_power += item.power // 2
+            elif item.id == 406:
+                self.fever_base_power += item.power + 25
+            else:
+                self.fever_base_power += item.power
+        self.ground_bonus = self._ground_bonus()
+
+    def _ground_bonus(self):
+        """技能 25：大地属性暴击几率按比例转换为渔力"""
+        ratio = self.skill_ctx.get('extra_power_from_ground', 0)
+        if ratio <= 0:
+            return 0
+        ground_level = self.talent_levels.get(7, 0)
+        if ground_level <= 0:
+            return 0
+        ground_attr_percent = 5 * ground_level
+        return ground_attr_percent * ratio / 100.0
+
 
 class FishPlayer(DictRedisData):
-    def __init__(self, qq, hash=''):
+    # 按字段存储：捕鱼、抽卡只会写回实际改动过的字段
+    hash_storage = True
+    # accessory_meta 等字段可能很大，压缩后写入；economy 脚本读写的字段保持 JSON
+    compression = Compression()
+    script_fields = ('gold', 'score', 'bag')
+    # 长期不活跃的玩家归档到这里，再次访问时自动恢复
+    archive_key = 'fishgame_player_archive'
+    # 活跃玩家索引：ZSET 按最后活跃时间排序，hash 记录 {key: [不含 buff 的 power, fever_power, buff 列表]}，保存时顺带更新
+    active_index_key = 'fishgame_active_players'
+    power_index_key = 'fishgame_player_power'
+    power_index_built_key = 'fishgame_power_index_built'
+    active_window = 86400
+
+    def __init__(self, qq, hash='', prefetched=NOT_FETCHED):
         self.qq = qq
         token = f'fishgame_user_data_{md5(str(qq)) if hash == "" else hash}'
-        super().__init__(token, default=FishPlayer.default_user_data())
+        super().__init__(token, default=FishPlayer.default_user_data(), prefetched=prefetched)
+        # 装备、配件技能、天赋或等级变化时加一，CombatProfile 随之重新生成
+        self.profile_version = 0
+        self._profile: Optional[CombatProfile] = None
+        self._timeline = Timeline()
         self.bag = Backpack(self.data['bag'], self)
-        # 确保兼容旧玩家数据
-        if 'shiny_fish_log' not in self.data:
-            self.data['shiny_fish_log'] = []
-        self.fish_log = FishLog(self.data['fish_log'], self.data['shiny_fish_log'])
         self.equipment = Equipment(self.data['equipment'], self)
         # 配件实例数据： { item_id(str): {"skills": [{id, level}, ...], "base_id": int} }
         if 'accessory_meta' not in self.data:
             self.data['accessory_meta'] = {}
 
+    @cached_property
+    def fish_log(self) -> FishLog:
+        # 图鉴记录较大，用到时才反序列化
+        # 确保兼容旧玩家数据
+        if 'shiny_fish_log' not in self.data:
+            self.data['shiny_fish_log'] = []
+        if not isinstance(self.data['fish_log'], dict):
+            # 旧的逐条记录列表，用到时转换为计数表，下次保存时写回
+            self.data['fish_log'] = FishLog.compact(self.data['fish_log'])
+        return FishLog(self.data['fish_log'], self.data['shiny_fish_log'])
+
     @staticmethod
     def all_players():
-        data = []
-        for player in redis_global.scan_iter(f'fishgame_user_data_*'):
-            hash = player.split('_')[-1]
-            data.append(FishPlayer(-1, hash))
-        return data
+        return list(FishPlayer.iter_players())
+
+    @staticmethod
+    def iter_players(batch_size=500, fields=None):
+        """逐个产出所有玩家，每批一次 pipeline。
+
+        fields 为 None 时产出完整的 FishPlayer（qq 为 -1）；
+        指定字段时产出只含这些字段的 PlayerView，适合遍历全体玩家的统计任务。
+        """
+        for key, value in FishPlayer.iter_raw('fishgame_user_data_*', batch_size, fields):
+            hash = key.split('_')[-1]
+            if fields is None:
+                yield FishPlayer(-1, hash, prefetched=value)
+            else:
+                yield PlayerView(hash, value)
+
+    @staticmethod
+    def load_many(qq_list) -> dict:
+        """一次 pipeline 加载多名玩家，返回 {qq: FishPlayer}，顺序与传入一致，不存在的玩家会被跳过"""
+        qq_list = list(dict.fromkeys(qq_list))
+        raws = FishPlayer.fetch_raw(f'fishgame_user_data_{md5(str(qq))}' for qq in qq_list)
+        return {qq: FishPlayer(qq, prefetched=raw) for qq, raw in zip(qq_list, raws) if raw is not None}
 
     @staticmethod
     def try_get(qq):
         token = f'fishgame_user_data_{md5(str(qq))}'
-        if redis_global.get(token) == None:
+        if not FishPlayer.exists(token):
             return None
         return FishPlayer(qq)
 
+    @staticmethod
+    def archive_inactive(days) -> int:
+        """把超过 days 天没有变化的玩家移入归档，不再出现在 iter_players 等全量遍历中"""
+        return FishPlayer.archive_idle('fishgame_user_data_*', days * 86400)
+
+    def stage(self, pipe):
+        token = super().stage(pipe)
+        if token is not None:
+            self.stage_power_index(pipe)
+        return token
+
+    def stage_power_index(self, pipe):
+        # 存不含 buff 的渔力和各个 buff 的 [渔力, 到期时间]，读取时只加上还没到期的，buff 过期后索引不会偏高；
+        # 按次数计的 buff 只会在捕鱼时用完，那时会随保存更新
+        buff_power = sum(buff.get('power', 0) for buff in self.buff)
+        buffs = [[buff['power'], buff.get('expire', 0)] for buff in self.buff if buff.get('power', 0) and buff_available(buff)]
+        pipe.zadd(FishPlayer.active_index_key, {self.key: self.data['updated_at']})
+        pipe.hset(FishPlayer.power_index_key, self.key,
+                  json.dumps([self.power - buff_power, self.fever_power - buff_power, buffs]))
+
+    @staticmethod
+    def _indexed_power(payload, now) -> tuple:
+        power, fever_power, *rest = json.loads(payload)
+        for buff_power, expire in (rest[0] if rest else []):
+            if expire == 0 or expire > now:
+                power += buff_power
+                fever_power += buff_power
+        return power, fever_power
+
+    @staticmethod
+    def active_powers(qq_list) -> list[tuple]:
+        """qq_list 中最近 active_window 秒内活跃过的玩家的 (power, fever_power)。
+
+        用 ZMSCORE 只查这些玩家在活跃索引中的时间，耗时和群人数有关，与全体活跃玩家数无关；
+        索引里缺少渔力的玩家加载一次后补上。
+        """
+        FishPlayer.ensure_power_index()
+        keys = [f'fishgame_user_data_{md5(str(qq))}' for qq in dict.fromkeys(qq_list)]
+        if not keys:
+            return []
+        now = time.time()
+        since = int(now) - FishPlayer.active_window
+        scores = redis_global.zmscore(FishPlayer.active_index_key, keys)
+        keys = [key for key, score in zip(keys, scores) if score is not None and score >= since]
+        if not keys:
+            return []
+        result = []
+        missing = []
+        for key, payload in zip(keys, redis_global.hmget(FishPlayer.power_index_key, keys)):
+            if payload is None:
+                missing.append(key)
+            else:
+                result.append(FishPlayer._indexed_power(payload, now))
+        if missing:
+            pipe = redis_global.pipeline(transaction=False)
+            for key, raw in zip(missing, FishPlayer.fetch_raw(missing)):
+                if raw is None:
+                    pipe.zrem(FishPlayer.active_index_key, key)
+                    continue
+                player = FishPlayer(-1, key.split('_')[-1], prefetched=raw)
+                result.append((player.power, player.fever_power))
+                player.stage_power_index(pipe)
+            pipe.execute()
+        return result
+
+    @staticmethod
+    def ensure_power_index():
+        """索引没有建立过时（首次部署）从全体玩家重建。
+
+        没有活跃玩家时 Redis 会删掉空的 ZSET，所以是否建立过单独记在 power_index_built_key 里
+        """
+        if redis_global.exists(FishPlayer.power_index_built_key):
+            return
+        since = int(time.time()) - FishPlayer.active_window
+        pipe = redis_global.pipeline(transaction=False)
+        for view in FishPlayer.iter_players(fields=['updated_at']):
+            updated_at = view.get('updated_at') or 0
+            if updated_at >= since:
+                # 渔力留空，用到时再加载计算
+                pipe.zadd(FishPlayer.active_index_key, {f'fishgame_user_data_{view.hash}': updated_at})
+        pipe.set(FishPlayer.power_index_built_key, int(time.time()))
+        pipe.execute()
+
+    @staticmethod
+    def trim_power_index() -> int:
+        """移除超出活跃窗口的索引项"""
+        since = int(time.time()) - FishPlayer.active_window
+        stale = redis_global.zrangebyscore(FishPlayer.active_index_key, '-inf', since - 1)
+        if not stale:
+            return 0
+        pipe = redis_global.pipeline(transaction=False)
+        pipe.zremrangebyscore(FishPlayer.active_index_key, '-inf', since - 1)
+        pipe.hdel(FishPlayer.power_index_key, *stale)
+        pipe.execute()
+        return len(stale)
+
     @staticmethod
     def default_user_data():
         return {
@@ -43,7 +233,7 @@ class FishPlayer(DictRedisData):
             "exp": 0,
             "gold": 0,
             "score": 0,
-            "fish_log": [],
+            "fish_log": {},
             "shiny_fish_log": [],  # 异色鱼记录
             "bag": {"1": 1},  # 修改为字典格式: {item_id: count}
             "buff": [],
@@ -57,7 +247,15 @@ class FishPlayer(DictRedisData):
         }
 
     def refresh_buff(self):
+        """只在最早的 buff 到期之后、或 buff 列表变化时才重新过滤"""
+        due = self._timeline.due((self.data['buff'], len(self.data['buff'])))
+        if due is not None and not due:
+            return
         self.data['buff'] = list(filter(buff_available, self.data['buff']))
+        expire = next_buff_expire(self.data['buff'])
+        if expire:
+            self._timeline.schedule('buff', expire)
+        self._timeline.commit((self.data['buff'], len(self.data['buff'])))
     
     @property
     def name(self):
@@ -113,70 +311,54 @@ class FishPlayer(DictRedisData):
     def master_ball_crafts(self, value):
         self.data['master_ball_crafts'] = value
     
+    @property
+    def profile(self) -> CombatProfile:
+        if self._profile is None or self._profile.version != self.profile_version:
+            self._profile = CombatProfile(self, self.profile_version)
+        return self._profile
+
+    def invalidate_profile(self):
+        self.profile_version += 1
+
     @property
     def power(self):
         # 基础：等级作微量基础值（原逻辑保留）
-        base = self.level
-        for item in self.equipment.items:
-            if item:
-                base += item.power
+        profile = self.profile
+        base = profile.base_power
         for buff in self.buff:
             base += buff.get('power', 0)
         # 技能附加
-        ctx = self.get_skill_context()
-        base += ctx.get('flat_power', 0)
-        base += self._calc_ground_power_bonus(ctx)
+        base += profile.skill_ctx.get('flat_power', 0)
+        base += profile.ground_bonus
         return base
     
     @property
     def fever_power(self):
         # Fever 模式下原有的削减逻辑 + 技能
-        base = self.level // 5
-        for item in self.equipment.items:
-            if item:
-                if item.type == 'rod' and not item.ignore_fever:
-                    base += item.power // 2
-                elif item.id == 406:
-                    base += item.power + 25
-                else:
-                    base += item.power
+        profile = self.profile
+        base = profile.fever_base_power
         for buff in self.buff:
             base += buff.get('power', 0)
         
         # 技能附加
-        ctx = self.get_skill_context()
+        ctx = profile.skill_ctx
         base += ctx.get('flat_power', 0) + ctx.get('fever_power', 0)
-        base += self._calc_ground_power_bonus(ctx)
+        base += profile.ground_bonus
         return base
 
     def _calc_ground_power_bonus(self, ctx: Optional[dict] = None) -> int:
         """Convert ground attribute crit chance into flat power via skill 25."""
-        if ctx is None:
-            ctx = self.get_skill_context()
-        ratio = ctx.get('extra_power_from_ground', 0)
-        if ratio <= 0:
-            return 0
-        ground_level = self.get_talent_level(7)
-        if ground_level <= 0:
-            return 0
-        ground_attr_percent = 5 * ground_level
-        return ground_attr_percent * ratio / 100.0
+        return self.profile.ground_bonus
 
     def _get_skill29_state(self):
         return self.data.setdefault('skill29_power_state', {"value": 0, "expire_at": 0})
 
     def get_skill29_power_bonus(self) -> int:
+        # 只按 expire_at 判断，读取时不改写数据；过期的层数在下次叠加时清零
         state = self.data.get('skill29_power_state')
-        if not state:
-            return 0
-        value = int(state.get('value', 0))
-        if value <= 0:
+        if not state or state.get('expire_at', 0) <= time.time():
             return 0
-        if state.get('expire_at', 0) <= time.time():
-            state['value'] = 0
-            state['expire_at'] = 0
-            return 0
-        return value
+        return max(0, int(state.get('value', 0)))
 
     def add_skill29_power_bonus(self, gain: int, max_value: int, duration: int = 1800) -> int:
         if gain <= 0 or max_value <= 0:
@@ -192,7 +374,7 @@ class FishPlayer(DictRedisData):
     @staticmethod
     def from_id(qq: str):
         token = f'fishgame_user_data_{md5(str(qq))}'
-        if redis_global.exists(token):
+        if FishPlayer.exists(token):
             return FishPlayer(qq)
         return None
     
@@ -210,6 +392,7 @@ class FishPlayer(DictRedisData):
             target_exp = self.get_target_exp(self.level)
             level_up = True
         if level_up:
+            self.invalidate_profile()
             return f"\n等级提升至 {self.level} 级！"
         return ''
 
@@ -233,7 +416,13 @@ class FishPlayer(DictRedisData):
         return [{'id': k, 'level': min(v, fish_skills[k].max_level)} for k, v in skills.items()]
 
     def get_skill_context(self) -> dict:
+        """已装备技能的效果汇总，随 profile 缓存，调用方不应修改返回的 dict"""
+        return self.profile.skill_ctx
+
+    def build_skill_context(self, skills: Optional[dict] = None) -> dict:
         from src.libraries.fishgame.data import fish_skills
+        if skills is None:
+            skills = self.get_equipped_skill_dict()
         ctx = {
             'flat_power': 0,
             'extra_power_from_ground': 0,
@@ -265,7 +454,7 @@ class FishPlayer(DictRedisData):
             'oversea_damage_boost': 0,
             'oversea_extra_attack_chance': 0,
         }
-        for inst in self.get_equipped_skills():
+        for inst in [{'id': k, 'level': min(v, fish_skills[k].max_level)} for k, v in skills.items()]:
             sk = fish_skills.get(inst['id'])
             if not sk:
                 continue
@@ -405,6 +594,7 @@ class FishPlayer(DictRedisData):
             new_total = min(new_total, max_total)
         new_total = max(new_total, 0)
         store[key] = new_total
+        self.invalidate_profile()
 
         new_level = self.get_talent_level(talent_id)
         level_up = max(0, new_level - old_level)
@@ -413,7 +603,9 @@ class FishPlayer(DictRedisData):
         return new_level, level_up
     
     def get_crit_percent(self, fish: Fish, diff):
-        skill_ctx = self.get_skill_context()
+        profile = self.profile
+        skill_ctx = profile.skill_ctx
+        talent_levels = profile.talent_levels
         crit_percent = skill_ctx.get('crit_percent', 0)
         if self.fish_log.caught(fish.id):
             crit_percent += skill_ctx.get('old_fish_crit', 0)
@@ -423,23 +615,23 @@ class FishPlayer(DictRedisData):
                 continue
             if weak in talent_types:
                 talent_id = talent_types.index(weak) + 1
-                talent_level = self.get_talent_level(talent_id)
+                talent_level = talent_levels.get(talent_id, 0)
                 if talent_level > 0:
                     crit_percent += 5 * talent_level  # 每级增加 5% 几率
         # 冰干单独判定
         talent_4_level = 0
-        if 'freezedry' in fish.weakness and self.get_equipped_skill_dict().get(21, 0) > 0:
-            talent_4_level = self.get_talent_level(4)
+        if 'freezedry' in fish.weakness and profile.equipped_skills.get(21, 0) > 0:
+            talent_4_level = talent_levels.get(4, 0)
         elif 'ice' in fish.weakness:
-            talent_4_level = self.get_talent_level(4)
+            talent_4_level = talent_levels.get(4, 0)
         if talent_4_level > 0:
             crit_percent += 5 * talent_4_level
         
-        talent_8_level = self.get_talent_level(8)
+        talent_8_level = talent_levels.get(8, 0)
         if talent_8_level > 0:
             crit_percent += 0.01 * talent_8_level * max(0, diff)
 
-        grass_talent_level = self.get_talent_level(3)
+        grass_talent_level = talent_levels.get(3, 0)
         if grass_talent_level > 0:
             grass_attr_percent = 5 * grass_talent_level
             convert_ratio = skill_ctx.get('crit_rate_from_grass', 0)
@@ -1,18 +1,139 @@
 from __future__ import annotations
 
-from typing import Dict
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Callable, Dict
 
+from nonebot import logger
+from src.data_access.lease import Lease
+from src.data_access.redis import redis_global, write_behind
 from src.libraries.fishgame.fishgame import FishGame
+from src.libraries.fishgame.game_state import revision_key
 
 
 fish_games: Dict[int, FishGame] = {}
 
 
+class GameBusy(Exception):
+    """等待游戏租约超时"""
+
+
+class GameConflict(Exception):
+    """写回群数据时发现已被其他进程改过，这次对群数据的修改没有生效"""
+
+
 def ensure_game(group_id: int | str) -> FishGame:
-    """Return the cached FishGame instance for the group, creating it if needed."""
+    """Return the cached FishGame instance for the group, creating it if needed.
+
+    The cached instance is reloaded when another process has written the group since it was loaded;
+    the shared per-fish state is re-read on every call.
+    """
     gid = int(group_id)
     game = fish_games.get(gid)
     if game is None:
         game = FishGame(gid)
         fish_games[gid] = game
+        return game
+    revision, state = redis_global.mget(revision_key(gid), game.state.key)
+    if game.stale(revision):
+        if game.write_conflicted():
+            logger.warning("Dropped unsaved changes of game %s: it was written by another process", gid)
+        game = FishGame(gid)
+        fish_games[gid] = game
+    else:
+        game.state.load(state, fetched=True)
     return game
+
+
+def game_lease(group_id: int | str) -> Lease:
+    return Lease(f'fishgame_game_{int(group_id)}')
+
+
+@asynccontextmanager
+async def game_session(group_id: int | str, wait: float = 5.0):
+    """持有游戏的租约期间操作游戏，各进程对同一个游戏的操作依次进行；结束时立即写回群数据。
+
+    写回时发现群数据已被不持有租约的写入改过，抛出 GameConflict。
+    """
+    lease = game_lease(group_id)
+    if not await lease.acquire_wait(wait):
+        raise GameBusy(group_id)
+    try:
+        game = ensure_game(group_id)
+        yield game
+        # 有些操作只改了内存中的群数据，这里统一写回
+        game.save()
+    finally:
+        try:
+            write_behind.flush_key(f'fishgame_group_data_{int(group_id)}')
+        finally:
+            lease.release()
+    if game.write_conflicted():
+        raise GameConflict(group_id)
+
+
+class GameActor:
+    """每个游戏一个协程，按顺序执行投递过来的操作。
+
+    排队中的操作一次取出，在同一个租约内依次执行，结束时只写回一次群数据；不同游戏的 actor 互不阻塞。
+    空闲 idle_timeout 秒后协程退出，下次投递时重新创建。
+    """
+    idle_timeout = 60
+
+    def __init__(self, group_id: int):
+        self.group_id = group_id
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def run(self):
+        while True:
+            try:
+                first = await asyncio.wait_for(self.queue.get(), self.idle_timeout)
+            except asyncio.TimeoutError:
+                # 检查和移除之间没有 await，submit 不会把操作投给已经退出的 actor
+                if self.queue.empty():
+                    game_actors.pop(self.group_id, None)
+                    return
+                continue
+            batch = [first]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            # 写回群数据成功之后才交出结果
+            outcomes = []
+            try:
+                async with game_session(self.group_id) as game:
+                    for fn, future in batch:
+                        if future.cancelled():
+                            continue
+                        try:
+                            outcomes.append((future, fn(game), None))
+                        except Exception as exc:
+                            outcomes.append((future, None, exc))
+            except Exception as exc:
+                # 拿不到租约、写回时冲突等，整批失败
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            for future, result, exc in outcomes:
+                if future.done():
+                    continue
+                if exc is not None:
+                    future.set_exception(exc)
+                else:
+                    future.set_result(result)
+
+
+game_actors: Dict[int, GameActor] = {}
+
+
+async def submit(group_id: int | str, fn: Callable[[FishGame], object]):
+    """把 fn(game) 交给游戏的 actor 执行并等待结果；fn 是同步函数，执行期间独占这个游戏"""
+    gid = int(group_id)
+    actor = game_actors.get(gid)
+    if actor is None:
+        actor = GameActor(gid)
+        game_actors[gid] = actor
+    future = asyncio.get_running_loop().create_future()
+    actor.queue.put_nowait((fn, future))
+    return await future
@@ -0,0 +1,54 @@
+import random
+
+
+class AliasTable:
+    """带权抽样的别名表（Vose 算法）：构建 O(n)，单次抽取 O(1)。
+
+    entries 为带 weight 字段的条目（如 gacha.json 中的奖励），权重不大于 0 的条目不会被抽到。
+    """
+    def __init__(self, entries, weight=lambda entry: entry['weight']):
+        self.entries = [entry for entry in entries if weight(entry) > 0]
+        self.weights = [weight(entry) for entry in self.entries]
+        self.total = sum(self.weights)
+        n = len(self.entries)
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+        if n == 0:
+            return
+        scaled = [w * n / self.total for w in self.weights]
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1 - scaled[s]
+            (small if scaled[l] < 1 else large).append(l)
+        # 剩下的只差浮点误差，概率视为 1
+
+    def pick(self):
+        """抽取一次，表为空时返回 None"""
+        if not self.entries:
+            return None
+        i = random.randrange(len(self.entries))
+        if random.random() < self.prob[i]:
+            return self.entries[i]
+        return self.entries[self.alias[i]]
+
+    def counts(self, n) -> list[tuple]:
+        """抽取 n 次，只返回 [(条目, 抽中次数)]。
+
+        按多项分布一次性抽出各条目的次数（依次做条件二项分布抽样），耗时只和条目数有关，和 n 无关。
+        """
+        result = []
+        remaining = self.total
+        last = len(self.entries) - 1
+        for i, (entry, weight) in enumerate(zip(self.entries, self.weights)):
+            if n <= 0:
+                break
+            k = n if i == last else random.binomialvariate(n, min(1.0, weight / remaining))
+            if k:
+                result.append((entry, k))
+            n -= k
+            remaining -= weight
+        return result
@@ -0,0 +1,45 @@
+import heapq
+import time
+
+
+class Timeline:
+    """定时机制（buff 到期、大锅消耗、每日重置等）的到期时间表，用最小堆记录每个机制下一次状态变化的时间。
+
+    各机制结算时直接按时间戳算出当前状态，耗时和间隔多久无关；结算后由调用方把下一次变化的时间放回堆里。
+    堆顶还没到期、且 signature 没变时什么都不用做。
+    """
+    def __init__(self):
+        self._heap: list[tuple[float, str]] = []
+        # signature 里放的是数据中的列表对象本身和它的长度，被整体替换或增删元素后都能发现
+        self._signature = None
+
+    def schedule(self, name: str, at: float):
+        heapq.heappush(self._heap, (at, name))
+
+    def due(self, signature, now: float = None):
+        """返回已到期的机制名集合；第一次调用或 signature 变化时返回 None，表示全部重新结算"""
+        if now is None:
+            now = time.time()
+        if self._signature is None or self._signature != signature:
+            self._heap.clear()
+            self._signature = signature
+            return None
+        names = set()
+        while self._heap and self._heap[0][0] <= now:
+            names.add(heapq.heappop(self._heap)[1])
+        return names
+
+    def commit(self, signature):
+        """结算过程中修改了被监视的数据，结算完成后记下新的 signature"""
+        self._signature = signature
+
+
+def next_midnight(now: float) -> float:
+    """本地时间下一个 0 点"""
+    t = time.localtime(now)
+    return time.mktime((t.tm_year, t.tm_mon, t.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+
+
+def next_buff_expire(buffs: list) -> float:
+    """列表中最早到期的时间，没有限时 buff 时为 0"""
+    return min((buff['expire'] for buff in buffs if buff.get('expire', 0) > 0), default=0)
@@ -0,0 +1,62 @@
+import time
+from src.data_access.redis import redis_global
+
+
+class GameTimers:
+    """各个游戏的定时事件，保存在 Redis 的 ZSET 中：成员为 "游戏:事件"，分数为到期时间。
+
+    每个游戏的每种事件只保留一个到期时间，重复登记时覆盖。调度器只取出已经到期的事件，
+    没有事件到期的群不产生任何开销；多个进程同时取出时以 ZREM 成功的一方为准。
+    """
+    key = 'fishgame_timers'
+
+    # 事件类型
+    SPAWN = 'spawn'  # 尝试刷鱼
+    LEAVE = 'leave'  # 当前的鱼离开
+    OVERSEA_ROUND = 'oversea_round'  # 港口战斗推进一轮
+    OVERSEA_SPAWN = 'oversea_spawn'  # 检查是否出现港口怪物
+
+    @staticmethod
+    def _member(game_id, event: str) -> str:
+        return f'{int(game_id)}:{event}'
+
+    def schedule(self, game_id, event: str, at: float):
+        redis_global.zadd(self.key, {self._member(game_id, event): at})
+
+    def cancel(self, game_id, event: str):
+        redis_global.zrem(self.key, self._member(game_id, event))
+
+    def scheduled(self, game_id, event: str) -> bool:
+        return redis_global.zscore(self.key, self._member(game_id, event)) is not None
+
+    def pop_due(self, now: float = None) -> dict[int, list[str]]:
+        """取出所有已到期的事件，返回 {游戏: [事件]}"""
+        if now is None:
+            now = time.time()
+        members = redis_global.zrangebyscore(self.key, '-inf', now)
+        if not members:
+            return {}
+        pipe = redis_global.pipeline(transaction=False)
+        for member in members:
+            pipe.zrem(self.key, member)
+        due: dict[int, list[str]] = {}
+        for member, removed in zip(members, pipe.execute()):
+            if not removed:
+                continue
+            game_id, event = member.split(':', 1)
+            due.setdefault(int(game_id), []).append(event)
+        return due
+
+
+game_timers = GameTimers()
+
+
+def next_hour(now: float) -> float:
+    """本地时间的下一个整点"""
+    t = time.localtime(now)
+    return time.mktime((t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour + 1, 0, 0, 0, 0, -1))
+
+
+def today_at(now: float, hour: int) -> float:
+    t = time.localtime(now)
+    return time.mktime((t.tm_year, t.tm_mon, t.tm_mday, hour, 0, 0, 0, 0, -1))
@@ -1,8 +1,9 @@
+import asyncio
 from copy import copy
 from io import BytesIO
 from typing import Any
 
-from nonebot import get_bot, on_command, get_driver
+from nonebot import get_bot, on_command, on_notice, get_driver
 from nonebot.rule import Rule
 from nonebot.params import CommandArg, EventMessage, Depends
 from nonebot.adapters import Bot, Event, Message, MessageSegment
@@ -10,10 +11,15 @@ from nonebot_plugin_alconna import UniMessage
 
 from src.data_access.plugin_manager import plugin_manager
 from src.data_access.open_helper import RealContext, get_real_context
-from src.data_access.redis import DictRedisData
+from src.data_access.redis import DictRedisData, compression_stats, flush_write_behind, migrate_to_hash
+from src.data_access.local_cache import local_cache
+from src.data_access.group_cache import group_cache
+from src.data_access.outbox import Outbox
 from src.libraries.fishgame.fishgame import *
 from src.libraries.fishgame.fishgame_util import *
-from src.libraries.fishgame.runtime import fish_games
+from src.libraries.fishgame.runtime import (fish_games, ensure_game as ensure_runtime_game, game_lease, submit,
+                                            GameBusy, GameConflict)
+from src.libraries.fishgame.timers import game_timers, next_hour, today_at
 from src.routes.fishgame import has_online_clients, online_clients_group_list, push_web_event
 import time
 from nonebot.log import logger
@@ -52,12 +58,18 @@ plugin_manager.register_plugin(__plugin_meta)
 class FishGameBindingStore(DictRedisData):
     """Persist bidirectional mappings between primary groups and their sub-chat mirrors."""
 
+    KEY = "fishgame_group_bindings"
+
     def __init__(self):
         super().__init__(
-            "fishgame_group_bindings",
+            self.KEY,
             default={"group_to_primary": {}, "primary_to_subs": {}},
         )
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        local_cache.invalidate(self.KEY)
+
     @staticmethod
     def _normalize(value: int | str) -> str:
         try:
@@ -148,19 +160,21 @@ class FishGameBindingStore(DictRedisData):
         return result
 
 
-_binding_store = FishGameBindingStore()
+def _binding_store() -> FishGameBindingStore:
+    # Shared per process and reloaded after any process saves a binding.
+    return local_cache.get(FishGameBindingStore.KEY, FishGameBindingStore)
 
 
 def resolve_game_group_id(group_id: int | str) -> int:
-    return _binding_store.get_primary_group(group_id)
+    return _binding_store().get_primary_group(group_id)
 
 
 def get_linked_groups(group_id: int | str) -> list[int]:
-    return _binding_store.get_all_related_groups(group_id)
+    return _binding_store().get_all_related_groups(group_id)
 
 
 def get_sub_groups(group_id: int | str) -> list[int]:
-    return _binding_store.get_sub_groups(group_id)
+    return _binding_store().get_sub_groups(group_id)
 
 
 def is_game_enabled(game_id: int | str) -> bool:
@@ -176,30 +190,24 @@ async def collect_member_ids(bot, game_id: int, accessible_groups: set[int]) ->
         if gid not in accessible_groups:
             continue
         try:
-            group_members = await bot.get_group_member_list(group_id=gid)
+            group_members = await group_cache.member_ids(bot, gid)
         except Exception as exc:
             logger.warning("Failed to fetch member list for group %s: %s", gid, exc)
             continue
-        for member in group_members:
-            user_id = member.get("user_id")
-            if user_id is not None:
-                members.add(str(user_id))
+        members.update(str(user_id) for user_id in group_members)
     return list(members)
 
 
-def gather_candidate_game_ids(qq_groups: set[int], web_groups: set[int]) -> list[int]:
-    seen: set[int] = set()
-    candidates: list[int] = []
-    for gid in sorted(qq_groups | web_groups):
-        try:
-            game_id = resolve_game_group_id(gid)
-        except Exception:
+def enabled_game_ids(accessible_groups: set[int]) -> list[int]:
+    """启用了捕鱼、且有关联群可以访问的游戏。按插件索引查询，不逐个群检查"""
+    game_ids: list[int] = []
+    for gid in sorted(plugin_manager.get_groups(__plugin_meta["name"])):
+        game_id = resolve_game_group_id(gid)
+        if game_id in game_ids:
             continue
-        if game_id in seen:
-            continue
-        seen.add(game_id)
-        candidates.append(game_id)
-    return candidates
+        if any(linked in accessible_groups for linked in get_linked_groups(game_id)):
+            game_ids.append(game_id)
+    return game_ids
 
 
 async def is_group_admin(ctx: RealContext) -> bool:
@@ -207,7 +215,7 @@ async def is_group_admin(ctx: RealContext) -> bool:
         return True
     try:
         bot = get_bot(str(get_driver().config.private_bot))
-        info = await bot.get_group_member_info(group_id=ctx.group_id, user_id=ctx.user_id)
+        info = await group_cache.member_info(bot, ctx.group_id, ctx.user_id)
         return info.get("role") in {"owner", "admin"}
     except Exception as exc:
         logger.warning("Failed to verify admin for group %s user %s: %s", ctx.group_id, ctx.user_id, exc)
@@ -232,7 +240,7 @@ async def __group_checker(bot: Bot, event: Event):
     elif not hasattr(event, 'group_id') or hasattr(event, 'group_openid'):
         return True
     else:
-        return plugin_manager.get_enable(event.group_id, __plugin_meta["name"])
+        return await plugin_manager.get_enable_async(event.group_id, __plugin_meta["name"])
 
 async def __not_group(event: Event):
     if hasattr(event, 'group_id') and not hasattr(event, 'group_openid'):
@@ -247,11 +255,8 @@ from nonebot_plugin_apscheduler import scheduler
 
 
 async def get_group_lists(qq_only=False) -> list[int]:
-    groups = set()
     bot = get_bot(str(get_driver().config.private_bot))
-    group_list = await bot.get_group_list()
-    for group in group_list:
-        groups.add(group['group_id'])
+    groups = set(await group_cache.group_ids(bot))
     if qq_only:
         return list(groups)
     for gid in online_clients_group_list():
@@ -259,9 +264,29 @@ async def get_group_lists(qq_only=False) -> list[int]:
     return list(groups)
 
 
-async def dispatch_notifications(group_id: int, qq_message: str | None = None, web_event: dict | None = None):
-    """Send QQ message and/or web push event based on availability."""
+async def _send_group_text(group_id: int, text: str):
     bot = get_bot(str(get_driver().config.private_bot))
+    await bot.send_msg(message_type="group", group_id=group_id, message=text)
+
+
+# 游戏通知统一经过发送队列：按群限速、合并，发送失败时重试
+outbox = Outbox(_send_group_text, pending_key='fishgame_outbox_pending')
+
+
+# 退出时发完或保存队列里的通知，bot 重新连上后补发
+@get_driver().on_shutdown
+async def close_outbox():
+    await outbox.close()
+
+
+@get_driver().on_bot_connect
+async def restore_outbox(bot: Bot):
+    if str(bot.self_id) == str(get_driver().config.private_bot):
+        outbox.restore()
+
+
+async def dispatch_notifications(group_id: int, qq_message: str | None = None, web_event: dict | None = None):
+    """Queue QQ message and/or send web push event based on availability."""
     game_id = resolve_game_group_id(group_id)
     if qq_message:
         available_groups = set(await get_group_lists(qq_only=True))
@@ -270,19 +295,13 @@ async def dispatch_notifications(group_id: int, qq_message: str | None = None, w
                 continue
             if not plugin_manager.get_enable(target, __plugin_meta["name"]):
                 continue
-            try:
-                await bot.send_msg(message_type="group", group_id=target, message=qq_message)
-            except Exception as exc:
-                logger.warning("Failed to send QQ message to group %s: %s", target, exc)
+            outbox.send(target, qq_message)
     if web_event:
         await push_game_web_event(game_id, web_event)
 
 
 def ensure_game(group_id: int) -> FishGame:
-    realid = resolve_game_group_id(group_id)
-    if realid not in fish_games:
-        fish_games[realid] = FishGame(realid)
-    return fish_games[realid]
+    return ensure_runtime_game(resolve_game_group_id(group_id))
 
 def ensure_player(user_id: int | str) -> FishPlayer:
     return FishPlayer(str(user_id))
@@ -292,6 +311,20 @@ def reply_text(ctx: RealContext, text: str) -> UniMessage:
     return UniMessage.reply(ctx.message_id) + UniMessage.text(text)
 
 
+async def submit_in_game(ctx: RealContext, fn, group_id: int | None = None):
+    """把会修改群数据的操作交给游戏的 actor，在租约内执行并写回；失败时回复原因并返回 None。
+
+    group_id 默认为消息所在的群。fn(game) 里用到的玩家也要在 fn 里加载，排队期间其他命令对玩家的修改不会被覆盖。
+    """
+    try:
+        return await submit(resolve_game_group_id(ctx.group_id if group_id is None else group_id), fn)
+    except GameBusy:
+        await reply_text(ctx, "操作的人太多了，请稍后再试").send()
+    except GameConflict:
+        await reply_text(ctx, "群数据同时被其他地方修改，本次操作对群的改动没有生效，请重试").send()
+    return None
+
+
 def reply_image(ctx: RealContext, image: Any) -> UniMessage:
     buffer = BytesIO()
     image.save(buffer, format="PNG")
@@ -312,7 +345,7 @@ async def get_member_display_name(group_id: int, user_id: int, player: FishPlaye
         fallback = player.data.get('name') or player.data.get('nickname')
     try:
         bot = get_bot(str(get_driver().config.private_bot))
-        info = await bot.get_group_member_info(group_id=group_id, user_id=user_id)
+        info = await group_cache.member_info(bot, group_id, user_id)
         card = info.get("card")
         if card:
             return card
@@ -323,13 +356,90 @@ async def get_member_display_name(group_id: int, user_id: int, player: FishPlaye
         logger.warning("Failed to fetch member info for group %s user %s: %s", group_id, user_id, exc)
     return fallback or str(user_id)
 
-@scheduler.scheduled_job("cron", minute="*/1", jitter=30)
-async def try_spawn_fish():
-    # 如果不在 8 到 24 点则不尝试生成
-    if 1 <= time.localtime().tm_hour < 8:
+async def _private_bot_notice(bot: Bot, event: Event) -> bool:
+    return bot.self_id == str(get_driver().config.private_bot) and event.get_type() == 'notice'
+
+
+# 群成员、管理员变动时更新成员缓存，不阻断其他插件
+group_member_notice = on_notice(rule=_private_bot_notice, priority=1, block=False)
+
+
+@group_member_notice.handle()
+async def _(bot: Bot, event: Event):
+    group_cache.handle_notice(int(bot.self_id), event)
+
+
+# 成员缓存定期全量核对，修正错过的通知事件
+@scheduler.scheduled_job("cron", minute=15)
+async def reconcile_group_cache():
+    try:
+        bot = get_bot(str(get_driver().config.private_bot))
+        await group_cache.reconcile(bot)
+    except Exception as exc:
+        logger.warning("Failed to reconcile group cache: %s", exc)
+
+
+def _tick_concurrency() -> int:
+    # 可在 .env 中用 FISHGAME_TICK_CONCURRENCY 配置
+    return int(getattr(get_driver().config, 'fishgame_tick_concurrency', 8))
+
+
+def _tick_budget() -> float:
+    # 每轮的时间预算（秒），可用 FISHGAME_TICK_BUDGET 配置
+    return float(getattr(get_driver().config, 'fishgame_tick_budget', 20))
+
+
+_running_ticks: set[str] = set()
+
+
+async def run_game_ticks(name: str, game_ids: list[int], handler, on_skip=None):
+    """并发处理各个游戏，同时进行的数量有上限。
+
+    超出时间预算后还没开始的游戏本轮跳过（有 on_skip 时交给它补登记），已经开始的不会被取消，
+    以免改完状态还没发出通知就被打断。同名任务上一轮还没结束时跳过本轮；结束后记录总耗时和最慢的几个游戏。
+    """
+    if name in _running_ticks:
+        logger.warning("Skip %s tick: previous run is still in progress", name)
         return
+    _running_ticks.add(name)
+    semaphore = asyncio.Semaphore(_tick_concurrency())
+    budget = _tick_budget()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + budget
+    durations: dict[int, float] = {}
+    skipped: list[int] = []
+
+    async def run(game_id: int):
+        async with semaphore:
+            if loop.time() >= deadline:
+                skipped.append(game_id)
+                if on_skip is not None:
+                    on_skip(game_id)
+                return
+            begin = time.perf_counter()
+            try:
+                await handler(game_id)
+            except Exception:
+                logger.exception("%s tick failed for game %s", name, game_id)
+            finally:
+                durations[game_id] = time.perf_counter() - begin
 
-    bot = get_bot(str(get_driver().config.private_bot))
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(run(game_id) for game_id in game_ids))
+    finally:
+        _running_ticks.discard(name)
+    if skipped:
+        logger.warning("%s tick exceeded %gs budget, skipped %d games", name, budget, len(skipped))
+    slowest = sorted(durations.items(), key=lambda item: item[1], reverse=True)[:3]
+    logger.info(
+        "%s tick: %d games in %.2fs, slowest: %s",
+        name, len(game_ids), time.perf_counter() - start,
+        ", ".join(f"{game_id}={cost:.2f}s" for game_id, cost in slowest) or "-",
+    )
+
+
+async def _candidate_games() -> tuple[list[int], set[int]]:
     qq_groups = set(await get_group_lists(qq_only=True))
     web_groups: set[int] = set()
     for gid in online_clients_group_list():
@@ -337,133 +447,225 @@ async def try_spawn_fish():
             web_groups.add(int(gid))
         except (TypeError, ValueError):
             continue
+    return enabled_game_ids(qq_groups | web_groups), qq_groups
 
-    candidate_games = gather_candidate_game_ids(qq_groups, web_groups)
-    for game_id in candidate_games:
-        if not is_game_enabled(game_id):
-            continue
+
+async def leave_tick(game: FishGame):
+    current_fish = game.current_fish
+    if not game.check_leave():
+        return
+    leave_msg = "鱼离开了..." if not game.is_fever else '鱼群散去了！'
+    await dispatch_notifications(
+        game.group_id,
+        leave_msg,
+        {
+            "type": "fish_leave",
+            "fish": current_fish.data if current_fish else None,
+            "reason": "timeout",
+            "isFever": game.is_fever,
+        }
+    )
+
+
+async def spawn_tick(bot, game: FishGame, qq_groups: set[int]):
+    now = time.time()
+    # 如果不在 8 到 24 点则不尝试生成，到 8 点再继续
+    if 1 <= time.localtime(now).tm_hour < 8:
+        game_timers.schedule(game.group_id, game_timers.SPAWN, today_at(now, 8))
+        return
+    game_timers.schedule(game.group_id, game_timers.SPAWN, now + 60)
+
+    member_ids = await collect_member_ids(bot, game.group_id, qq_groups)
+    game.update_average_power(member_ids)
+    if game.current_fish is not None:
+        return
+    fish: Fish = game.spawn_fish()
+    if fish is None:
+        return
+    shiny_mark = "✨异色✨" if game.current_fish_is_shiny else ""
+    if fish.rarity == 'UR':
+        spawn_msg = f"{shiny_mark}{fish.name}【{fish.rarity}】 █████！\n使用【████】指███████获████！"
+    else:
+        spawn_msg = f"{shiny_mark}{fish.name}【{fish.rarity}】 出现了！\n使用【捕鱼】指令进行捕获吧！"
+    if game.current_fish_is_shiny:
+        spawn_msg += "\n🌟这是一只异色宝可梦！捕获后经验和金币翻4倍！"
+    await dispatch_notifications(
+        game.group_id,
+        spawn_msg,
+        {
+            "type": "spawn",
+            "fish": fish.data,
+            "rarity": fish.rarity,
+            "isFever": game.is_fever,
+            "isShiny": game.current_fish_is_shiny,
+        }
+    )
+
+
+async def oversea_spawn_tick(game: FishGame):
+    now = time.time()
+    # 每个整点检查一次，和刷鱼一样 1 点到 8 点之间直接等到 8 点；港口升级、战斗结束时会提前登记
+    if 1 <= time.localtime(now).tm_hour < 8:
+        game_timers.schedule(game.group_id, game_timers.OVERSEA_SPAWN, today_at(now, 8))
+    else:
+        game_timers.schedule(game.group_id, game_timers.OVERSEA_SPAWN, next_hour(now))
+    if not game.check_oversea_spawn():
+        return
+    battle = game.oversea_battle
+    alert_msg = f"警报！海上发现了巨大的身影！\n{battle.data['monster_name']} 正在接近！\n请各位渔者前往【港口】进行讨伐！"
+    await dispatch_notifications(
+        game.group_id,
+        alert_msg,
+        {
+            "type": "oversea_spawn",
+            "battle": battle.data,
+        }
+    )
+
+
+async def oversea_tick(game: FishGame):
+    # 战斗仍在进行时 process_oversea_turn 会登记下一轮
+    res = game.process_oversea_turn()
+    if not res:
+        return
+
+    msg = f"【港口战报】第 {game.oversea_battle.data['current_round']} 轮结束\n"
+    if 'logs' in res:
+        logs = res['logs']
+        msg += "\n".join(logs)
+
+    if res['status'] == 'success':
+        msg += f"\n\n讨伐成功！{game.oversea_battle.data['monster_name']} 已被击败！"
+    elif res['status'] == 'fail':
+        msg += f"\n\n讨伐失败... {res['message']}"
+
+    await dispatch_notifications(
+        game.group_id,
+        msg if res['status'] in ('success', 'fail') else None
+,
+        {
+            "type": "oversea_battle_update",
+            "status": res.get('status'),
+            "logs": res.get('logs'),
+            "round": game.oversea_battle.data.get('current_round') if game.oversea_battle else None,
+        }
+    )
+
+
+async def timer_tick(bot, game_id: int, events: list[str], qq_groups: set[int]):
+    # 未启用的游戏不再续期，重新启用时由 schedule_game_timers 补上
+    if not is_game_enabled(game_id):
+        return
+    lease = game_lease(game_id)
+    if not lease.acquire():
+        # 其他进程或协程正在处理这个游戏，稍后再试
+        for event in events:
+            game_timers.schedule(game_id, event, time.time() + 1)
+        return
+    try:
         game = ensure_game(game_id)
-        member_ids = await collect_member_ids(bot, game_id, qq_groups)
-        game.update_average_power(member_ids)
-
-        if game.current_fish is not None:
-            current_fish = game.current_fish
-            leave = game.count_down()
-            if leave:
-                leave_msg = "鱼离开了..." if not game.is_fever else '鱼群散去了！'
-                await dispatch_notifications(
-                    game_id,
-                    leave_msg,
-                    {
-                        "type": "fish_leave",
-                        "fish": current_fish.data if current_fish else None,
-                        "reason": "timeout",
-                        "isFever": game.is_fever,
-                    }
-                )
-        if game.current_fish is None:
-            fish: Fish = game.spawn_fish()
-            if fish is not None:
-                shiny_mark = "✨异色✨" if game.current_fish_is_shiny else ""
-                if fish.rarity == 'UR':
-                    spawn_msg = f"{shiny_mark}{fish.name}【{fish.rarity}】 █████！\n使用【████】指███████获████！"
-                else:
-                    spawn_msg = f"{shiny_mark}{fish.name}【{fish.rarity}】 出现了！\n使用【捕鱼】指令进行捕获吧！"
-                if game.current_fish_is_shiny:
-                    spawn_msg += "\n🌟这是一只异色宝可梦！捕获后经验和金币翻4倍！"
-                await dispatch_notifications(
-                    game_id,
-                    spawn_msg,
-                    {
-                        "type": "spawn",
-                        "fish": fish.data,
-                        "rarity": fish.rarity,
-                        "isFever": game.is_fever,
-                        "isShiny": game.current_fish_is_shiny,
-                    }
-                )
-
-        if game.check_oversea_spawn():
-            battle = game.oversea_battle
-            alert_msg = f"警报！海上发现了巨大的身影！\n{battle.data['monster_name']} 正在接近！\n请各位渔者前往【港口】进行讨伐！"
-            await dispatch_notifications(
-                game_id,
-                alert_msg,
-                {
-                    "type": "oversea_spawn",
-                    "battle": battle.data,
-                }
-            )
-
-# 港口战斗推进 (每3分钟)
-@scheduler.scheduled_job("cron", minute="*/3")
-async def process_oversea_battle():
+        if game_timers.LEAVE in events:
+            await leave_tick(game)
+        if game_timers.OVERSEA_ROUND in events:
+            await oversea_tick(game)
+        if game_timers.OVERSEA_SPAWN in events:
+            await oversea_spawn_tick(game)
+        if game_timers.SPAWN in events:
+            await spawn_tick(bot, game, qq_groups)
+    finally:
+        flush_write_behind()
+        lease.release()
+
+
+# 只唤醒有事件到期的游戏
+@scheduler.scheduled_job("interval", seconds=5)
+async def dispatch_game_timers():
+    bot = get_bot(str(get_driver().config.private_bot))
     qq_groups = set(await get_group_lists(qq_only=True))
-    web_groups: set[int] = set()
-    for gid in online_clients_group_list():
-        try:
-            web_groups.add(int(gid))
-        except (TypeError, ValueError):
-            continue
+    # 上一轮还没结束时不取出新的事件，留到下一次；从检查到 run_game_ticks 登记之间没有 await
+    if "timers" in _running_ticks:
+        return
+    due = game_timers.pop_due()
+    if not due:
+        return
 
-    for game_id in gather_candidate_game_ids(qq_groups, web_groups):
-        if not is_game_enabled(game_id):
-            continue
-        game = ensure_game(game_id)
-        res = game.process_oversea_turn()
-        if not res:
-            continue
+    def reschedule(game_id: int):
+        # 超出预算没有处理的事件放回队列，下一轮再处理
+        for event in due[game_id]:
+            game_timers.schedule(game_id, event, time.time())
 
-        msg = f"【港口战报】第 {game.oversea_battle.data['current_round']} 轮结束\n"
-        if 'logs' in res:
-            logs = res['logs']
-            msg += "\n".join(logs)
+    await run_game_ticks("timers", list(due), lambda game_id: timer_tick(bot, game_id, due[game_id], qq_groups),
+                         on_skip=reschedule)
 
-        if res['status'] == 'success':
-            msg += f"\n\n讨伐成功！{game.oversea_battle.data['monster_name']} 已被击败！"
-        elif res['status'] == 'fail':
-            msg += f"\n\n讨伐失败... {res['message']}"
 
-        await dispatch_notifications(
-            game_id,
-            msg if res['status'] in ('success', 'fail') else None
-,
-            {
-                "type": "oversea_battle_update",
-                "status": res.get('status'),
-                "logs": res.get('logs'),
-                "round": game.oversea_battle.data.get('current_round') if game.oversea_battle else None,
-            }
-        )
+def schedule_game_timers(group_id: int, check_battle: bool = False):
+    """给游戏补上缺少的周期事件，已经登记的不变"""
+    game_id = resolve_game_group_id(group_id)
+    now = time.time()
+    if not game_timers.scheduled(game_id, game_timers.SPAWN):
+        # 错开各个群的刷鱼时间
+        game_timers.schedule(game_id, game_timers.SPAWN, now + random.uniform(0, 60))
+    if not game_timers.scheduled(game_id, game_timers.OVERSEA_SPAWN):
+        game_timers.schedule(game_id, game_timers.OVERSEA_SPAWN, now)
+    if not check_battle:
+        return
+    game = ensure_game(game_id)
+    if game.oversea_battle and game.oversea_battle.data['status'] == 'fighting' \
+            and not game_timers.scheduled(game_id, game_timers.OVERSEA_ROUND):
+        game_timers.schedule(game_id, game_timers.OVERSEA_ROUND, now + 180)
+
+
+# 新启用的群立即登记；之后各事件到期时自己续期，战斗开始和结束时登记战斗相关的事件
+plugin_manager.on_enable(__plugin_meta["name"], schedule_game_timers)
+
+_timers_reconciled = False
+
+
+# 启动后对账一次，补上首次部署或停机期间丢失的事件
+@get_driver().on_bot_connect
+async def reconcile_game_timers(bot: Bot):
+    global _timers_reconciled
+    if _timers_reconciled or str(bot.self_id) != str(get_driver().config.private_bot):
+        return
+    _timers_reconciled = True
+    game_ids, _ = await _candidate_games()
+    for game_id in game_ids:
+        schedule_game_timers(game_id, check_battle=True)
+
+
+def roll_fever(game: FishGame) -> float | None:
+    """按投放食料的次数决定是否进入 Fever，进入时返回结束时间"""
+    game.refresh_buff()
+    rate = game.data['feed_time'] / 5
+    if random.random() >= rate:
+        return None
+    game.trigger_fever()
+    return game.data['fever_expire']
+
+
+async def fever_tick(game_id: int):
+    # 和玩家的命令一样交给游戏的 actor，在租约内修改群数据
+    fever_expire = await submit(game_id, roll_fever)
+    if fever_expire is None:
+        return
+    minute = (fever_expire - time.time()) // 60
+    fever_msg = f"大量的鱼群聚集了起来！\n接下来{int(minute)}分钟内，鱼将不会逃走，并且每个人都可以捕获一次！\n但与此同时，你的等级和渔具的效果似乎受到了削弱……"
+    await dispatch_notifications(
+        game_id,
+        fever_msg,
+        {
+            "type": "fever_start",
+            "duration": int(fever_expire - time.time()),
+            "expireAt": fever_expire,
+        }
+    )
 
 
 @scheduler.scheduled_job("cron", hour=19, minute=30)
 async def test_if_group_come():
     bot = get_bot(str(get_driver().config.private_bot))
-    group_list = await bot.get_group_list()
-    processed: set[int] = set()
-    for obj in group_list:
-        group = obj['group_id']
-        game_id = resolve_game_group_id(group)
-        if game_id in processed or not is_game_enabled(game_id):
-            continue
-        processed.add(game_id)
-        fish_game = ensure_game(game_id)
-        fish_game.refresh_buff()
-        rate = fish_game.data['feed_time'] / 5
-        if random.random() < rate:
-            fish_game.trigger_fever()
-            minute = (fish_game.data['fever_expire'] - time.time()) // 60
-            fever_msg = f"大量的鱼群聚集了起来！\n接下来{int(minute)}分钟内，鱼将不会逃走，并且每个人都可以捕获一次！\n但与此同时，你的等级和渔具的效果似乎受到了削弱……"
-            await dispatch_notifications(
-                game_id,
-                fever_msg,
-                {
-                    "type": "fever_start",
-                    "duration": int(fish_game.data['fever_expire'] - time.time()),
-                    "expireAt": fish_game.data['fever_expire'],
-                }
-            )
+    game_ids = enabled_game_ids(await group_cache.group_ids(bot))
+    await run_game_ticks("fever", game_ids, fever_tick)
 
 
 panel = on_command('面板', rule=official_hybrid)
@@ -554,14 +756,30 @@ async def _(ctx: RealContext = Depends(get_real_context)):
 
 catch = on_command('捕鱼', aliases={'大师球'}, rule=official_hybrid)
 
+
+def catch_in_game(game: FishGame, user_id: int, master_ball: bool):
+    # 玩家在 actor 里加载，排队期间其他命令对玩家的修改不会被这次保存覆盖
+    player = ensure_player(user_id)
+    fish_before = game.current_fish.data if game.current_fish else None
+    res = game.catch_fish(player, master_ball)
+    return player, fish_before, res, game.current_fish is not None
+
+
 @catch.handle()
 async def _(ctx: RealContext = Depends(get_real_context), message: Message = EventMessage()):
     game = ensure_game(ctx.group_id)
-    player = ensure_player(ctx.user_id)
     text = normalize_event_text(message)
     master_ball = text.endswith('大师球')
-    fish_before = game.current_fish.data if game.current_fish else None
-    res = game.catch_fish(player, master_ball)
+    try:
+        # 交给游戏的 actor 依次结算，同时到达的捕鱼合并为一批
+        player, fish_before, res, fish_still = await submit(
+            game.group_id, lambda game: catch_in_game(game, ctx.user_id, master_ball))
+    except GameBusy:
+        await reply_text(ctx, "捕鱼的人太多了，请稍后再试").send()
+        return
+    except GameConflict:
+        await reply_text(ctx, "群数据同时被其他地方修改，本次捕鱼对群的改动没有生效，请重试").send()
+        return
     await reply_text(ctx, res['message']).send()
 
     if fish_before:
@@ -577,7 +795,7 @@ async def _(ctx: RealContext = Depends(get_real_context), message: Message = Eve
                 "message": res.get('message'),
                 "success": res.get('code') == 0,
                 "isShiny": res.get('is_shiny', False),
-                "fishStillPresent": game.current_fish is not None,
+                "fishStillPresent": fish_still,
                 "isFever": game.is_fever,
                 "source": "qq",
             },
@@ -671,6 +889,32 @@ async def _(ctx: RealContext = Depends(get_real_context), message: Message = Com
 
 use = on_command('使用', aliases={'强制使用'}, rule=official_hybrid)
 
+
+def use_item_in_game(game: FishGame, user_id: int, item_id: int, force: bool, remain_args: list[str]) -> list[str]:
+    player = ensure_player(user_id)
+    messages: list[str] = []
+    count = 1
+    copied_args = copy(remain_args)
+    while count > 0:
+        res = game.use_item(player, item_id, force, copied_args)
+        messages.append(res['message'])
+        if res['code'] != 0:
+            break
+        if len(copied_args) == 1 and getattr(FishItem.get(item_id), 'batch_use', False):
+            try:
+                count = int(copied_args[0]) - 1
+            except ValueError:
+                break
+            copied_args = copy(remain_args)
+            if copied_args:
+                copied_args[-1] = str(count)
+            if count <= 0:
+                break
+        else:
+            count -= 1
+    return messages
+
+
 @use.handle()
 async def _(ctx: RealContext = Depends(get_real_context), message: Message = EventMessage()):
     raw = normalize_event_text(message)
@@ -691,29 +935,11 @@ async def _(ctx: RealContext = Depends(get_real_context), message: Message = Eve
         await reply_text(ctx, "未找到该道具").send()
         return
     remain_args = parts[1:]
-    game = ensure_game(ctx.group_id)
-    player = ensure_player(ctx.user_id)
-    messages: list[str] = []
-    count = 1
-    copied_args = copy(remain_args)
     try:
-        while count > 0:
-            res = game.use_item(player, item_id, force, copied_args)
-            messages.append(res['message'])
-            if res['code'] != 0:
-                break
-            if len(copied_args) == 1 and getattr(FishItem.get(item_id), 'batch_use', False):
-                try:
-                    count = int(copied_args[0]) - 1
-                except ValueError:
-                    break
-                copied_args = copy(remain_args)
-                if copied_args:
-                    copied_args[-1] = str(count)
-                if count <= 0:
-                    break
-            else:
-                count -= 1
+        messages = await submit_in_game(
+            ctx, lambda game: use_item_in_game(game, ctx.user_id, item_id, force, remain_args))
+        if messages is None:
+            return
         if not messages:
             await reply_text(ctx, "没有可执行的效果").send()
             return
@@ -734,8 +960,7 @@ async def _(ctx: RealContext = Depends(get_real_context), msg: Message = EventMe
     game = ensure_game(ctx.group_id)
     bot = get_bot(str(get_driver().config.private_bot))
     try:
-        qq_list = await bot.get_group_member_list(group_id=ctx.group_id)
-        member_ids = [str(qq['user_id']) for qq in qq_list]
+        member_ids = [str(qq) for qq in await group_cache.member_ids(bot, ctx.group_id)]
     except Exception as exc:
         logger.warning("Failed to fetch member list for group %s: %s", ctx.group_id, exc)
         member_ids = [str(ctx.user_id)]
@@ -775,10 +1000,11 @@ refresh_counts = on_command('饿鱼')
 async def _(ctx: RealContext = Depends(get_real_context)):
     if str(ctx.user_id) not in get_driver().config.superusers:
         return
-    game = ensure_game(ctx.group_id)
-    game.data['feed_time'] = 0
-    game.save()
-    await reply_text(ctx, "已重置投放食料的计数").send()
+    def reset(game: FishGame) -> bool:
+        game.data['feed_time'] = 0
+        return True
+    if await submit_in_game(ctx, reset) is not None:
+        await reply_text(ctx, "已重置投放食料的计数").send()
 
 
 bind_game_cmd = on_command('绑定捕鱼游戏', rule=official_hybrid)
@@ -817,7 +1043,7 @@ async def _(ctx: RealContext = Depends(get_real_context), message: Message = Com
         return
 
     try:
-        changed, primary = _binding_store.bind_group(ctx.group_id, target_group)
+        changed, primary = _binding_store().bind_group(ctx.group_id, target_group)
     except Exception:
         logger.exception("Failed to bind fishgame group", exc_info=True)
         await reply_text(ctx, "绑定失败，请稍后再试").send()
@@ -842,7 +1068,7 @@ async def _(ctx: RealContext = Depends(get_real_context)):
     if not await is_group_admin(ctx):
         await reply_text(ctx, "只有群管理员可以解除绑定").send()
         return
-    changed, primary = _binding_store.unbind_group(ctx.group_id)
+    changed, primary = _binding_store().unbind_group(ctx.group_id)
     if not changed:
         if resolve_game_group_id(ctx.group_id) == ctx.group_id:
             await reply_text(ctx, "本群当前不是副群聊").send()
@@ -868,8 +1094,10 @@ async def _(ctx: RealContext = Depends(get_real_context), message: Message = Com
         await reply_text(ctx, "群号必须是数字").send()
         return
     fish_id = args[1]
-    game = ensure_game(group)
-    fish = game.force_spawn_fish(fish_id)
+    spawned = await submit_in_game(ctx, lambda game: (game.force_spawn_fish(fish_id), game), group)
+    if spawned is None:
+        return
+    fish, game = spawned
     if fish is not None:
         if fish.rarity == 'UR':
             spawn_msg = f"{fish.name}【{fish.rarity}】 █████！\n使用【████】指███████获████！"
@@ -898,9 +1126,13 @@ async def _(ctx: RealContext = Depends(get_real_context), message: Message = Com
     except ValueError:
         await reply_text(ctx, "请输入群号").send()
         return
-    game = ensure_game(group)
-    game.trigger_fever()
-    minute = int((game.data['fever_expire'] - time.time()) // 60)
+    def force(game: FishGame) -> float:
+        game.trigger_fever()
+        return game.data['fever_expire']
+    fever_expire = await submit_in_game(ctx, force, group)
+    if fever_expire is None:
+        return
+    minute = int((fever_expire - time.time()) // 60)
     await get_bot(str(get_driver().config.private_bot)).send_msg(
         message_type="group",
         group_id=group,
@@ -919,8 +1151,11 @@ async def _(ctx: RealContext = Depends(get_real_context), message: Message = Com
     except ValueError:
         await reply_text(ctx, "请输入群号").send()
         return
-    game = ensure_game(group)
-    game.unlock_all()
+    def unlock(game: FishGame) -> bool:
+        game.unlock_all()
+        return True
+    if await submit_in_game(ctx, unlock, group) is None:
+        return
     await get_bot(str(get_driver().config.private_bot)).send_msg(
         message_type="group",
         group_id=group,
@@ -993,17 +1228,71 @@ async def _(ctx: RealContext = Depends(get_real_context), message: Message = Com
         await reply_text(ctx, "等级必须是数字").send()
         return
 
-    game = ensure_game(ctx.group_id)
     attr = building_name_map.get(building_name)
-    if not attr or not hasattr(game, attr):
+
+    def set_level(game: FishGame) -> bool:
+        if not attr or not hasattr(game, attr):
+            return False
+        building: BuildingBase = getattr(game, attr)
+        building.level = level
+        return True
+    found = await submit_in_game(ctx, set_level)
+    if found is None:
+        return
+    if not found:
         await reply_text(ctx, "未找到对应建筑").send()
         return
-    building: BuildingBase = getattr(game, attr)
-    building.level = level
-    game.save()
     await reply_text(ctx, f"已将 {building_name} 的等级设置为 {level}").send()
 
 
+migrate_storage = on_command('迁移捕鱼存储')
+@migrate_storage.handle()
+async def _(ctx: RealContext = Depends(get_real_context)):
+    if str(ctx.user_id) not in get_driver().config.superusers:
+        return
+    # 把旧的整块 JSON 玩家/群数据转换为按字段存储的 hash，在线程里执行避免阻塞事件循环
+    flush_write_behind()
+    players = await asyncio.to_thread(migrate_to_hash, 'fishgame_user_data_*')
+    groups = await asyncio.to_thread(migrate_to_hash, 'fishgame_group_data_*')
+    await reply_text(ctx, f"已迁移 {players} 个玩家、{groups} 个群的捕鱼数据").send()
+
+
+def _archive_days() -> int:
+    # 可在 .env 中用 FISHGAME_ARCHIVE_DAYS 配置
+    return int(getattr(get_driver().config, 'fishgame_archive_days', 90))
+
+
+# 不活跃玩家归档 (每天凌晨)，归档后再次访问时自动恢复
+@scheduler.scheduled_job("cron", hour=4, minute=30)
+async def archive_inactive_players():
+    flush_write_behind()
+    count = await asyncio.to_thread(FishPlayer.archive_inactive, _archive_days())
+    logger.info("Archived %s inactive fishgame players", count)
+    await asyncio.to_thread(FishPlayer.trim_power_index)
+    logger.info("Compression stats: %s", compression_stats.summary())
+
+
+archive_players = on_command('归档捕鱼玩家')
+@archive_players.handle()
+async def _(ctx: RealContext = Depends(get_real_context), message: Message = CommandArg()):
+    if str(ctx.user_id) not in get_driver().config.superusers:
+        return
+    args = str(message).strip()
+    days = int(args) if args.isdigit() else _archive_days()
+    flush_write_behind()
+    count = await asyncio.to_thread(FishPlayer.archive_inactive, days)
+    await reply_text(ctx, f"已归档 {count} 个超过 {days} 天未活动的玩家").send()
+
+
+compression_report = on_command('压缩统计')
+@compression_report.handle()
+async def _(ctx: RealContext = Depends(get_real_context)):
+    if str(ctx.user_id) not in get_driver().config.superusers:
+        return
+    # 本进程启动以来的累计值，用来判断压缩节省的空间是否值得花费的 CPU 时间
+    await reply_text(ctx, compression_stats.summary()).send()
+
+
 craft = on_command('合成', rule=official_hybrid)
 
 @craft.handle()
@@ -1112,7 +1401,6 @@ buildings = on_command('建筑', rule=official_hybrid)
 @buildings.handle()
 async def _(ctx: RealContext = Depends(get_real_context), message: Message = CommandArg()):
     game = ensure_game(ctx.group_id)
-    player = ensure_player(ctx.user_id)
     content = str(message).strip()
     if not content:
         buildings_panel = create_buildings_panel(game)
@@ -1124,16 +1412,18 @@ async def _(ctx: RealContext = Depends(get_real_context), message: Message = Com
         return
     building_name, material = args
     if material == '升级':
-        ret = game.building_level_up(building_name)
-        await reply_text(ctx, ret['message']).send()
+        ret = await submit_in_game(ctx, lambda game: game.building_level_up(building_name))
+        if ret is not None:
+            await reply_text(ctx, ret['message']).send()
         return
     try:
         item_id = int(material)
     except ValueError:
         await reply_text(ctx, "参数格式错误，使用格式：建筑 <建筑名称> <材料编号>").send()
         return
-    ret = game.build(player, building_name, item_id)
-    await reply_text(ctx, ret['message']).send()
+    ret = await submit_in_game(ctx, lambda game: game.build(ensure_player(ctx.user_id), building_name, item_id))
+    if ret is not None:
+        await reply_text(ctx, ret['message']).send()
 
 # ---------------- Port Commands ----------------
 port_cmd = on_command('港口', rule=official_hybrid)
@@ -1161,36 +1451,40 @@ async def _(ctx: RealContext = Depends(get_real_context), message: Message = Com
         await reply_image(ctx, panel_img).send()
     elif cmd == '组队':
         nickname = await get_member_display_name(ctx.group_id, ctx.user_id, player)
-        res = game.join_oversea(player, nickname)
-        await reply_text(ctx, res['message']).send()
+        res = await submit_in_game(ctx, lambda game: game.join_oversea(ensure_player(ctx.user_id), nickname))
+        if res is not None:
+            await reply_text(ctx, res['message']).send()
     elif cmd == '退出':
-        res = game.leave_oversea(player)
-        await reply_text(ctx, res['message']).send()
+        res = await submit_in_game(ctx, lambda game: game.leave_oversea(ensure_player(ctx.user_id)))
+        if res is not None:
+            await reply_text(ctx, res['message']).send()
     elif cmd == '物品':
         if len(args) < 2:
             await reply_text(ctx, "请输入物品ID").send()
             return
-        res = game.equip_oversea_item(player, args[1])
-        await reply_text(ctx, res['message']).send()
+        res = await submit_in_game(ctx, lambda game: game.equip_oversea_item(ensure_player(ctx.user_id), args[1]))
+        if res is not None:
+            await reply_text(ctx, res['message']).send()
     elif cmd == '开始战斗':
-        res = game.start_oversea_battle()
-        await reply_text(ctx, res['message']).send()
+        res = await submit_in_game(ctx, lambda game: game.start_oversea_battle())
+        if res is not None:
+            await reply_text(ctx, res['message']).send()
     elif cmd == '刷新' and str(ctx.user_id) in get_driver().config.superusers:
-        game.spawn_oversea_monster()
-        await reply_text(ctx, "已强制刷新港口怪物").send()
+        if await submit_in_game(ctx, lambda game: game.spawn_oversea_monster()) is not None:
+            await reply_text(ctx, "已强制刷新港口怪物").send()
     elif cmd == '推进' and str(ctx.user_id) in get_driver().config.superusers:
-        res = game.process_oversea_turn()
-        if res:
-            await reply_text(ctx, f"已强制推进回合: {res['message']}").send()
-        else:
-            await reply_text(ctx, "无法推进回合（可能未开始战斗）").send()
+        def advance(game: FishGame) -> str:
+            res = game.process_oversea_turn()
+            return f"已强制推进回合: {res['message']}" if res else "无法推进回合（可能未开始战斗）"
+        msg = await submit_in_game(ctx, advance)
+        if msg is not None:
+            await reply_text(ctx, msg).send()
 
 pot = on_command('大锅', rule=official_hybrid)
 
 @pot.handle()
 async def _(ctx: RealContext = Depends(get_real_context), message: Message = CommandArg()):
     game = ensure_game(ctx.group_id)
-    player = ensure_player(ctx.user_id)
 
     if game.big_pot.level == 0:
         await reply_text(ctx, '还没有建造大锅哦……').send()
@@ -1218,8 +1512,9 @@ async def _(ctx: RealContext = Depends(get_real_context), message: Message = Com
                 count = int(args[2])
             except ValueError:
                 pass
-        ret = game.pot_add_item(player, item, count)
-        await reply_text(ctx, ret['message']).send()
+        ret = await submit_in_game(ctx, lambda game: game.pot_add_item(ensure_player(ctx.user_id), item, count))
+        if ret is not None:
+            await reply_text(ctx, ret['message']).send()
     else:
         ret = game.get_pot_status()
         msg = reply_text(ctx, ret) + UniMessage.text('\nUsage：大锅 添加 <物品ID> [数量]')
@@ -1232,10 +1527,9 @@ sign_in_cmd = on_command('签到', rule=official_hybrid)
 async def _(ctx: RealContext = Depends(get_real_context), message: Message = EventMessage()):
     if normalize_event_text(message) != '签到':
         return
-    game = ensure_game(ctx.group_id)
-    player = ensure_player(ctx.user_id)
-    res = game.sign_in(player)
-    await reply_text(ctx, res['message']).send()
+    res = await submit_in_game(ctx, lambda game: game.sign_in(ensure_player(ctx.user_id)))
+    if res is not None:
+        await reply_text(ctx, res['message']).send()
 
 # 天赋面板
 talent_cmd = on_command('天赋', rule=official_hybrid)
@@ -21,6 +21,7 @@ import random
 import asyncio
 
 from src.data_access.plugin_manager import plugin_manager
+from src.data_access.local_cache import local_cache
 
 
 def is_channel_message(event: Event):
@@ -126,6 +127,24 @@ async def _(bot: Bot, event: Event, state: T_State):
     ]))
 
 
+async def _rebuild_plugin_index(bot: Bot) -> tuple[int, int]:
+    """用 bot 所在的群和官方 bot 的群映射重建插件启用索引，返回 (检查的群数, 有插件设置的群数)"""
+    candidates = [group['group_id'] for group in await bot.get_group_list()]
+    candidates += DictRedisData('open_helper_group_map').data.values()
+    found = await asyncio.to_thread(plugin_manager.backfill_groups, candidates)
+    return len(set(map(str, candidates))), found
+
+
+# 连接时重建一次，定时任务按索引找启用插件的群，不再逐个群检查
+@get_driver().on_bot_connect
+async def _(bot: Bot):
+    try:
+        checked, found = await _rebuild_plugin_index(bot)
+        logger.info("Plugin index rebuilt: %s groups checked, %s with settings", checked, found)
+    except Exception as exc:
+        logger.warning("Failed to rebuild plugin index: %s", exc)
+
+
 plugin_manage = on_command("插件管理")
 
 
@@ -138,7 +157,10 @@ async def _(bot: Bot, event: Event, message: Message = CommandArg()):
         argv = str(message).strip()
         args = argv.split(' ')
         if argv == "":
-            await plugin_manage.send("用法：插件管理 <群号> 或 插件管理 <群号> 启用/禁用 [插件名]")
+            await plugin_manage.send("用法：插件管理 <群号> 或 插件管理 <群号> 启用/禁用 [插件名] 或 插件管理 重建索引")
+        elif argv == "重建索引":
+            checked, found = await _rebuild_plugin_index(bot)
+            await plugin_manage.send(f"索引重建完成，共检查 {checked} 个群，其中 {found} 个群有插件设置")
         else:
             group_id = int(args[0])
             if len(args) == 1:
@@ -350,6 +372,7 @@ async def _(event: GroupAtMessageCreateEvent, message: BaseMessage = CommandArg(
         return
     data.data[event.group_openid] = int(str(message))
     data.save()
+    local_cache.invalidate('open_helper_group_map')
     await bind_open_group.send("绑定成功")
 
 
@@ -376,5 +399,6 @@ async def _(event: Event, message: Message = EventMessage()):
         user_map_data = DictRedisData('open_helper_user_map')
         user_map_data.data[openid] = int(str(event.user_id))
         user_map_data.save()
+        local_cache.invalidate('open_helper_user_map')
         temp_data.delete()
         await bind_open_user_check.send("绑定成功！")
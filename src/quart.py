@@ -1,6 +1,8 @@
 from nonebot import get_driver
 import asyncio
 from src.routes.app import quart_app
+from src.data_access.redis import close_redis_async, flush_write_behind
+from src.data_access.local_cache import local_cache
 import importlib
 import os
 
@@ -23,10 +25,12 @@ if os.path.exists(private_routes_dir):
 quart_task = None
 
 async def startup():
-    pass
+    local_cache.start()
 
 async def shutdown():
-    pass
+    await local_cache.stop()
+    flush_write_behind()
+    await close_redis_async()
 
 get_driver().on_startup(startup)
 get_driver().on_shutdown(shutdown)
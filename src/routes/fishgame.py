@@ -1,33 +1,36 @@
 from pathlib import Path
+import asyncio
 import json
 import time
 from collections import Counter
 from quart import jsonify, request, send_file, websocket
 
 from src.routes.app import quart_app
-from src.data_access.redis import DictRedisData
+from src.data_access.redis import AsyncDictRedisData, Compression
 from src.libraries.fishgame.player import FishPlayer
-from src.libraries.fishgame.data import Fish, fish_item, FishItem, fish_skills
+from src.libraries.fishgame.data import Fish, FishItem, fish_skills
+from src.libraries.fishgame.catalog import catalog
 from src.libraries.fishgame.buildings import building_name_map
-from src.libraries.fishgame.runtime import ensure_game
+from src.libraries.fishgame.runtime import ensure_game, submit, GameBusy, GameConflict
 from src.libraries.fishgame.oversea import battle_buffs
 from nonebot.log import logger
 
 
-class WsMessageStore(DictRedisData):
+class WsMessageStore(AsyncDictRedisData):
     """Fixed-size Redis-backed buffer for websocket broadcast messages."""
 
     MAX_MESSAGES = 500
+    compression = Compression()
 
     def __init__(self, game_id: str):
         super().__init__(f"fishgame_ws_msg_store:{game_id}", default={"messages": []})
 
-    def record(self, payload: dict):
+    async def record(self, payload: dict):
         messages = self.data.setdefault("messages", [])
         messages.append(dict(payload))
         if len(messages) > self.MAX_MESSAGES:
             del messages[:-self.MAX_MESSAGES]
-        self.save()
+        await self.save()
 
     def tail(self, limit: int = 200) -> list[dict]:
         messages = self.data.get("messages", [])
@@ -41,6 +44,8 @@ FISH_TEMPLATE = TEMPLATE_DIR / "fishgame.html"
 
 # In-memory registry of websocket connections by game id
 _GROUP_CONNECTIONS: dict[str, set] = {}
+# Serializes load + save of the message buffer per game; concurrent broadcasts would drop messages
+_WS_STORE_LOCKS: dict[str, asyncio.Lock] = {}
 
 _BUILDING_KEYS = [
     "big_pot",
@@ -70,18 +75,19 @@ _DRAW_TYPE_FLAGS = {
 _PORT_LOADOUT_ITEM_IDS = list(range(33, 41)) + [49, 310]
 
 
-def _persist_ws_payload(game_id: str, payload: dict):
+async def _persist_ws_payload(game_id: str, payload: dict):
     try:
-        store = WsMessageStore(game_id)
-        store.record(payload)
+        async with _WS_STORE_LOCKS.setdefault(game_id, asyncio.Lock()):
+            store = await WsMessageStore(game_id).load()
+            await store.record(payload)
     except Exception:
         logger.exception("Failed to persist websocket payload for game %s", game_id)
 
 
-def _prepare_ws_payload(game_id: str, message: dict) -> dict:
+async def _prepare_ws_payload(game_id: str, message: dict) -> dict:
     payload = dict(message)
     payload.setdefault("pushedAt", int(time.time()))
-    _persist_ws_payload(game_id, payload)
+    await _persist_ws_payload(game_id, payload)
     return payload
 
 
@@ -284,7 +290,7 @@ def _build_pool_snapshot(game_obj) -> dict:
         "feverRemaining": fever_remaining,
         "glowBuffs": glow_info,
         "rarityBuffs": rarity_buffs,
-        "fishLogCount": len(game_obj.data.get("fish_log", [])),
+        "fishLogCount": len(game_obj.fish_log),
         "powerBoostFromPot": game_obj.big_pot.power_boost,
         "averagePowerBoostFromPot": game_obj.big_pot.average_power_boost,
         "lastUpdated": int(now),
@@ -336,10 +342,11 @@ def _build_battle_snapshot(game_obj, player: FishPlayer) -> dict | None:
     loadouts = {str(k): v for k, v in data.get("loadouts", {}).items()}
     players_payload = []
     self_loadout_id = None
+    members = FishPlayer.load_many(str(member) for member in data.get("players", []))
     for idx, member in enumerate(data.get("players", [])):
         qq_str = str(member)
         try:
-            member_player = FishPlayer(qq_str)
+            member_player = members.get(qq_str) or FishPlayer(qq_str)
             display_name = data.get("player_names", {}).get(qq_str) or member_player.name or qq_str
         except Exception:
             display_name = data.get("player_names", {}).get(qq_str) or qq_str
@@ -470,10 +477,20 @@ def _json_error(message: str, status: int = 400):
     return jsonify({"code": status, "message": message}), status
 
 
+async def _submit_in_game(game: str, fn):
+    """把会修改群数据的操作交给游戏的 actor，在租约内执行并写回；返回 (结果, None) 或 (None, 错误响应)"""
+    try:
+        return await submit(game, fn), None
+    except GameBusy:
+        return None, _json_error("操作的人太多了，请稍后再试", status=503)
+    except GameConflict:
+        return None, _json_error("群数据同时被其他地方修改，本次操作对群的改动没有生效，请重试", status=409)
+
+
 async def _broadcast(game_id: str, message: dict):
     """Broadcast a JSON message to all connected websockets in the game group."""
     conns = _GROUP_CONNECTIONS.get(game_id, set()).copy()
-    payload = _prepare_ws_payload(game_id, message)
+    payload = await _prepare_ws_payload(game_id, message)
     body = json.dumps(payload)
     for ws in list(conns):
         try:
@@ -560,10 +577,8 @@ async def fishgame_sign_in():
     if not game or not user:
         return _json_error("缺少 game 或 user")
 
-    game_obj = ensure_game(game)
-    player = FishPlayer(user)
-    res = game_obj.sign_in(player)
-    return jsonify(res)
+    res, error = await _submit_in_game(game, lambda game_obj: game_obj.sign_in(FishPlayer(user)))
+    return error or jsonify(res)
 
 
 @quart_app.route("/fishgame/api/catch", methods=["POST"])
@@ -575,11 +590,21 @@ async def fishgame_catch_attempt():
     if not game or not user:
         return _json_error("game 与 user 为必填")
 
+    def attempt(game_obj):
+        # 玩家在 actor 里加载，排队期间其他请求对玩家的修改不会被这次保存覆盖
+        player = FishPlayer(user)
+        fish_before = game_obj.current_fish.data if game_obj.current_fish else None
+        res = game_obj.catch_fish(player, master_ball)
+        return player, fish_before, res, game_obj.current_fish is not None
+
+    try:
+        # 交给游戏的 actor 依次结算，同时到达的捕鱼合并为一批
+        player, fish_before, res, fish_still = await submit(game, attempt)
+    except GameBusy:
+        return _json_error("捕鱼的人太多了，请稍后再试")
+    except GameConflict:
+        return _json_error("群数据同时被其他地方修改，本次捕鱼对群的改动没有生效，请重试", status=409)
     game_obj = ensure_game(game)
-    player = FishPlayer(user)
-    fish_before = game_obj.current_fish.data if game_obj.current_fish else None
-    res = game_obj.catch_fish(player, master_ball)
-    fish_still = game_obj.current_fish is not None
 
     if fish_before:
         display = player.name or user
@@ -605,7 +630,7 @@ async def fishgame_catch_attempt():
 @quart_app.route("/fishgame/api/shop/list", methods=["GET"])
 async def fishgame_shop_list():
     # Return buyable items
-    items = [it.data for it in fish_item.values() if it.buyable]
+    items = [it.data for it in catalog.buyable_items]
     return jsonify({"code": 0, "items": items})
 
 
@@ -663,10 +688,8 @@ async def fishgame_pot_add():
     if not item:
         return _json_error("未找到该物品", status=404)
 
-    game_obj = ensure_game(game)
-    player = FishPlayer(user)
-    res = game_obj.pot_add_item(player, item, count)
-    return jsonify(res)
+    res, error = await _submit_in_game(game, lambda game_obj: game_obj.pot_add_item(FishPlayer(user), item, count))
+    return error or jsonify(res)
 
 
 @quart_app.route("/fishgame/api/buildings/add", methods=["POST"])
@@ -684,10 +707,8 @@ async def fishgame_building_add():
         if building_name not in building_name_map:
             return _json_error("未知的建筑")
 
-    game_obj = ensure_game(game)
-    player = FishPlayer(user)
-    res = game_obj.build(player, building_name, item_id)
-    return jsonify(res)
+    res, error = await _submit_in_game(game, lambda game_obj: game_obj.build(FishPlayer(user), building_name, item_id))
+    return error or jsonify(res)
 
 
 @quart_app.route("/fishgame/api/buildings/upgrade", methods=["POST"])
@@ -703,9 +724,8 @@ async def fishgame_building_upgrade():
         if building_name not in building_name_map:
             return _json_error("未知的建筑")
 
-    game_obj = ensure_game(game)
-    res = game_obj.building_level_up(building_name)
-    return jsonify(res)
+    res, error = await _submit_in_game(game, lambda game_obj: game_obj.building_level_up(building_name))
+    return error or jsonify(res)
 
 
 @quart_app.route("/fishgame/api/skills", methods=["GET"])
@@ -745,10 +765,9 @@ async def fishgame_use_item():
         extra_args = [raw_params]
     else:
         extra_args = []
-    game_obj = ensure_game(game)
-    player = FishPlayer(user)
-    res = game_obj.use_item(player, item_id, force, extra_args)
-    return jsonify(res)
+    res, error = await _submit_in_game(
+        game, lambda game_obj: game_obj.use_item(FishPlayer(user), item_id, force, extra_args))
+    return error or jsonify(res)
 
 
 @quart_app.route("/fishgame/api/gacha/draw", methods=["POST"])
@@ -836,12 +855,16 @@ async def fishgame_port_join():
     nickname = str((payload or {}).get("nickname", "")).strip()
     if not game or not user:
         return _json_error("缺少 game 或 user")
-    game_obj = ensure_game(game)
-    player = FishPlayer(user)
-    display_name = nickname or player.name or user
-    res = game_obj.join_oversea(player, display_name)
+
+    def join(game_obj):
+        player = FishPlayer(user)
+        return game_obj.join_oversea(player, nickname or player.name or user)
+
+    res, error = await _submit_in_game(game, join)
+    if error:
+        return error
     if res.get("code") == 0:
-        await _broadcast_oversea_update(game, game_obj)
+        await _broadcast_oversea_update(game, ensure_game(game))
     return jsonify(res)
 
 
@@ -852,11 +875,11 @@ async def fishgame_port_leave():
     user = str((payload or {}).get("user", "")).strip()
     if not game or not user:
         return _json_error("缺少 game 或 user")
-    game_obj = ensure_game(game)
-    player = FishPlayer(user)
-    res = game_obj.leave_oversea(player)
+    res, error = await _submit_in_game(game, lambda game_obj: game_obj.leave_oversea(FishPlayer(user)))
+    if error:
+        return error
     if res.get("code") == 0:
-        await _broadcast_oversea_update(game, game_obj)
+        await _broadcast_oversea_update(game, ensure_game(game))
     return jsonify(res)
 
 
@@ -872,11 +895,11 @@ async def fishgame_port_equip():
         item_id = 0
     if not game or not user or item_id <= 0:
         return _json_error("缺少 game、user 或 item_id")
-    game_obj = ensure_game(game)
-    player = FishPlayer(user)
-    res = game_obj.equip_oversea_item(player, item_id)
+    res, error = await _submit_in_game(game, lambda game_obj: game_obj.equip_oversea_item(FishPlayer(user), item_id))
+    if error:
+        return error
     if res.get("code") == 0:
-        await _broadcast_oversea_update(game, game_obj)
+        await _broadcast_oversea_update(game, ensure_game(game))
     return jsonify(res)
 
 
@@ -887,10 +910,11 @@ async def fishgame_port_start():
     user = str((payload or {}).get("user", "")).strip()
     if not game or not user:
         return _json_error("缺少 game 或 user")
-    game_obj = ensure_game(game)
-    res = game_obj.start_oversea_battle()
+    res, error = await _submit_in_game(game, lambda game_obj: game_obj.start_oversea_battle())
+    if error:
+        return error
     if res.get("code") == 0:
-        await _broadcast_oversea_update(game, game_obj)
+        await _broadcast_oversea_update(game, ensure_game(game))
     return jsonify(res)
 
 
@@ -911,7 +935,7 @@ async def fishgame_ws():
             return
 
         try:
-            history_messages = WsMessageStore(game).tail(200)
+            history_messages = (await WsMessageStore(game).load()).tail(200)
         except Exception:
             logger.exception("Failed to load websocket history for game %s", game)
             history_messages = []